@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+"""
+Benchmark of the download pipeline against a fake Telegram client.
+
+The whole `main.main` -> `RCD.download_media` pipeline runs over synthetic
+channels, without network. Any argument after `--` is passed to rcdtool.
+
+Examples:
+    python benchmarks/bench_pipeline.py --messages 5000 --latency 0.02
+    python benchmarks/bench_pipeline.py --media-size 20000000 --bandwidth 5e6 -- --parts 8
+    python benchmarks/bench_pipeline.py --flood-limit 8 --json -- --concurrency 16
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import collections
+import statistics
+from typing import Optional
+
+from rcdtool import main
+from rcdtool.rcdtool import RCD
+from simulator import FakeTelegramClient
+
+
+def get_args(argv: list[str]):
+    """Parse the benchmark arguments.
+
+    Args:
+        argv (list[str]): The arguments, before `--`.
+
+    Returns:
+        Namespace: Parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark rcdtool against a fake Telegram client')
+    parser.add_argument('--messages', type=int, default=1000, help='Messages of the range')
+    parser.add_argument('--media-every', type=int, default=1, help='One of each N messages has media')
+    parser.add_argument('--media-size', type=int, default=100 * 1024, help='Max media size in bytes')
+    parser.add_argument('--min-media-size', type=int, default=None, help='Min media size in bytes')
+    parser.add_argument('--latency', type=float, default=0.01, help='Seconds per request')
+    parser.add_argument('--bandwidth', type=float, default=None, help='Bytes per second of each DC')
+    parser.add_argument('--dcs', type=int, default=1, help='Number of DCs')
+    parser.add_argument('--dc-latency', type=float, default=0.0, help='Extra seconds per request to other DCs')
+    parser.add_argument('--flood-limit', type=int, default=None, help='Requests at the same time before a FloodWait')
+    parser.add_argument('--flood-seconds', type=int, default=0, help='Seconds of each FloodWait')
+    parser.add_argument('--channels', type=int, default=1, help='Number of channels, as links')
+    parser.add_argument('--album-size', type=int, default=1, help='Messages of each album')
+    parser.add_argument('--paid-items', type=int, default=0, help='Make the media paid, with this number of items')
+    parser.add_argument('--accounts', type=int, default=1, help='Number of accounts, each with its own limits')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    return parser.parse_args(argv)
+
+
+def get_peak_rss() -> Optional[int]:
+    """Get the peak resident memory of the process.
+
+    Returns:
+        Optional[int]: The peak RSS in bytes, None if it is not available.
+    """
+    try:
+        import resource  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """Get a percentile of the values.
+
+    Args:
+        values (list[float]): The values.
+        percent (float): The percentile, from 0 to 100.
+
+    Returns:
+        float: The value of the percentile, 0 if there are no values.
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def run(args, rcdtool_args: list[str]) -> dict:
+    """Run the pipeline and measure it.
+
+    Args:
+        args (Namespace): The benchmark arguments.
+        rcdtool_args (list[str]): The extra rcdtool arguments.
+
+    Returns:
+        dict: The report.
+    """
+    media_size = (
+        (args.min_media_size, args.media_size)
+        if args.min_media_size is not None
+        else args.media_size
+    )
+    sections = ['Access'] + [f'Access.{account}' for account in range(1, args.accounts)]
+    clients = {
+        section: FakeTelegramClient(
+            messages=args.messages,
+            media_every=args.media_every,
+            media_size=media_size,
+            latency=args.latency,
+            bandwidth=args.bandwidth,
+            dcs=args.dcs,
+            dc_latency=args.dc_latency,
+            flood_limit=args.flood_limit,
+            flood_seconds=args.flood_seconds,
+            album_size=args.album_size,
+            paid_items=args.paid_items,
+        )
+        for section in sections
+    }
+    RCD.create_client = lambda self, section='Access': clients[section]
+
+    latencies: list[float] = []
+    download_media = RCD.download_media
+
+    async def timed_download_media(self, *download_args, **download_kwargs):
+        start = time.monotonic()
+        try:
+            return await download_media(self, *download_args, **download_kwargs)
+        finally:
+            latencies.append(time.monotonic() - start)
+
+    RCD.download_media = timed_download_media
+
+    with tempfile.TemporaryDirectory() as directory:
+        config_filename = os.path.join(directory, 'config.ini')
+        with open(config_filename, 'w', encoding='utf-8') as file:
+            for section in sections:
+                file.write(f'[{section}]\nsession = bench\nid = 1\nhash = bench\n')
+
+        links = ';'.join(
+            f'https://t.me/c/{1000 + channel}/1..{args.messages}'
+            for channel in range(args.channels)
+        )
+        sys.argv = [
+            'rcdtool',
+            '-c', config_filename,
+            '--link', links,
+            '-O', os.path.join(directory, 'file'),
+            *rcdtool_args,
+        ]
+
+        stdout = sys.stdout
+        start = time.monotonic()
+        try:
+            sys.stdout = open(os.devnull, 'w', encoding='utf-8')
+            main.main()
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        elapsed = time.monotonic() - start
+
+        total_bytes = sum(
+            os.path.getsize(os.path.join(directory, name))
+            for name in os.listdir(directory)
+            if name.startswith('file')
+        )
+
+    messages = args.messages * args.channels
+    return {
+        'messages': messages,
+        'downloads': len(latencies),
+        'seconds': elapsed,
+        'messages_per_second': messages / elapsed,
+        'bytes': total_bytes,
+        'bytes_per_second': total_bytes / elapsed,
+        'peak_rss': get_peak_rss(),
+        'latency_p50': percentile(latencies, 50),
+        'latency_p95': percentile(latencies, 95),
+        'latency_p99': percentile(latencies, 99),
+        'latency_max': max(latencies, default=0.0),
+        'latency_mean': statistics.mean(latencies) if latencies else 0.0,
+        'requests': dict(sum((client.requests for client in clients.values()), collections.Counter())),
+        'flood_waits': sum(client.flood_waits for client in clients.values()),
+    }
+
+
+def main_bench():
+    """Run the benchmark and print the report."""
+    argv = sys.argv[1:]
+    rcdtool_args: list[str] = []
+    if '--' in argv:
+        index = argv.index('--')
+        argv, rcdtool_args = argv[:index], argv[index + 1:]
+    args = get_args(argv)
+
+    report = run(args, rcdtool_args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"messages:     {report['messages']} ({report['downloads']} downloads)")
+    print(f"time:         {report['seconds']:.3f} s")
+    print(f"messages/s:   {report['messages_per_second']:.1f}")
+    print(f"MB/s:         {report['bytes_per_second'] / 1e6:.2f} ({report['bytes'] / 1e6:.1f} MB)")
+    if report['peak_rss'] is not None:
+        print(f"peak RSS:     {report['peak_rss'] / 1e6:.1f} MB")
+    print(f"latency p50:  {report['latency_p50'] * 1000:.1f} ms")
+    print(f"latency p95:  {report['latency_p95'] * 1000:.1f} ms")
+    print(f"latency p99:  {report['latency_p99'] * 1000:.1f} ms")
+    print(f"requests:     {report['requests']}")
+    print(f"flood waits:  {report['flood_waits']}")
+
+
+if __name__ == '__main__':
+    main_bench()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+"""
+Benchmark of the startup time of rcdtool.
+
+Each case runs in a new Python process, several times, and the median wall
+time is reported. With `--max-seconds`, the exit code is 1 if a case is
+slower, so CI can track it.
+
+Examples:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 20 --json
+    python benchmarks/bench_startup.py --max-seconds 0.3
+"""
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+
+# The code that runs the CLI with the arguments of the process
+RUN_MAIN = 'import sys; sys.argv[0] = "rcdtool"; from rcdtool import main; main.main()'
+
+CASES = {
+    'python': ['-c', 'pass'],
+    'import': ['-c', 'import rcdtool.main'],
+    'help': ['-c', RUN_MAIN, '--help'],
+    'argument error': ['-c', RUN_MAIN, '--parts', 'many'],
+    'missing config': ['-c', RUN_MAIN, '-c', 'missing.ini', '-C', '1234', '-M', '1'],
+}
+
+
+def get_args():
+    """Parse the benchmark arguments.
+
+    Returns:
+        Namespace: Parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the startup time of rcdtool')
+    parser.add_argument('--runs', type=int, default=10, help='Runs of each case')
+    parser.add_argument('--max-seconds', type=float, default=None, help='Fail if a case takes more seconds, besides Python itself')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    return parser.parse_args()
+
+
+def measure(arguments: list[str], runs: int) -> list[float]:
+    """Run a Python process several times.
+
+    Args:
+        arguments (list[str]): The arguments of the Python interpreter.
+        runs (int): The number of runs.
+
+    Returns:
+        list[float]: The wall time of each run in seconds.
+    """
+    times: list[float] = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, *arguments],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=False,
+        )
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main_bench():
+    """Run the benchmark and print the report."""
+    args = get_args()
+
+    report = {}
+    for name, arguments in CASES.items():
+        times = measure(arguments, args.runs)
+        report[name] = {
+            'median': statistics.median(times),
+            'min': min(times),
+            'max': max(times),
+        }
+
+    # the time of the interpreter itself is not ours
+    baseline = report['python']['median']
+    slow = [
+        name
+        for name, result in report.items()
+        if args.max_seconds is not None and result['median'] - baseline > args.max_seconds
+    ]
+
+    if args.json:
+        print(json.dumps({'cases': report, 'slow': slow}, indent=2))
+    else:
+        for name, result in report.items():
+            print(f"{name + ':':16} {result['median'] * 1000:7.1f} ms (min {result['min'] * 1000:.1f} ms)")
+        for name in slow:
+            print(f'{name} takes more than {args.max_seconds} s besides Python')
+
+    if slow:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main_bench()
@@ -0,0 +1,555 @@
+#!/usr/bin/env python
+
+# MIT License
+#
+# Copyright (c) 2025 David256
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Fake Telegram services to test and tune the downloads without network
+"""
+import time
+import zlib
+import random
+import asyncio
+import collections
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Callable, Collection, Optional, Union
+
+from telethon import errors, events, functions
+import telethon.types as tg_types
+
+
+def flood_wait_error(seconds: int) -> errors.FloodWaitError:
+    """Create a FloodWait error like the one raised by Telethon.
+
+    Args:
+        seconds (int): The seconds to wait.
+
+    Returns:
+        FloodWaitError: The error.
+    """
+    return errors.FloodWaitError(request=None, capture=seconds)
+
+
+class FakeFileServer:
+    """Serve the bytes of a file by ranges, like `upload.GetFile`.
+
+    Each request waits `latency` seconds, plus the transfer time when a
+    `bandwidth` (bytes per second) is set. If `flood_limit` is set, the
+    requests beyond that number running at the same time get a FloodWait of
+    `flood_seconds`, like an account that exceeded its rate.
+    """
+
+    def __init__(self,
+                 data: bytes,
+                 latency: float = 0.0,
+                 bandwidth: Optional[float] = None,
+                 flood_limit: Optional[int] = None,
+                 flood_seconds: int = 0,
+                 ):
+        self.data = data
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.flood_limit = flood_limit
+        self.flood_seconds = flood_seconds
+        self.requests = 0
+        self.flood_waits = 0
+        self.running = 0
+        self.max_running = 0
+
+    async def get_file(self, offset: int, limit: int) -> bytes:
+        """Return a range of the file.
+
+        Args:
+            offset (int): The start of the range.
+            limit (int): The max length of the range.
+
+        Returns:
+            bytes: The bytes of the range.
+        """
+        self.requests += 1
+        if self.flood_limit is not None and self.running >= self.flood_limit:
+            self.flood_waits += 1
+            raise flood_wait_error(self.flood_seconds)
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            data = self.data[offset:offset + limit]
+            delay = self.latency
+            if self.bandwidth:
+                delay += len(data) / self.bandwidth
+            await asyncio.sleep(delay)
+            return data
+        finally:
+            self.running -= 1
+
+
+class FakeDC:
+    """A Telegram datacenter with its own latency and bandwidth.
+
+    The bandwidth (bytes per second) is shared by all the requests to the DC,
+    so the transfers queue behind each other like in a real link.
+    """
+
+    def __init__(self, latency: float = 0.0, bandwidth: Optional[float] = None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.available_at = 0.0
+
+    async def request(self, size: int = 0):
+        """Wait the time of a request that returns `size` bytes.
+
+        Args:
+            size (int, optional): The returned bytes. Defaults to 0.
+        """
+        delay = self.latency
+        if self.bandwidth and size:
+            now = time.monotonic()
+            start = max(now, self.available_at)
+            self.available_at = start + size / self.bandwidth
+            delay += self.available_at - now
+        await asyncio.sleep(delay)
+
+
+class FakeSession:
+    """The session of the fake client."""
+
+    def __init__(self, dc_id: int):
+        self.dc_id = dc_id
+
+
+# The date of the message 0 of every channel
+START_DATE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+# The search filters that find the documents of the fake channels
+DOCUMENT_FILTERS = (
+    tg_types.InputMessagesFilterEmpty,
+    tg_types.InputMessagesFilterVideo,
+    tg_types.InputMessagesFilterPhotoVideo,
+    tg_types.InputMessagesFilterDocument,
+)
+# The id of the discussion group of a channel is the channel id plus this
+DISCUSSION_GROUP_OFFSET = 10 ** 9
+
+
+class FakeTelegramClient:
+    """Stand-in for `TelegramClient` that serves synthetic channels.
+
+    Every channel has the messages from 1 to `messages`. One of each
+    `media_every` messages has a document of `media_size` bytes (or a random
+    size between the two values of a tuple), stored in one of `dcs`
+    datacenters. The other messages are text only.
+
+    Each request waits the latency of its DC, the file parts also wait for
+    the shared bandwidth of the DC. If `flood_limit` is set, the requests
+    beyond that number running at the same time get a FloodWait of
+    `flood_seconds`. If `channels` is set, the account can only resolve those
+    channel ids, like an account that only joined some channels.
+
+    With `album_size`, the consecutive messages are grouped in albums of that
+    size (`grouped_id`). With `paid_items`, the media are paid media with that
+    number of documents each.
+
+    The posts of a channel are discussed in a group of id `channel_id +
+    DISCUSSION_GROUP_OFFSET`, whose messages are like the ones of a channel.
+
+    The message N is posted N hours after `START_DATE`. The search finds the
+    documents (all of them are videos) with the video, photo_video and
+    document filters, and nothing with the other filters.
+    """
+
+    def __init__(self,
+                 messages: int = 1000,
+                 media_every: int = 1,
+                 media_size: Union[int, tuple[int, int]] = 100 * 1024,
+                 latency: float = 0.0,
+                 bandwidth: Optional[float] = None,
+                 dcs: int = 1,
+                 dc_latency: float = 0.0,
+                 flood_limit: Optional[int] = None,
+                 flood_seconds: int = 0,
+                 channels: Optional[Collection[int]] = None,
+                 album_size: int = 1,
+                 paid_items: int = 0,
+                 seed: int = 0,
+                 ):
+        self.messages = messages
+        self.media_every = media_every
+        self.media_size = media_size
+        self.flood_limit = flood_limit
+        self.flood_seconds = flood_seconds
+        self.channels = set(channels) if channels is not None else None
+        self.album_size = album_size
+        self.paid_items = paid_items
+        self.seed = seed
+        self.session = FakeSession(1)
+        # the DCs other than the home DC add their latency
+        self.dcs = {
+            dc_id: FakeDC(latency + (dc_latency if dc_id != 1 else 0.0), bandwidth)
+            for dc_id in range(1, dcs + 1)
+        }
+        self.flood_sleep_threshold = 60
+        self.requests: collections.Counter[str] = collections.Counter()
+        self.flood_waits = 0
+        self.running = 0
+        self.max_running = 0
+        self.handlers: list[tuple[Callable, Any]] = []
+        self.starts = 0
+        self._loop = asyncio.new_event_loop()
+        pattern = random.Random(seed).randbytes(2 * 1024 * 1024)
+        self.pattern = pattern + pattern
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The event loop of the client."""
+        return self._loop
+
+    async def start(self):
+        """Do nothing, the fake client is always logged in."""
+        self.starts += 1
+        return self
+
+    def get_channel_id(self, channel_id: Union[int, str]) -> int:
+        """Get the id of a channel from a marked id or a username.
+
+        Args:
+            channel_id (Union[int, str]): The channel id or username.
+
+        Returns:
+            int: The channel id.
+        """
+        if isinstance(channel_id, int):
+            text = str(abs(channel_id))
+            return int(text[3:]) if text.startswith('100') and channel_id < 0 else abs(channel_id)
+        return zlib.crc32(channel_id.lower().encode()) % 10 ** 9 + 1
+
+    def get_document(self, channel_id: int, message_id: int, item: int = 0) -> Optional[tg_types.Document]:
+        """Get the document of a message, if it has one.
+
+        Args:
+            channel_id (int): The channel id.
+            message_id (int): The message id.
+            item (int, optional): The item of a paid media. Defaults to 0.
+
+        Returns:
+            Optional[Document]: The document.
+        """
+        if message_id < 1 or message_id > self.messages or message_id % self.media_every:
+            return None
+        generator = random.Random(f'{self.seed}-{channel_id}-{message_id}-{item}' if item else f'{self.seed}-{channel_id}-{message_id}')
+        if isinstance(self.media_size, tuple):
+            size = generator.randint(*self.media_size)
+        else:
+            size = self.media_size
+        return tg_types.Document(
+            id=(channel_id * 10 ** 7 + message_id) * 100 + item,
+            access_hash=0,
+            file_reference=b'',
+            date=None,
+            mime_type='video/mp4',
+            size=size,
+            dc_id=generator.randint(1, len(self.dcs)),
+            attributes=[tg_types.DocumentAttributeFilename(f'{message_id}.mp4')],
+        )
+
+    def get_message(self, channel_id: int, message_id: int):
+        """Get a message of a channel.
+
+        Args:
+            channel_id (int): The channel id.
+            message_id (int): The message id.
+
+        Returns:
+            Union[Message, MessageEmpty]: The message.
+        """
+        if message_id < 1 or message_id > self.messages:
+            return tg_types.MessageEmpty(id=message_id, peer_id=tg_types.PeerChannel(channel_id))
+        document = self.get_document(channel_id, message_id)
+        media = tg_types.MessageMediaDocument(document=document) if document else None
+        if media is not None and self.paid_items:
+            media = tg_types.MessageMediaPaidMedia(
+                stars_amount=1,
+                extended_media=[
+                    tg_types.MessageExtendedMedia(
+                        tg_types.MessageMediaDocument(document=self.get_document(channel_id, message_id, item)),
+                    )
+                    for item in range(1, self.paid_items + 1)
+                ],
+            )
+        grouped_id = None
+        if self.album_size > 1:
+            grouped_id = channel_id * 10 ** 7 + (message_id - 1) // self.album_size + 1
+        return tg_types.Message(
+            id=message_id,
+            peer_id=tg_types.PeerChannel(channel_id),
+            date=START_DATE + timedelta(hours=message_id),
+            message=f'message {message_id}',
+            media=media,
+            grouped_id=grouped_id,
+        )
+
+    def get_file_bytes(self, document_id: int, size: int, offset: int, limit: int) -> bytes:
+        """Get a range of the content of a document.
+
+        The content is a pseudo random pattern that depends on the document id.
+
+        Args:
+            document_id (int): The document id.
+            size (int): The document size.
+            offset (int): The start of the range.
+            limit (int): The max length of the range.
+
+        Returns:
+            bytes: The bytes of the range.
+        """
+        limit = max(0, min(limit, size - offset))
+        start = (document_id * 4099 + offset) % (len(self.pattern) // 2)
+        return self.pattern[start:start + limit]
+
+    async def request(self, name: str, dc_id: int = 1, size: int = 0):
+        """Simulate a request: count it, maybe raise a FloodWait, and wait.
+
+        Args:
+            name (str): The request name.
+            dc_id (int, optional): The DC of the request. Defaults to 1.
+            size (int, optional): The returned bytes. Defaults to 0.
+
+        Raises:
+            FloodWaitError: If there are too many requests running.
+        """
+        self.requests[name] += 1
+        if self.flood_limit is not None and self.running >= self.flood_limit:
+            self.flood_waits += 1
+            raise flood_wait_error(self.flood_seconds)
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await self.dcs.get(dc_id, self.dcs[1]).request(size)
+        finally:
+            self.running -= 1
+
+    async def get_entity(self, channel_id: Union[int, str]):
+        """Resolve a channel.
+
+        Args:
+            channel_id (Union[int, str]): The channel id or username.
+
+        Returns:
+            Channel: The channel.
+        """
+        await self.request('ResolveChannel')
+        if self.channels is not None and self.get_channel_id(channel_id) not in self.channels:
+            raise errors.ChannelPrivateError(request=None)
+        return tg_types.Channel(
+            id=self.get_channel_id(channel_id),
+            title=f'channel {channel_id}',
+            photo=tg_types.ChatPhotoEmpty(),
+            date=None,
+            access_hash=0,
+        )
+
+    async def get_file_part(self, location, offset: int, limit: int) -> bytes:
+        """Get a part of a document.
+
+        Args:
+            location (InputDocumentFileLocation): The document location.
+            offset (int): The start of the part.
+            limit (int): The max length of the part.
+
+        Returns:
+            bytes: The bytes of the part.
+        """
+        message, item = divmod(location.id, 100)
+        channel_id, message_id = divmod(message, 10 ** 7)
+        document = self.get_document(channel_id, message_id, item)
+        if document is None:
+            raise ValueError(f'Unknown document: {location.id}')
+        data = self.get_file_bytes(document.id, document.size, offset, limit)
+        await self.request('GetFile', document.dc_id, len(data))
+        return data
+
+    async def __call__(self, request):
+        """Answer a request.
+
+        Args:
+            request: The Telegram request.
+
+        Returns:
+            The result of the request.
+        """
+        if isinstance(request, functions.channels.GetMessagesRequest):
+            await self.request('GetMessages')
+            return tg_types.messages.ChannelMessages(
+                pts=0,
+                count=len(request.id),
+                messages=[
+                    self.get_message(request.channel.channel_id, input_message.id)
+                    for input_message in request.id
+                ],
+                topics=[],
+                chats=[],
+                users=[],
+            )
+
+        if isinstance(request, functions.messages.GetDiscussionMessageRequest):
+            await self.request('GetDiscussionMessage')
+            group_id = request.peer.channel_id + DISCUSSION_GROUP_OFFSET
+            return tg_types.messages.DiscussionMessage(
+                messages=[self.get_message(group_id, request.msg_id)],
+                unread_count=0,
+                chats=[
+                    tg_types.Channel(
+                        id=group_id,
+                        title=f'discussion {request.peer.channel_id}',
+                        photo=tg_types.ChatPhotoEmpty(),
+                        date=None,
+                        access_hash=1,
+                        megagroup=True,
+                    ),
+                ],
+                users=[],
+            )
+
+        if isinstance(request, functions.messages.SearchRequest):
+            await self.request('Search')
+            channel_id = request.peer.channel_id
+            found: list[tg_types.Message] = []
+            if isinstance(request.filter, DOCUMENT_FILTERS):
+                last = min(self.messages, (request.offset_id or self.messages + 1) - 1)
+                for message_id in range(last, max(request.min_id, 0), -1):
+                    if request.max_id and message_id >= request.max_id:
+                        continue
+                    message = self.get_message(channel_id, message_id)
+                    if message.media is None:
+                        continue
+                    if request.min_date and message.date < request.min_date:
+                        continue
+                    if request.max_date and message.date >= request.max_date:
+                        continue
+                    found.append(message)
+                    if len(found) >= request.limit:
+                        break
+            return tg_types.messages.ChannelMessages(
+                pts=0,
+                count=len(found),
+                messages=found,
+                topics=[],
+                chats=[],
+                users=[],
+            )
+
+        if isinstance(request, functions.messages.GetHistoryRequest):
+            await self.request('GetHistory')
+            if request.add_offset < 0:
+                first = max(1, request.offset_id + request.add_offset + request.limit)
+                ids = range(first, min(self.messages, first + request.limit - 1) + 1)
+            else:
+                last = min(self.messages, (request.offset_id or self.messages + 1) - 1 - request.add_offset)
+                ids = range(max(1, last - request.limit + 1), last + 1)
+            return tg_types.messages.ChannelMessages(
+                pts=0,
+                count=self.messages,
+                messages=[self.get_message(request.peer.channel_id, message_id) for message_id in reversed(ids)],
+                topics=[],
+                chats=[],
+                users=[],
+            )
+
+        if isinstance(request, functions.upload.GetFileRequest):
+            data = await self.get_file_part(request.location, request.offset, request.limit)
+            return tg_types.upload.File(type=tg_types.storage.FileUnknown(), mtime=0, bytes=data)
+
+        raise NotImplementedError(f'The fake client does not answer {type(request).__name__}')
+
+    async def _call(self, sender, request):
+        """Answer a request sent to another DC."""
+        return await self(request)
+
+    async def _borrow_exported_sender(self, dc_id: int):
+        """Get the sender of another DC, here its id."""
+        return dc_id
+
+    async def _return_exported_sender(self, sender):
+        """Give back the sender of another DC."""
+
+    async def iter_download(self,
+                            media,
+                            offset: int = 0,
+                            request_size: int = 512 * 1024,
+                            file_size: Optional[int] = None,
+                            ) -> AsyncIterator[bytes]:
+        """Download a media part after part.
+
+        Args:
+            media: The media object.
+            offset (int, optional): The start of the download. Defaults to 0.
+            request_size (int, optional): The size of each part.
+            file_size (Optional[int], optional): The media size, not used.
+
+        Yields:
+            bytes: The next part.
+        """
+        location = tg_types.InputDocumentFileLocation(media.document.id, 0, b'', '')
+        while True:
+            data = await self.get_file_part(location, offset, request_size)
+            if data:
+                yield data
+            if len(data) < request_size:
+                return
+            offset += len(data)
+
+    async def download_file(self, media, file):
+        """Download a media to a file object.
+
+        Args:
+            media: The media object.
+            file: The output file object.
+        """
+        async for data in self.iter_download(media):
+            file.write(data)
+
+    def add_event_handler(self, callback: Callable, event: Any = None):
+        """Register an event handler."""
+        self.handlers.append((callback, event))
+
+    def remove_event_handler(self, callback: Callable, event: Any = None):
+        """Unregister an event handler."""
+        self.handlers.remove((callback, event))
+
+    def post(self, channel_id: int) -> tg_types.Message:
+        """Post a new message, and send it to the handlers of a channel.
+
+        Every channel gets the new message id, like the others.
+
+        Args:
+            channel_id (int): The channel id of the event.
+
+        Returns:
+            Message: The new message.
+        """
+        self.messages += 1
+        message = self.get_message(channel_id, self.messages)
+        for callback, event in list(self.handlers):
+            chats = getattr(event, 'chats', None)
+            if chats is not None and not any(getattr(chat, 'channel_id', None) == channel_id for chat in chats):
+                continue
+            asyncio.ensure_future(callback(events.NewMessage.Event(message)))
+        return message
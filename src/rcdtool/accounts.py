@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+# MIT License
+#
+# Copyright (c) 2025 David256
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Telegram accounts and the choice of the account of each channel
+"""
+import time
+import asyncio
+from typing import Any, Collection, Optional, Union
+
+from telethon import errors
+
+from rcdtool.cache import EntityCache, get_cache_key
+from rcdtool.ratelimit import RateController
+from rcdtool.log import logger
+
+
+# The errors that mean that the account cannot see a channel
+NOT_MEMBER_ERRORS = (
+    ValueError,
+    errors.ChannelPrivateError,
+    errors.ChannelInvalidError,
+    errors.UsernameInvalidError,
+    errors.UsernameNotOccupiedError,
+)
+
+
+class Account:
+    """A Telegram session with its own limits.
+
+    Each account has its own client, rate controller and resolved channels,
+    because an access hash is only valid for the account that got it. The
+    messages fetched by an account must be downloaded by the same account.
+    """
+
+    def __init__(self,
+                 name: str,
+                 client: Any,
+                 rate: RateController,
+                 entity_cache: EntityCache,
+                 ):
+        self.name = name
+        self.client = client
+        self.rate = rate
+        self.entity_cache = entity_cache
+        self.connection: Optional[asyncio.Future] = None
+        self.in_flight_bytes = 0
+        # the number of times it was chosen, to take turns when all are idle
+        self.chosen = 0
+        self.members: dict[str, bool] = {}
+
+    def __repr__(self) -> str:
+        return f'Account({self.name!r})'
+
+    async def connect(self):
+        """Start the client session, only before the first request.
+
+        The client is not started when it is created, so the runs that do not
+        request anything never connect. The concurrent calls wait for the same
+        connection.
+
+        The client sleeps through the FloodWaits of the login, and after it
+        the FloodWaits are raised to be handled by the rate controller.
+        """
+        if self.connection is None:
+            logger.debug('connecting %s', self.name)
+            self.connection = asyncio.ensure_future(self.start())
+        try:
+            await asyncio.shield(self.connection)
+        except Exception:
+            # the next request can try again
+            self.connection = None
+            raise
+
+    async def start(self):
+        """Log in, then leave the FloodWaits to the rate controller."""
+        await self.client.start()
+        self.client.flood_sleep_threshold = 0
+
+    def is_member(self, channel_id: Union[int, str]) -> Optional[bool]:
+        """Check if the account can see a channel.
+
+        Args:
+            channel_id (Union[int, str]): The channel ID or username.
+
+        Returns:
+            Optional[bool]: None if it is unknown yet.
+        """
+        if self.entity_cache.get(channel_id) is not None:
+            return True
+        return self.members.get(get_cache_key(channel_id))
+
+    def set_member(self, channel_id: Union[int, str], member: bool):
+        """Save if the account can see a channel.
+
+        Args:
+            channel_id (Union[int, str]): The channel ID or username.
+            member (bool): True if it can resolve the channel.
+        """
+        self.members[get_cache_key(channel_id)] = member
+
+    @property
+    def waiting(self) -> float:
+        """The seconds until the current FloodWait ends."""
+        return max(0.0, self.rate.paused_until - time.monotonic())
+
+
+def choose_account(accounts: list[Account],
+                   channel_id: Union[int, str],
+                   exclude: Collection[Account] = (),
+                   ) -> Optional[Account]:
+    """Choose the account to request a channel.
+
+    The accounts that cannot see the channel are skipped. Then the accounts
+    that are not waiting a FloodWait are preferred, with the less bytes in
+    flight and the less busy rate controller. The ties are taken in turns,
+    preferring the accounts that already resolved the channel.
+
+    Args:
+        accounts (list[Account]): The accounts.
+        channel_id (Union[int, str]): The channel ID or username.
+        exclude (Collection[Account], optional): The accounts that already
+            failed.
+
+    Returns:
+        Optional[Account]: The chosen account, None if no account can see
+        the channel.
+    """
+    candidates = [
+        account
+        for account in accounts
+        if account not in exclude and account.is_member(channel_id) is not False
+    ]
+    if not candidates:
+        return None
+    return min(
+        candidates,
+        key=lambda account: (
+            account.waiting,
+            account.in_flight_bytes,
+            account.rate.in_flight / account.rate.limit,
+            account.chosen,
+            account.is_member(channel_id) is not True,
+        ),
+    )
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+# MIT License
+#
+# Copyright (c) 2025 David256
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Cache for the resolved channels
+"""
+import os
+import json
+import time
+import asyncio
+from typing import Awaitable, Callable, Optional, Union
+
+import rcdtool.utils as utils
+from rcdtool.log import logger
+
+
+# The channel id and the access hash
+ChannelAccess = tuple[int, int]
+
+
+def get_cache_key(channel_id: Union[int, str]) -> str:
+    """Normalize a channel id to be used as cache key.
+
+    Args:
+        channel_id (Union[int, str]): The channel id or username.
+
+    Returns:
+        str: The cache key.
+    """
+    key = utils.parse_channel_id(channel_id)
+    if isinstance(key, str):
+        # usernames are case insensitive
+        key = key.lower()
+    return str(key)
+
+
+class EntityCache:
+    """Cache of channel accesses by channel id.
+
+    The concurrent lookups of the same channel share only one resolution. If
+    a filename is given, the entries are persisted there to be reused by the
+    next runs until they expire.
+    """
+
+    def __init__(self, filename: Optional[str] = None, ttl: Optional[float] = None):
+        self.filename = filename
+        self.ttl = ttl
+        self.entries: dict[str, tuple[int, int, float]] = {}
+        self.pending: dict[str, asyncio.Future] = {}
+        if self.filename:
+            self.load()
+
+    def load(self):
+        """Load the persisted entries, ignoring the expired ones."""
+        if not self.filename or not os.path.exists(self.filename):
+            return
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError) as err:
+            logger.warning('Cannot load the entity cache %s: %s', self.filename, err)
+            return
+
+        for key, (channel_id, access_hash, created_at) in data.items():
+            if not self.is_expired(created_at):
+                self.entries[key] = (channel_id, access_hash, created_at)
+        logger.debug('loaded %d cached entities', len(self.entries))
+
+    def save(self):
+        """Persist the entries atomically."""
+        if not self.filename:
+            return
+        temp_filename = f'{self.filename}.tmp'
+        with open(temp_filename, 'w', encoding='utf-8') as file:
+            json.dump(self.entries, file)
+        os.replace(temp_filename, self.filename)
+
+    def is_expired(self, created_at: float) -> bool:
+        """Check if an entry created at that time is expired.
+
+        Args:
+            created_at (float): The creation timestamp of the entry.
+
+        Returns:
+            bool: True if the entry must be resolved again.
+        """
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def get(self, channel_id: Union[int, str]) -> Optional[ChannelAccess]:
+        """Get a cached channel access.
+
+        Args:
+            channel_id (Union[int, str]): The channel id or username.
+
+        Returns:
+            Optional[ChannelAccess]: The channel id and access hash, or None.
+        """
+        key = get_cache_key(channel_id)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if self.is_expired(entry[2]):
+            del self.entries[key]
+            return None
+        return entry[0], entry[1]
+
+    def put(self, channel_id: Union[int, str], access: ChannelAccess):
+        """Store a channel access.
+
+        Args:
+            channel_id (Union[int, str]): The channel id or username.
+            access (ChannelAccess): The channel id and access hash.
+        """
+        self.entries[get_cache_key(channel_id)] = (access[0], access[1], time.time())
+        self.save()
+
+    async def resolve(self,
+                      channel_id: Union[int, str],
+                      resolver: Callable[[], Awaitable[Optional[ChannelAccess]]],
+                      ) -> Optional[ChannelAccess]:
+        """Get a channel access from the cache or resolve it.
+
+        Args:
+            channel_id (Union[int, str]): The channel id or username.
+            resolver (Callable[[], Awaitable[Optional[ChannelAccess]]]): The
+                function that resolves the channel if it is not cached.
+
+        Returns:
+            Optional[ChannelAccess]: The channel id and access hash, or None
+            if it cannot be resolved.
+        """
+        access = self.get(channel_id)
+        if access is not None:
+            return access
+
+        key = get_cache_key(channel_id)
+        pending = self.pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending[key] = future
+        try:
+            access = await resolver()
+            if access is not None:
+                self.put(channel_id, access)
+            future.set_result(access)
+            return access
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as err:
+            future.set_exception(err)
+            # mark it as retrieved if nobody else is waiting
+            future.exception()
+            raise
+        finally:
+            del self.pending[key]
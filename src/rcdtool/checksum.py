@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+# MIT License
+#
+# Copyright (c) 2025 David256
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Checksums of the downloaded files, computed while they are written
+"""
+import os
+import json
+import zlib
+import hashlib
+from typing import IO, BinaryIO, Container, Optional
+
+from rcdtool.log import logger
+
+
+# xxh64 needs the optional `xxhash` package
+CHECKSUM_ALGORITHMS = ('sha256', 'blake2b', 'crc32', 'xxh64')
+
+# Bytes read at once when a part of the file must be hashed from the disk
+READ_SIZE = 1024 * 1024
+
+
+class Crc32:
+    """CRC-32 with the interface of the `hashlib` objects."""
+
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data: bytes):
+        """Add data to the checksum.
+
+        Args:
+            data (bytes): The data.
+        """
+        self.value = zlib.crc32(data, self.value)
+
+    def hexdigest(self) -> str:
+        """Get the checksum.
+
+        Returns:
+            str: The checksum as 8 hexadecimal digits.
+        """
+        return f'{self.value:08x}'
+
+
+def create_hash(algorithm: str):
+    """Create a hash object of an algorithm.
+
+    Args:
+        algorithm (str): One of `CHECKSUM_ALGORITHMS`.
+
+    Raises:
+        ValueError: If the algorithm is unknown or not installed.
+
+    Returns:
+        An object with `update` and `hexdigest`.
+    """
+    if algorithm == 'crc32':
+        return Crc32()
+    if algorithm == 'xxh64':
+        try:
+            import xxhash  # pylint: disable=import-outside-toplevel
+        except ImportError as err:
+            raise ValueError('The xxh64 checksum needs the xxhash package: pip install xxhash') from err
+        return xxhash.xxh64()
+    if algorithm in CHECKSUM_ALGORITHMS:
+        return hashlib.new(algorithm)
+    raise ValueError(f'Unknown checksum algorithm: {algorithm}')
+
+
+def read_at(file: BinaryIO, offset: int, size: int) -> bytes:
+    """Read data from a position of the file.
+
+    Args:
+        file (BinaryIO): The opened file.
+        offset (int): The position in the file.
+        size (int): The max bytes to read.
+
+    Returns:
+        bytes: The data, shorter at the end of the file.
+    """
+    if hasattr(os, 'pread'):
+        return os.pread(file.fileno(), size, offset)
+    file.seek(offset)
+    return file.read(size)
+
+
+class StreamChecksum:
+    """Checksum of a file whose parts are written in any order.
+
+    The hash needs the data in order, so the parts that arrive before the
+    previous ones wait in memory (a few parts, since they are requested in
+    order). The parts already downloaded by a previous run are read from the
+    file when the checksum gets to them.
+    """
+
+    def __init__(self,
+                 algorithm: str,
+                 part_size: int,
+                 completed: Container[int] = (),
+                 ):
+        self.algorithm = algorithm
+        self.hash = create_hash(algorithm)
+        self.part_size = part_size
+        self.completed = completed
+        self.position = 0
+        self.pending: dict[int, bytes] = {}
+        # bytes read from the disk, only for resumed downloads
+        self.read_bytes = 0
+
+    def add(self, file: BinaryIO, offset: int, data: bytes):
+        """Add a written part, in the writer thread.
+
+        Args:
+            file (BinaryIO): The file, to read the parts of a previous run.
+            offset (int): The position of the part in the file.
+            data (bytes): The part.
+        """
+        if offset < self.position:
+            # a retried part, already hashed
+            return
+        self.pending[offset] = data
+        self.advance(file)
+
+    def advance(self, file: BinaryIO):
+        """Hash the parts that follow the hashed data.
+
+        Args:
+            file (BinaryIO): The file, to read the parts of a previous run.
+        """
+        while True:
+            data = self.pending.pop(self.position, None)
+            if data is None and self.position in self.completed:
+                data = read_at(file, self.position, self.part_size)
+                self.read_bytes += len(data)
+            if not data:
+                return
+            self.hash.update(data)
+            self.position += len(data)
+
+    def finish(self, file: BinaryIO) -> str:
+        """Hash the rest of the file and get the checksum.
+
+        Any data that was not hashed yet (like a gap left by a retry) is read
+        from the file.
+
+        Args:
+            file (BinaryIO): The written file.
+
+        Returns:
+            str: The checksum in hexadecimal.
+        """
+        self.advance(file)
+        end = os.fstat(file.fileno()).st_size
+        while self.position < end:
+            following = [offset for offset in self.pending if offset > self.position]
+            size = min(min(following, default=end), end) - self.position
+            data = read_at(file, self.position, min(size, READ_SIZE))
+            if not data:
+                break
+            self.read_bytes += len(data)
+            self.hash.update(data)
+            self.position += len(data)
+            self.advance(file)
+        self.pending.clear()
+        if self.read_bytes:
+            logger.debug('read %d bytes from the disk to hash them', self.read_bytes)
+        return self.hash.hexdigest()
+
+
+class Manifest:
+    """JSON lines file with an entry of each downloaded file.
+
+    Each entry has the channel and message ids, the media id, the size, the
+    checksum (if any) and the path of the file, and the timings of the
+    download. It is opened to append, so the runs add to the same audit log.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.file: Optional[IO[str]] = open(filename, 'a', encoding='utf-8')
+
+    def record(self, entry: dict):
+        """Append an entry.
+
+        Args:
+            entry (dict): The entry, JSON serializable.
+        """
+        if self.file is None:
+            return
+        self.file.write(json.dumps(entry) + '\n')
+        self.file.flush()
+
+    def close(self):
+        """Close the file."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
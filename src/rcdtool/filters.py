@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+# MIT License
+#
+# Copyright (c) 2025 David256
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Filters of the medias to download
+"""
+import re
+import fnmatch
+from datetime import datetime, timezone
+from dataclasses import dataclass
+from typing import Optional
+
+
+# The kinds of media that Telegram can search, see `RCD.search_media`
+MEDIA_KINDS = ('photo', 'video', 'photo_video', 'document', 'music', 'voice', 'round', 'gif')
+
+SIZE_UNITS = {
+    '': 1,
+    'k': 1024,
+    'm': 1024 ** 2,
+    'g': 1024 ** 3,
+}
+
+
+def parse_size(value: str) -> int:
+    """Parse a size in bytes, with an optional unit: K, M or G (powers of 1024).
+
+    For example, `10M` gives `10485760`.
+
+    Args:
+        value (str): The size.
+
+    Raises:
+        ValueError: If it is not a valid size.
+
+    Returns:
+        int: The size in bytes.
+    """
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kmg]?)i?b?\s*', value.lower())
+    if match is None:
+        raise ValueError(f'Not a valid size: {value}')
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def parse_date(value: str) -> datetime:
+    """Parse an ISO 8601 date or date and time, in UTC if it has no time zone.
+
+    Args:
+        value (str): The date, like `2024-05-01` or `2024-05-01T12:00`.
+
+    Raises:
+        ValueError: If it is not a valid date.
+
+    Returns:
+        datetime: The date.
+    """
+    date = datetime.fromisoformat(value)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return date
+
+
+def parse_kinds(value: str) -> list[str]:
+    """Parse a comma-separated list of media kinds.
+
+    Args:
+        value (str): The media kinds, like `photo,video`.
+
+    Raises:
+        ValueError: If a kind is unknown.
+
+    Returns:
+        list[str]: The media kinds, without repetitions.
+    """
+    kinds: list[str] = []
+    for kind in value.split(','):
+        kind = kind.strip().lower()
+        if not kind:
+            continue
+        if kind not in MEDIA_KINDS:
+            raise ValueError(f'Unknown media kind: {kind}. It must be one of {", ".join(MEDIA_KINDS)}')
+        if kind not in kinds:
+            kinds.append(kind)
+    return kinds
+
+
+@dataclass
+class MediaFilter:
+    """Conditions on the metadata of a media, checked before downloading it.
+
+    The MIME types are patterns like `video/*`. The dates are the posting
+    dates, the max one is excluded. An unknown size, MIME type or date passes
+    the filter, so nothing is discarded by lack of data.
+    """
+    min_size: Optional[int] = None
+    max_size: Optional[int] = None
+    mime_types: tuple[str, ...] = ()
+    min_date: Optional[datetime] = None
+    max_date: Optional[datetime] = None
+
+    @property
+    def active(self) -> bool:
+        """If there is any condition."""
+        return (
+            self.min_size is not None
+            or self.max_size is not None
+            or bool(self.mime_types)
+            or self.min_date is not None
+            or self.max_date is not None
+        )
+
+    def matches(self,
+                mime_type: Optional[str],
+                size: Optional[int],
+                date: Optional[datetime] = None,
+                ) -> bool:
+        """Check a media.
+
+        Args:
+            mime_type (Optional[str]): The MIME type, if it is known.
+            size (Optional[int]): The size in bytes, if it is known.
+            date (Optional[datetime]): The date of the message, if it is known.
+
+        Returns:
+            bool: True if the media must be downloaded.
+        """
+        if date is not None:
+            if self.min_date is not None and date < self.min_date:
+                return False
+            if self.max_date is not None and date >= self.max_date:
+                return False
+        if size is not None:
+            if self.min_size is not None and size < self.min_size:
+                return False
+            if self.max_size is not None and size > self.max_size:
+                return False
+        if mime_type is not None and self.mime_types:
+            mime_type = mime_type.lower()
+            return any(fnmatch.fnmatchcase(mime_type, pattern.lower()) for pattern in self.mime_types)
+        return True
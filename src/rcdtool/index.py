@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+# MIT License
+#
+# Copyright (c) 2025 David256
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Index of the downloaded medias, to not download them again
+"""
+import os
+import sqlite3
+from typing import Optional
+
+from rcdtool.log import logger
+
+
+class MediaIndex:
+    """SQLite index of the downloaded medias by Telegram media id.
+
+    Each media (a document or a photo) is saved with its size and the path
+    where it was downloaded.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS media ('
+            ' kind TEXT NOT NULL,'
+            ' media_id INTEGER NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' path TEXT NOT NULL,'
+            ' PRIMARY KEY (kind, media_id)'
+            ')'
+        )
+        self.connection.commit()
+
+    def lookup(self, kind: str, media_id: int, size: Optional[int] = None) -> Optional[str]:
+        """Find the path of a downloaded media.
+
+        The entries whose file was deleted or changed are removed.
+
+        Args:
+            kind (str): The media kind (document or photo).
+            media_id (int): The Telegram media id.
+            size (Optional[int], optional): The expected size, if it is known.
+
+        Returns:
+            Optional[str]: The path of the downloaded media, or None.
+        """
+        row = self.connection.execute(
+            'SELECT size, path FROM media WHERE kind = ? AND media_id = ?',
+            (kind, media_id),
+        ).fetchone()
+        if row is None:
+            return None
+
+        stored_size, path = row
+        if size is not None and size != stored_size:
+            return None
+        try:
+            valid = os.path.getsize(path) == stored_size
+        except OSError:
+            valid = False
+        if not valid:
+            logger.debug('removing the stale index entry of %s', path)
+            self.remove(kind, media_id)
+            return None
+        return path
+
+    def add(self, kind: str, media_id: int, path: str):
+        """Save a downloaded media.
+
+        Args:
+            kind (str): The media kind (document or photo).
+            media_id (int): The Telegram media id.
+            path (str): The path of the downloaded file.
+        """
+        path = os.path.abspath(path)
+        self.connection.execute(
+            'INSERT OR REPLACE INTO media (kind, media_id, size, path) VALUES (?, ?, ?, ?)',
+            (kind, media_id, os.path.getsize(path), path),
+        )
+        self.connection.commit()
+
+    def remove(self, kind: str, media_id: int):
+        """Remove a media from the index.
+
+        Args:
+            kind (str): The media kind (document or photo).
+            media_id (int): The Telegram media id.
+        """
+        self.connection.execute(
+            'DELETE FROM media WHERE kind = ? AND media_id = ?',
+            (kind, media_id),
+        )
+        self.connection.commit()
+
+    def close(self):
+        """Close the database."""
+        self.connection.close()
@@ -25,7 +25,12 @@
 """
 Some things for the logging
 """
+import json
+import time
+import queue
+import atexit
 import logging
+import logging.handlers
 from colored import Fore, Style, Back
 
 CODENAME = 'rcdtool'
@@ -82,20 +87,94 @@ class ColoredFormatter(logging.Formatter):
         return text
 
 
+class JSONFormatter(logging.Formatter):
+    """
+    JSONFormatter class, one compact JSON object per line.
+    """
+
+    def format(self, record):
+        """Apply a format to a message.
+
+        Args:
+            record (LogRecord): The log record.
+        """
+        data = {
+            'time': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'name': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data)
+
+
 class RCDToolLogger(logging.getLoggerClass()):
-    """RCDToolLogger"""
+    """RCDToolLogger
+
+    The records are put in a queue and written to stderr by a background
+    thread, so the event loop never waits for the formatting nor the output.
+    """
     def __init__(self, name: str, level: int | str = 0) -> None:
         super().__init__(name, level)
-        formatter = ColoredFormatter()
-        handler = logging.StreamHandler()
-        handler.setFormatter(formatter)
-        self.addHandler(handler)
+        self.handler = logging.StreamHandler()
+        self.handler.setFormatter(ColoredFormatter())
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        self.addHandler(logging.handlers.QueueHandler(records))
+        self.listener = logging.handlers.QueueListener(records, self.handler)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def configure(self, level: int | str = logging.INFO, json_format: bool = False):
+        """Set the level and the format of the output.
+
+        Args:
+            level (int | str, optional): The level name or number. Defaults
+                to INFO.
+            json_format (bool, optional): Write JSON lines instead of colored
+                text. Defaults to False.
+        """
+        if isinstance(level, str):
+            level = level.upper()
+        self.setLevel(level)
+        # this logger is not registered in the manager, which only clears
+        # the level cache of the registered ones
+        self._cache.clear()
+        self.handler.setFormatter(JSONFormatter() if json_format else ColoredFormatter())
+
+
+class Progress:
+    """Log a progress message at most once per interval."""
+
+    def __init__(self, interval: float = 5.0, level: int = logging.INFO):
+        self.interval = interval
+        self.level = level
+        self.last = time.monotonic()
+
+    def update(self, message: str, *args, force: bool = False) -> bool:
+        """Log the message if the interval has passed since the last one.
+
+        Args:
+            message (str): The message format.
+            args: The message arguments.
+            force (bool, optional): Log it anyway, for the last update.
+
+        Returns:
+            bool: True if it was logged.
+        """
+        now = time.monotonic()
+        if not force and now - self.last < self.interval:
+            return False
+        self.last = now
+        logger.log(self.level, message, *args)
+        return True
 
 
 logger = RCDToolLogger(CODENAME)
-logger.setLevel(logging.DEBUG)
+logger.setLevel(logging.INFO)
 
 if __name__ == '__main__':
+    logger.setLevel(logging.DEBUG)
     logger.info('info')
     logger.debug('debug')
     logger.warning('warning')
@@ -22,20 +22,31 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-# pylint: disable=unused-import
-import readline
-import os
-import random
+# Telethon takes most of the startup time, so `rcdtool.rcdtool` is imported
+# only when the arguments are parsed and there is something to download.
+# pylint: disable=import-outside-toplevel
+import sys
 import asyncio
 from dataclasses import dataclass
-from typing import Optional, Coroutine, cast
+from datetime import datetime
+from typing import TYPE_CHECKING, AsyncIterable, AsyncIterator, Iterable, Iterator, Optional, Union, cast
 import argparse
 
-from rcdtool.rcdtool import RCD
+from rcdtool.sync import SyncState, SyncTracker
+from rcdtool.pipeline import Batch, FilenameGenerator, PipelineOptions, download_batches, filename_generator
+from rcdtool.parallel import PART_SIZE
+from rcdtool.writer import FSYNC_POLICIES, WRITE_BUFFER
+from rcdtool.checksum import CHECKSUM_ALGORITHMS
+from rcdtool.planner import OutputPlanner, PlanReport, to_template
+from rcdtool.filters import MediaFilter, parse_date, parse_kinds, parse_size
+from rcdtool.targets import TARGET_FORMATS, TargetLine, guess_format, iter_target_lines, parse_link
 
 import rcdtool.utils as utils
 from rcdtool.log import logger
 
+if TYPE_CHECKING:
+    from rcdtool.rcdtool import RCD, Target
+
 
 @dataclass
 class Arguments:
@@ -44,11 +55,45 @@ class Arguments:
     channel_id: Optional[str]
     message_id: Optional[str]
     output_filename: Optional[str]
+    shard_size: Optional[int]
     link: Optional[str]
+    albums: bool
+    media_kinds: Optional[list[str]]
+    min_date: Optional[datetime]
+    max_date: Optional[datetime]
+    min_size: Optional[int]
+    max_size: Optional[int]
+    mime_types: Optional[str]
+    targets_filename: Optional[str]
+    targets_format: str
     infer_extension: Optional[bool]
     detailed_name: Optional[bool]
     dry_mode: Optional[bool]
     discussion_message_id: Optional[str]
+    concurrency: int
+    metadata_concurrency: Optional[int]
+    transfer_concurrency: Optional[int]
+    max_in_flight_bytes: Optional[int]
+    max_total_bytes: Optional[int]
+    plan_filename: Optional[str]
+    parts: int
+    part_size: int
+    fsync: str
+    write_buffer: int
+    checksum: Optional[str]
+    manifest_filename: Optional[str]
+    index_filename: Optional[str]
+    dedup: str
+    max_requests: Optional[int]
+    max_flood_wait: Optional[float]
+    sync: bool
+    sync_state: str
+    watch: bool
+    stats_filename: Optional[str]
+    metrics_port: Optional[int]
+    log_level: str
+    log_format: str
+    progress_interval: float
 
 
 def get_args():
@@ -71,6 +116,15 @@ def get_args():
                         const="",
                         default=None,
                         help='Take IDs from a message link. The message id section of the link can be in the same format as described for -M below')
+    parser.add_argument('--targets',
+                        dest='targets_filename',
+                        default=None,
+                        help='Read the targets from this file, one per line, or from the standard input with "-". Each line has a message link or a channel ID and message IDs, and optionally its own output filename')
+    parser.add_argument('--targets-format',
+                        dest='targets_format',
+                        choices=['auto', *TARGET_FORMATS],
+                        default='auto',
+                        help='The format of the targets file: text, CSV or JSON lines. By default, it is guessed from the file extension')
     parser.add_argument('-c',
                         '--config',
                         nargs='?',
@@ -91,12 +145,51 @@ def get_args():
                         '--discussion-message-id',
                         nargs='?',
                         dest='discussion_message_id',
-                        help='The discussion message ID. If you want to find a message in a discussion channel from a post in a channel. Do not use this with multiple target of channels lol')
+                        help='The message IDs of the comments, in the discussion group linked to the channel of -M. This value can be a comma-separated list, or a range of values separated by ".."')
     parser.add_argument('-O',
                         '--output',
                         nargs='?',
                         dest='output_filename',
-                        help='The output filename')
+                        help='The output filename, or a template with the fields {channel}, {message_id}, {ext} and {shard}, like download/{channel}/{message_id}.{ext}')
+    parser.add_argument('--shard-size',
+                        dest='shard_size',
+                        type=int,
+                        default=None,
+                        help='Split the files in subdirectories of this number of message IDs')
+    parser.add_argument('--albums',
+                        dest='albums',
+                        action='store_true',
+                        default=False,
+                        help='Download all the messages of the albums of the targets, named after the target message')
+    parser.add_argument('--filter',
+                        dest='media_kinds',
+                        type=parse_kinds,
+                        default=None,
+                        help='Ask Telegram only for the messages of -M with these kinds of media, comma-separated: photo, video, photo_video, document, music, voice, round or gif. The messages without them are never requested')
+    parser.add_argument('--min-date',
+                        dest='min_date',
+                        type=parse_date,
+                        default=None,
+                        help='Only the messages posted since this date, like 2024-05-01 or 2024-05-01T12:00 (UTC by default)')
+    parser.add_argument('--max-date',
+                        dest='max_date',
+                        type=parse_date,
+                        default=None,
+                        help='Only the messages posted before this date')
+    parser.add_argument('--min-size',
+                        dest='min_size',
+                        type=parse_size,
+                        default=None,
+                        help='Only the medias of this size or bigger, in bytes or with a unit like 10M')
+    parser.add_argument('--max-size',
+                        dest='max_size',
+                        type=parse_size,
+                        default=None,
+                        help='Only the medias of this size or smaller')
+    parser.add_argument('--mime',
+                        dest='mime_types',
+                        default=None,
+                        help='Only the medias of these MIME types, comma-separated, like video/*,image/jpeg')
     parser.add_argument('--infer-extension',
                         dest='infer_extension',
                         action='store_true',
@@ -112,39 +205,603 @@ def get_args():
                         action='store_true',
                         default=False,
                         help='Active the dry mode')
+    parser.add_argument('--concurrency',
+                        dest='concurrency',
+                        type=int,
+                        default=4,
+                        help='The number of message requests, and of downloads, running at the same time')
+    parser.add_argument('--metadata-concurrency',
+                        dest='metadata_concurrency',
+                        type=int,
+                        default=None,
+                        help='The max number of message requests running at the same time. By default, the same as --concurrency')
+    parser.add_argument('--transfer-concurrency',
+                        dest='transfer_concurrency',
+                        type=int,
+                        default=None,
+                        help='The max number of downloads running at the same time. By default, the same as --concurrency. '
+                             'The queued downloads of each channel start from the biggest, and the channels take turns')
+    parser.add_argument('--max-in-flight-bytes',
+                        dest='max_in_flight_bytes',
+                        type=parse_size,
+                        default=None,
+                        help='The max bytes of the files downloading at the same time, like 2G. A bigger file is downloaded alone')
+    parser.add_argument('--max-total-bytes',
+                        dest='max_total_bytes',
+                        type=parse_size,
+                        default=None,
+                        help='Stop planning downloads when their sizes add up to this, like 50G. The next medias are skipped')
+    parser.add_argument('--plan',
+                        dest='plan_filename',
+                        default=None,
+                        help='Save the planned downloads, with their filenames, sizes and MIME types, to this JSON file. Useful with --dry-run')
+    parser.add_argument('--parts',
+                        dest='parts',
+                        type=int,
+                        default=1,
+                        help='Download each big file requesting this number of parts at the same time')
+    parser.add_argument('--part-size',
+                        dest='part_size',
+                        type=int,
+                        default=PART_SIZE,
+                        help='The size in bytes of each part. It must be a multiple of 4096 that divides 1048576')
+    parser.add_argument('--fsync',
+                        dest='fsync',
+                        choices=FSYNC_POLICIES,
+                        default='never',
+                        help='When the downloaded data is flushed to the disk: never (the system decides), at the end of each file, or after each write')
+    parser.add_argument('--write-buffer',
+                        dest='write_buffer',
+                        type=parse_size,
+                        default=WRITE_BUFFER,
+                        help='The max bytes of each file waiting to be written to the disk, like 64M. The download waits when it is full')
+    parser.add_argument('--index',
+                        dest='index_filename',
+                        default=None,
+                        help='The SQLite file of the index of downloaded medias. The medias found in the index are not downloaded again')
+    parser.add_argument('--dedup',
+                        dest='dedup',
+                        choices=['skip', 'link'],
+                        default='skip',
+                        help='What to do with the medias found in the index: skip them, or create a hard link to the downloaded file')
+    parser.add_argument('--max-requests',
+                        dest='max_requests',
+                        type=int,
+                        default=None,
+                        help='The max number of Telegram requests running at the same time. It is reduced while Telegram asks to wait (FloodWait). By default, --concurrency multiplied by --parts')
+    parser.add_argument('--max-flood-wait',
+                        dest='max_flood_wait',
+                        type=float,
+                        default=None,
+                        help='Give up the requests when Telegram asks to wait more than these seconds')
+    parser.add_argument('--sync',
+                        dest='sync',
+                        action='store_true',
+                        default=False,
+                        help='Download the media of the messages newer than the last synced message of each channel. Use -C with a comma-separated list of channels')
+    parser.add_argument('--sync-state',
+                        dest='sync_state',
+                        default='sync.json',
+                        help='The file where the last synced message of each channel is saved')
+    parser.add_argument('--watch',
+                        dest='watch',
+                        action='store_true',
+                        default=False,
+                        help='Keep running and download the media of the new messages of the channels as they are posted. Use -C with a comma-separated list of channels. With --sync, the missed messages are downloaded first')
+    parser.add_argument('--stats',
+                        dest='stats_filename',
+                        default=None,
+                        help='Append the timings of each download to this file as JSON lines, and the totals at the end')
+    parser.add_argument('--checksum',
+                        dest='checksum',
+                        choices=CHECKSUM_ALGORITHMS,
+                        default=None,
+                        help='Hash each file while it is written, without reading it again. xxh64 needs the xxhash package')
+    parser.add_argument('--manifest',
+                        dest='manifest_filename',
+                        default=None,
+                        help='Append an entry of each downloaded file (ids, size, checksum, path and timings) to this file as JSON lines')
+    parser.add_argument('--metrics-port',
+                        dest='metrics_port',
+                        type=int,
+                        default=None,
+                        help='Serve the totals of the downloads for Prometheus on this local port')
+    parser.add_argument('--log-level',
+                        dest='log_level',
+                        choices=['debug', 'info', 'warning', 'error'],
+                        default='info',
+                        help='The minimum level of the logged messages')
+    parser.add_argument('--log-format',
+                        dest='log_format',
+                        choices=['text', 'json'],
+                        default='text',
+                        help='Log colored text, or a JSON object per line')
+    parser.add_argument('--progress-interval',
+                        dest='progress_interval',
+                        type=float,
+                        default=5.0,
+                        help='Log the progress of the downloads at most once every these seconds')
     return cast(Arguments, parser.parse_args())
 
 
-def generate_unique_filename(
-        filepath: str,
+def prompt(text: str) -> str:
+    """Ask the user for a value, with line editing.
+
+    Args:
+        text (str): The prompt.
+
+    Returns:
+        str: The answer.
+    """
+    # pylint: disable=unused-import
+    import readline
+    return input(text)
+
+
+def get_files(target: 'Target', file: str) -> list[str]:
+    """Get the downloaded files of a target.
+
+    Args:
+        target (Target): The target.
+        file (str): The downloaded filename returned for the target.
+
+    Returns:
+        list[str]: The file of each item if the media had several, or the
+        returned filename.
+    """
+    if target.stats is not None and target.stats.files:
+        return target.stats.files
+    return [file]
+
+
+def create_planner(
+        output_filename: Optional[str],
         is_detailed: bool,
-        detail: Optional[str],
-        exclude_names: Optional[list[str]] = None
-        ) -> str:
-    """Generate a new filename based the config. If the filename exists, add a new counter in the name.
+        shard_size: Optional[int] = None,
+        infer_extension: bool = False,
+        ) -> OutputPlanner:
+    """Create the planner of the output filenames.
+
+    The output filename can be a template (see `OutputPlanner`). If it is a
+    plain filename, the detailed name adds the channel and message IDs to it,
+    and the inferred extension is added at the end.
 
     Args:
-        filepath (str): The file path.
+        output_filename (Optional[str]): The base output filename or template.
         is_detailed (bool): Active the detailed filename.
-        detail (Optional[str]): The extra data. If it is None, a random number will be used.
+        shard_size (Optional[int]): The messages per subdirectory.
+        infer_extension (bool): Add the extension to a plain filename.
 
     Returns:
-        str: The new filename.
+        OutputPlanner: The planner.
+    """
+    return OutputPlanner(to_template(output_filename or 'file', is_detailed, infer_extension), shard_size)
+
+
+def iter_batches(sources: list[tuple[str, str]]) -> Iterator[Batch]:
+    """Expand the message IDs of the sources lazily into batches of targets.
+
+    The message ID ranges of each source are merged, so every message is
+    requested once. The sources are taken in turns, one batch at a time.
+
+    Args:
+        sources (list[tuple[str, str]]): The channel ID and the message ID
+            ranges of each source, as they were written.
+
+    Yields:
+        Batch: The next batch of targets.
+    """
+    from rcdtool.rcdtool import Target, MESSAGES_BATCH_SIZE
+
+    def source_batches(channel_id: str, message_ids: str) -> Iterator[Batch]:
+        updated_channel_id = utils.parse_channel_id(channel_id)
+        ranges = utils.merge_ranges(utils.parse_ranges(message_ids))
+        logger.debug('ranges of %s: %s', channel_id, ranges)
+
+        for chunk in utils.chunks(utils.iter_ranges(ranges), MESSAGES_BATCH_SIZE):
+            yield updated_channel_id, [
+                Target(updated_channel_id, message_id, channel_name=channel_id)
+                for message_id in chunk
+            ]
+
+    yield from utils.interleave(*[
+        source_batches(channel_id, message_ids)
+        for channel_id, message_ids in sources
+    ])
+
+
+def iter_target_batches(lines: Iterable[TargetLine]) -> Iterator[Batch]:
+    """Group the targets of a stream of lines by channel, on the fly.
+
+    The targets of a channel are yielded as a batch when there are enough of
+    them for a request. When too many targets are pending, the biggest group
+    is yielded even if it is not full, so the memory stays bounded whatever
+    the length of the input.
+
+    Args:
+        lines (Iterable[TargetLine]): The channel ID, the message IDs and the
+            output of each line, as they were written.
+
+    Yields:
+        Batch: The next batch of targets.
+    """
+    from rcdtool.rcdtool import Target, MESSAGES_BATCH_SIZE
+
+    max_pending = MESSAGES_BATCH_SIZE * 10
+    groups: dict[Union[int, str], list['Target']] = {}
+    pending = 0
+
+    for channel_id, message_ids, output in lines:
+        updated_channel_id = utils.parse_channel_id(channel_id)
+        for message_id in utils.iter_ranges(utils.parse_ranges(message_ids)):
+            group = groups.setdefault(updated_channel_id, [])
+            group.append(Target(updated_channel_id, message_id, channel_name=channel_id, output=output))
+            pending += 1
+
+            if len(group) >= MESSAGES_BATCH_SIZE:
+                pending -= len(group)
+                yield updated_channel_id, groups.pop(updated_channel_id)
+            elif pending >= max_pending:
+                biggest = max(groups, key=lambda key: len(groups[key]))
+                pending -= len(groups[biggest])
+                yield biggest, groups.pop(biggest)
+
+    yield from groups.items()
+
+
+async def iter_comment_batches(
+        rcd_tool: 'RCD',
+        sources: list[tuple[str, str]],
+        comment_ids: str,
+        ) -> AsyncIterator[Batch]:
+    """Expand the comment IDs in the discussion groups of the sources into batches.
+
+    The discussion group of each channel is found from its first post (see
+    `RCD.get_discussion_group`), then the comments are requested in batches
+    like any other messages.
+
+    Args:
+        rcd_tool (RCD): The RCD object.
+        sources (list[tuple[str, str]]): The channel ID and the message ID
+            ranges of each source, as they were written.
+        comment_ids (str): The comment ID ranges, in the discussion groups.
+
+    Yields:
+        Batch: The next batch of targets.
+    """
+    from rcdtool.rcdtool import Target, MESSAGES_BATCH_SIZE
+
+    ranges = utils.merge_ranges(utils.parse_ranges(comment_ids))
+    group_ids: set[int] = set()
+
+    for channel_id, message_ids in sources:
+        updated_channel_id = utils.parse_channel_id(channel_id)
+        post_id = next(utils.iter_ranges(utils.merge_ranges(utils.parse_ranges(message_ids))), None)
+        if post_id is None:
+            continue
+        account = await rcd_tool.find_account(updated_channel_id)
+        if account is None:
+            # no account can see it, the comments of the other sources are downloaded
+            continue
+        group_id = await rcd_tool.get_discussion_group(updated_channel_id, post_id, account)
+        if group_id is None or group_id in group_ids:
+            continue
+        group_ids.add(group_id)
+        logger.debug('comments of %s are in %s', channel_id, group_id)
+
+        for chunk in utils.chunks(utils.iter_ranges(ranges), MESSAGES_BATCH_SIZE):
+            yield group_id, [
+                Target(group_id, comment_id, account=account)
+                for comment_id in chunk
+            ]
+
+
+async def iter_search_batches(
+        rcd_tool: 'RCD',
+        sources: list[tuple[str, str]],
+        media_kinds: list[str],
+        min_date: Optional[datetime] = None,
+        max_date: Optional[datetime] = None,
+        ) -> AsyncIterator[Batch]:
+    """Search the messages of the sources with some kinds of media.
+
+    Telegram filters the messages by kind, message ID and date (see
+    `RCD.search_media`), so only the messages with those medias become
+    targets.
+
+    Args:
+        rcd_tool (RCD): The RCD object.
+        sources (list[tuple[str, str]]): The channel ID and the message ID
+            ranges of each source, as they were written.
+        media_kinds (list[str]): The media kinds.
+        min_date (Optional[datetime]): Only the messages posted since this
+            date.
+        max_date (Optional[datetime]): Only the messages posted before this
+            date.
+
+    Yields:
+        Batch: The next batch of targets, with their messages.
+    """
+    from rcdtool.rcdtool import Target
+
+    for channel_id, message_ids in sources:
+        updated_channel_id = utils.parse_channel_id(channel_id)
+        ranges = utils.merge_ranges(utils.parse_ranges(message_ids))
+        account = await rcd_tool.find_account(updated_channel_id)
+        if account is None:
+            # no account can see it, the other sources are searched
+            continue
+
+        # some kinds overlap, like photo and photo_video
+        found_ids: set[int] = set()
+        for kind in media_kinds:
+            async for messages in rcd_tool.search_media(
+                updated_channel_id,
+                kind,
+                ranges,
+                min_date,
+                max_date,
+                account,
+            ):
+                targets = [
+                    Target(
+                        updated_channel_id,
+                        message.id,
+                        message=message,
+                        channel_name=channel_id,
+                        account=account,
+                    )
+                    for message in messages
+                    if message.id not in found_ids
+                ]
+                if len(media_kinds) > 1:
+                    found_ids.update(target.message_id for target in targets)
+                if targets:
+                    yield updated_channel_id, targets
+
+
+async def iter_sync_batches(
+        rcd_tool: 'RCD',
+        channel_ids: list[str],
+        tracker: SyncTracker,
+        ) -> AsyncIterator[Batch]:
+    """Page through the messages newer than the sync marks of the channels.
+
+    Only the messages with media become targets. Each page is recorded in
+    the tracker, so the mark can move past the messages without media.
+
+    Args:
+        rcd_tool (RCD): The RCD object.
+        channel_ids (list[str]): The channel IDs, as they were written.
+        tracker (SyncTracker): The tracker of the sync marks.
+
+    Yields:
+        Batch: The next batch of targets, with their messages.
     """
-    directory, filename = os.path.split(filepath)
-    name, ext = os.path.splitext(filename)
+    from rcdtool.rcdtool import Target
 
-    if is_detailed:
-        name += f'-{detail or random.randint(1000, 9999)}'
+    for channel_id in channel_ids:
+        updated_channel_id = utils.parse_channel_id(channel_id)
+        min_id = tracker.state.get(updated_channel_id)
+        logger.info('syncing %s from message %d', channel_id, min_id)
+        account = await rcd_tool.find_account(updated_channel_id)
+        if account is None:
+            # no account can see it, the other channels are synced
+            continue
+
+        async for messages in rcd_tool.iter_history(updated_channel_id, min_id, account):
+            targets = [
+                Target(
+                    updated_channel_id,
+                    message.id,
+                    message=message,
+                    channel_name=channel_id,
+                    account=account,
+                )
+                for message in messages
+                if message.media is not None
+            ]
+            tracker.page(updated_channel_id, messages[-1].id, [target.message_id for target in targets])
+            if targets:
+                yield updated_channel_id, targets
+
+
+async def iter_watch_batches(
+        rcd_tool: 'RCD',
+        channel_ids: list[str],
+        tracker: SyncTracker,
+        catch_up: Optional[AsyncIterable[Batch]] = None,
+        ) -> AsyncIterator[Batch]:
+    """Turn the new messages with media of the channels into targets.
+
+    Each message becomes a batch of one target, that already has its message.
+    The new messages are received before the batches of the catch-up (like
+    `iter_sync_batches`) are yielded, and wait until they are done, so no post
+    is missed meanwhile. The ones that the catch-up already paged are
+    dropped.
+
+    Args:
+        rcd_tool (RCD): The RCD object.
+        channel_ids (list[str]): The channel IDs, as they were written.
+        tracker (SyncTracker): The tracker of the sync marks.
+        catch_up (Optional[AsyncIterable[Batch]]): The batches of the missed
+            messages.
+
+    Yields:
+        Batch: The next batch of targets, with their messages.
+    """
+    from rcdtool.rcdtool import Target
+
+    updated_channel_ids = [utils.parse_channel_id(channel_id) for channel_id in channel_ids]
+    # the channels as they were written, for the output filenames
+    channel_names = dict(zip(updated_channel_ids, channel_ids))
+    subscribed = asyncio.Event()
+    # the new messages, None marks the end
+    received: asyncio.Queue = asyncio.Queue()
+
+    async def receive():
+        try:
+            async for item in rcd_tool.iter_new_messages(updated_channel_ids, subscribed):
+                received.put_nowait(item)
+        finally:
+            received.put_nowait(None)
+
+    receiver = asyncio.ensure_future(receive())
+    waiter = asyncio.ensure_future(subscribed.wait())
+    try:
+        await asyncio.wait((receiver, waiter), return_when=asyncio.FIRST_COMPLETED)
+        if catch_up is not None:
+            async for batch in catch_up:
+                yield batch
+
+        while True:
+            item = await received.get()
+            if item is None:
+                # raise the error of the receiver, if any
+                await receiver
+                return
+            channel_id, message, account = item
+            if message.id <= tracker.last_paged(channel_id):
+                logger.debug('message %s of %s was caught up', message.id, channel_id)
+                continue
+            if message.media is None:
+                tracker.page(channel_id, message.id)
+                continue
+            logger.info('new message %s in %s', message.id, channel_id)
+            tracker.page(channel_id, message.id, [message.id])
+            yield channel_id, [
+                Target(
+                    channel_id,
+                    message.id,
+                    message=message,
+                    channel_name=channel_names.get(channel_id),
+                    account=account,
+                )
+            ]
+    finally:
+        for task in (receiver, waiter):
+            task.cancel()
+        await asyncio.gather(receiver, waiter, return_exceptions=True)
+
+
+async def download_targets(
+        rcd_tool: 'RCD',
+        batches: AsyncIterable[Batch],
+        generate_filename: FilenameGenerator,
+        args: Arguments,
+        ) -> AsyncIterator[tuple['Target', Optional[str]]]:
+    """Fetch the messages of the targets, then download their media, with the
+    options of the CLI arguments (see `download_batches`).
+
+    With `--plan`, the planned downloads are saved there at the end.
+
+    Args:
+        rcd_tool (RCD): The RCD object.
+        batches (AsyncIterable[Batch]): The batches of targets.
+        generate_filename (FilenameGenerator): The function that returns the
+            output filename of each target without one.
+        args (Arguments): The CLI arguments.
+
+    Yields:
+        tuple[Target, Optional[str]]: Each target and its downloaded filename,
+        in order.
+    """
+    report = PlanReport() if args.plan_filename else None
+    options = PipelineOptions(
+        concurrency=args.concurrency,
+        metadata_concurrency=args.metadata_concurrency,
+        transfer_concurrency=args.transfer_concurrency,
+        infer_extension=args.infer_extension,
+        albums=args.albums,
+        media_filter=MediaFilter(
+            args.min_size,
+            args.max_size,
+            tuple(mime_type.strip() for mime_type in (args.mime_types or '').split(',') if mime_type.strip()),
+            args.min_date,
+            args.max_date,
+        ),
+        max_in_flight_bytes=args.max_in_flight_bytes,
+        max_total_bytes=args.max_total_bytes,
+        report=report,
+        progress_interval=args.progress_interval,
+    )
+    results = download_batches(rcd_tool, batches, generate_filename, options)
+    try:
+        async for result in results:
+            yield result
+    finally:
+        await results.aclose()
+        if report is not None:
+            report.save(cast(str, args.plan_filename))
+
+
+async def sync_channels(rcd_tool: 'RCD', channel_ids: list[str], args: Arguments):
+    """Download the media of the new messages of the channels.
+
+    With `--sync`, the messages newer than the mark of each channel are
+    downloaded first. With `--watch`, the new posts are downloaded as they
+    arrive, until the tool is stopped.
 
-    new_filepath = os.path.join(directory, name + ext)
-    counter = 1
+    The mark of a channel moves forward while its downloads succeed, up to
+    the last paged message (see `SyncTracker`), so the next sync continues
+    from the first failed download, and does not page the messages without
+    media again. In dry mode, the marks are not saved.
+
+    Args:
+        rcd_tool (RCD): The RCD object.
+        channel_ids (list[str]): The channel IDs, as they were written.
+        args (Arguments): The CLI arguments.
+    """
+    state = SyncState(args.sync_state)
+    tracker = SyncTracker(state)
+    generate_filename = filename_generator(rcd_tool.planner, bool(args.infer_extension))
+
+    batches = iter_sync_batches(rcd_tool, channel_ids, tracker)
+    if args.watch:
+        # the missed messages are caught up once the new ones are received
+        batches = iter_watch_batches(rcd_tool, channel_ids, tracker, batches if args.sync else None)
+
+    try:
+        async for target, file in download_targets(rcd_tool, batches, generate_filename, args):
+            # the filtered medias are skipped on purpose
+            skipped = target.stats is not None and target.stats.status == 'skipped'
+            tracker.done(target.channel_id, target.message_id, file is not None or skipped)
+            if file is not None:
+                print(*get_files(target, file), sep='\n', flush=True)
+            if args.watch and not args.dry_mode:
+                state.save()
+    finally:
+        if not args.dry_mode:
+            state.save()
+
+
+async def download_target_file(rcd_tool: 'RCD', generate_filename: FilenameGenerator, args: Arguments):
+    """Download the targets of a file, or of the standard input, as they are read.
+
+    The lines are read in a thread, so a slow input (like a pipe) does not
+    block the downloads.
 
-    while os.path.exists(new_filepath) or new_filepath in (exclude_names or []):
-        new_filepath = os.path.join(directory, f"{name}-{counter}{ext}")
-        counter += 1
+    Args:
+        rcd_tool (RCD): The RCD object.
+        generate_filename (FilenameGenerator): The function that returns the
+            output filename of each target.
+        args (Arguments): The CLI arguments.
+    """
+    filename = cast(str, args.targets_filename)
+    target_format = guess_format(filename) if args.targets_format == 'auto' else args.targets_format
 
-    return new_filepath
+    if filename == '-':
+        file = sys.stdin
+    else:
+        file = open(filename, encoding='utf-8', newline='')
+    try:
+        batches = iter_target_batches(iter_target_lines(file, target_format))
+        async for target, output in download_targets(rcd_tool, utils.aiterate_in_thread(batches), generate_filename, args):
+            if output:
+                print(*get_files(target, output), sep='\n', flush=True)
+    finally:
+        if file is not sys.stdin:
+            file.close()
 
 
 def main():
@@ -152,84 +809,109 @@ def main():
     The main method.
     """
     args = get_args()
+    logger.configure(args.log_level, json_format=args.log_format == 'json')
+
+    from rcdtool.rcdtool import RCD
+
+    rcd_tool = RCD(
+        args.config_filename,
+        dry_mode=args.dry_mode,
+        parts=args.parts,
+        part_size=args.part_size,
+        index_filename=args.index_filename,
+        dedup=args.dedup,
+        max_requests=args.max_requests or args.concurrency * max(1, args.parts),
+        max_flood_wait=args.max_flood_wait,
+        stats_filename=args.stats_filename,
+        fsync=args.fsync,
+        write_buffer=args.write_buffer,
+        checksum=args.checksum,
+        manifest_filename=args.manifest_filename,
+        planner=create_planner(
+            args.output_filename,
+            bool(args.detailed_name),
+            args.shard_size,
+            bool(args.infer_extension),
+        ),
+    )
 
-    rcd_tool = RCD(args.config_filename, dry_mode=args.dry_mode)
-
-    raw_targets: list[tuple[int|str, int]] = []
+    def run(coroutine):
+        async def run_with_metrics():
+            server = None
+            if args.metrics_port:
+                server = await rcd_tool.metrics.serve(args.metrics_port)
+            try:
+                await coroutine
+            finally:
+                if server is not None:
+                    server.close()
+                    await server.wait_closed()
+        loop = rcd_tool.client.loop
+        task = loop.create_task(run_with_metrics())
+        try:
+            loop.run_until_complete(task)
+        except KeyboardInterrupt:
+            # stop the downloads, so the sync marks are saved
+            task.cancel()
+            loop.run_until_complete(asyncio.gather(task, return_exceptions=True))
+            raise
+        finally:
+            rcd_tool.metrics.close()
+            if rcd_tool.manifest is not None:
+                rcd_tool.manifest.close()
+
+    if args.sync or args.watch:
+        channel_ids = [
+            channel_id.strip()
+            for channel_id in (args.channel_id or prompt('Channel IDs: ')).split(',')
+            if channel_id.strip()
+        ]
+        try:
+            run(sync_channels(rcd_tool, channel_ids, args))
+        except KeyboardInterrupt:
+            logger.info('stopped')
+        return
+
+    generate_filename = filename_generator(rcd_tool.planner, bool(args.infer_extension))
+
+    if args.targets_filename is not None:
+        run(download_target_file(rcd_tool, generate_filename, args))
+        return
+
+    sources: list[tuple[str, str]] = []
 
     if args.link is None:
-        channel_id = args.channel_id or input('Channel ID: ')
+        channel_id = args.channel_id or prompt('Channel ID: ')
         if not channel_id.isdigit():
             logger.warning('channel id is not a digit: %s', channel_id)
 
-        message_id_input = args.message_id or input('Message ID: ')
-        range_message_id = utils.parse_ranges(message_id_input)
-
-        for (start, end) in range_message_id:
-            logger.debug('range(%s, %s)', start, end)
-            for current_message_id in range(start, end + 1):
-                raw_targets.append((channel_id, current_message_id))
-        logger.debug('target: %s', raw_targets)
+        message_id_input = args.message_id or prompt('Message ID: ')
+        sources.append((channel_id, message_id_input))
     else:
         links: list[str] = []
 
         links = (
-            [input('Message link: ')]
+            [prompt('Message link: ')]
             if not args.link
             else [link.strip() for link in args.link.split(';')]
         )
-        
+
         for link in links:
             logger.debug('current link: %s', link)
-            channel_id, message_id = link.split('/')[-2:]
+            channel_id, message_id = parse_link(link)
             logger.debug('current message_id options: %s', message_id)
-            message_id_list: list[str] = []
-            range_message_id = utils.parse_ranges(message_id)
-
-            for (start, end) in range_message_id:
-                logger.debug('range(%s, %s)', start, end)
-                for current_message_id in range(start, end + 1):
-                    raw_targets.append((channel_id, current_message_id))
-            logger.debug('target: %s', raw_targets)
+            sources.append((channel_id, message_id))
 
-    output_filename: Optional[str] = args.output_filename
+    if args.discussion_message_id:
+        batches = iter_comment_batches(rcd_tool, sources, args.discussion_message_id)
+    elif args.media_kinds:
+        batches = iter_search_batches(rcd_tool, sources, args.media_kinds, args.min_date, args.max_date)
+    else:
+        batches = utils.aiterate(iter_batches(sources))
 
-    coros: list[Coroutine[None, None, Optional[str]]] = []
+    async def print_files():
+        async for target, file in download_targets(rcd_tool, batches, generate_filename, args):
+            if file:
+                print(*get_files(target, file), sep='\n')
 
-    exclude_names: list[str] = []
-    for channel_id, message_id in raw_targets:
-        updated_channel_id = utils.parse_channel_id(channel_id)
-        updated_message_id = utils.parse_message_id(message_id)
-        logger.debug('downloading from %s:%s', channel_id,message_id)
-
-        # Get the output filename
-        if output_filename is None:
-            output_filename = 'file'
-        final_output_filename = generate_unique_filename(
-            output_filename,
-            bool(args.detailed_name),
-            f'-{channel_id}-{message_id}',
-            exclude_names,
-        )
-        logger.debug('output filename: %s', final_output_filename)
-        exclude_names.append(final_output_filename)
-
-        coro = rcd_tool.download_media(
-            channel_id=updated_channel_id,
-            message_id=updated_message_id,
-            output_filename=final_output_filename,
-            infer_extension=args.infer_extension,
-            discussion_message_id=utils.parse_message_id(args.discussion_message_id) if args.discussion_message_id is not None else None,
-        )
-        coros.append(coro)
-
-    tasks = [
-        asyncio.ensure_future(coro)
-        for coro in coros
-    ]
-    logger.debug('%d tasks', len(tasks))
-    files = rcd_tool.client.loop.run_until_complete(asyncio.gather(*tasks))
-    logger.debug('files: %s', files)
-    for file in files:
-        if file:
-            print(file)
+    run(print_files())
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+
+# MIT License
+#
+# Copyright (c) 2025 David256
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Metrics of the downloads
+"""
+import json
+import time
+import asyncio
+import contextvars
+from dataclasses import asdict, dataclass, field
+from typing import IO, Optional, Union
+
+from rcdtool.log import logger
+
+
+@dataclass
+class DownloadStats:
+    """Timings and counters of one download.
+
+    The times are in seconds. `status` is one of "downloaded", "skipped",
+    "dry-run" or "failed", and `reason` explains the last two. `files` has the
+    file of each item when a message has several (a paid media).
+    """
+    channel_id: Union[int, str]
+    message_id: int
+    output_filename: Optional[str] = None
+    status: str = 'failed'
+    reason: Optional[str] = None
+    resolve: float = 0.0
+    metadata: float = 0.0
+    first_byte: Optional[float] = None
+    transfer: float = 0.0
+    rename: float = 0.0
+    bytes: int = 0
+    retries: int = 0
+    flood_waits: int = 0
+    files: list[str] = field(default_factory=list)
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def throughput(self) -> float:
+        """The transfer speed in bytes per second."""
+        return self.bytes / self.transfer if self.transfer > 0 else 0.0
+
+    def add_bytes(self, size: int):
+        """Count the transferred bytes, and the time of the first ones.
+
+        Args:
+            size (int): The transferred bytes.
+        """
+        if self.first_byte is None:
+            self.first_byte = time.monotonic() - self.started_at
+        self.bytes += size
+
+    def to_dict(self) -> dict:
+        """Get the stats as a JSON serializable dict.
+
+        Returns:
+            dict: The stats.
+        """
+        data = asdict(self)
+        del data['started_at']
+        data['throughput'] = self.throughput
+        return data
+
+
+# The stats of the download running in the current task
+current_stats: contextvars.ContextVar[Optional[DownloadStats]] = contextvars.ContextVar('current_stats', default=None)
+
+
+class Metrics:
+    """Totals of the downloads.
+
+    Each finished download is added to the totals and, if a stats filename
+    is given, appended there as a JSON line.
+    """
+
+    def __init__(self, stats_filename: Optional[str] = None):
+        self.stats_file: Optional[IO[str]] = None
+        if stats_filename:
+            self.stats_file = open(stats_filename, 'a', encoding='utf-8')
+        self.started_at = time.monotonic()
+        self.downloads: dict[str, int] = {}
+        self.bytes = 0
+        self.transfer_seconds = 0.0
+        self.retries = 0
+        self.flood_waits = 0
+
+    def record(self, stats: DownloadStats):
+        """Add a finished download.
+
+        Args:
+            stats (DownloadStats): The stats of the download.
+        """
+        self.downloads[stats.status] = self.downloads.get(stats.status, 0) + 1
+        self.bytes += stats.bytes
+        self.transfer_seconds += stats.transfer
+        self.retries += stats.retries
+        self.flood_waits += stats.flood_waits
+        if self.stats_file is not None:
+            self.stats_file.write(json.dumps(stats.to_dict()) + '\n')
+            self.stats_file.flush()
+
+    def summary(self) -> dict:
+        """Get the totals.
+
+        Returns:
+            dict: The totals.
+        """
+        elapsed = time.monotonic() - self.started_at
+        return {
+            'downloads': dict(self.downloads),
+            'bytes': self.bytes,
+            'seconds': elapsed,
+            'throughput': self.bytes / elapsed if elapsed > 0 else 0.0,
+            'retries': self.retries,
+            'flood_waits': self.flood_waits,
+        }
+
+    def close(self):
+        """Log the totals and write them as the last JSON line."""
+        summary = self.summary()
+        logger.info(
+            'downloads: %s, %.1f MB in %.1f s (%.2f MB/s), %d retries, %d FloodWaits',
+            summary['downloads'],
+            summary['bytes'] / 1e6,
+            summary['seconds'],
+            summary['throughput'] / 1e6,
+            summary['retries'],
+            summary['flood_waits'],
+        )
+        if self.stats_file is not None:
+            self.stats_file.write(json.dumps({'summary': summary}) + '\n')
+            self.stats_file.close()
+            self.stats_file = None
+
+    def to_prometheus(self) -> str:
+        """Get the totals in the Prometheus text format.
+
+        Returns:
+            str: The metrics.
+        """
+        lines = [
+            '# HELP rcdtool_downloads_total Finished downloads by status.',
+            '# TYPE rcdtool_downloads_total counter',
+        ]
+        for status, count in sorted(self.downloads.items()):
+            lines.append(f'rcdtool_downloads_total{{status="{status}"}} {count}')
+        lines += [
+            '# HELP rcdtool_bytes_total Downloaded bytes.',
+            '# TYPE rcdtool_bytes_total counter',
+            f'rcdtool_bytes_total {self.bytes}',
+            '# HELP rcdtool_transfer_seconds_total Time spent transferring.',
+            '# TYPE rcdtool_transfer_seconds_total counter',
+            f'rcdtool_transfer_seconds_total {self.transfer_seconds}',
+            '# HELP rcdtool_retries_total Retried requests.',
+            '# TYPE rcdtool_retries_total counter',
+            f'rcdtool_retries_total {self.retries}',
+            '# HELP rcdtool_flood_waits_total FloodWaits received.',
+            '# TYPE rcdtool_flood_waits_total counter',
+            f'rcdtool_flood_waits_total {self.flood_waits}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+    async def serve(self, port: int, host: str = '127.0.0.1') -> asyncio.AbstractServer:
+        """Serve the metrics over HTTP for Prometheus.
+
+        Args:
+            port (int): The port.
+            host (str, optional): The host. Defaults to '127.0.0.1'.
+
+        Returns:
+            asyncio.AbstractServer: The running server.
+        """
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            try:
+                # read the request headers, any path returns the metrics
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                body = self.to_prometheus().encode()
+                writer.write(
+                    b'HTTP/1.1 200 OK\r\n'
+                    b'Content-Type: text/plain; version=0.0.4\r\n'
+                    + f'Content-Length: {len(body)}\r\n'.encode()
+                    + b'Connection: close\r\n\r\n'
+                    + body
+                )
+                await writer.drain()
+            finally:
+                writer.close()
+
+        server = await asyncio.start_server(handle, host, port)
+        logger.info('serving the metrics on http://%s:%d/metrics', host, port)
+        return server
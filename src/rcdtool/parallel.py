@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+# MIT License
+#
+# Copyright (c) 2025 David256
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Download of a file by parts at the same time
+"""
+import asyncio
+from typing import Awaitable, BinaryIO, Callable, Container, Optional, Union
+
+from rcdtool.log import logger
+from rcdtool.writer import FileWriter, preallocate, write_at
+
+
+# The Telegram API accepts parts of 4 KB multiples, dividing 1 MB
+MIN_PART_SIZE = 4 * 1024
+MAX_PART_SIZE = 1024 * 1024
+PART_SIZE = 512 * 1024
+
+# Function that returns `limit` bytes of the file from `offset`
+FetchPart = Callable[[int, int], Awaitable[bytes]]
+
+
+def check_part_size(part_size: int):
+    """Check if the part size is accepted by the Telegram API.
+
+    Args:
+        part_size (int): The part size in bytes.
+
+    Raises:
+        ValueError: If the part size is not valid.
+    """
+    if (
+        part_size < MIN_PART_SIZE
+        or part_size > MAX_PART_SIZE
+        or part_size % MIN_PART_SIZE != 0
+        or MAX_PART_SIZE % part_size != 0
+    ):
+        raise ValueError(
+            f'The part size must be a multiple of {MIN_PART_SIZE} that divides {MAX_PART_SIZE}: {part_size}'
+        )
+
+
+async def download_parts(fetch_part: FetchPart,
+                         file: Union[BinaryIO, FileWriter],
+                         size: int,
+                         part_size: int = PART_SIZE,
+                         concurrency: int = 4,
+                         completed: Container[int] = (),
+                         on_part: Optional[Callable[[int], None]] = None,
+                         ) -> int:
+    """Download a file of known size requesting several parts at the same time.
+
+    The file is preallocated and each part is written in its position as soon
+    as it arrives. With a `FileWriter`, the parts are queued to it, and it
+    preallocates the file and reports the written parts instead of `on_part`.
+
+    Args:
+        fetch_part (FetchPart): The function that requests a part.
+        file (Union[BinaryIO, FileWriter]): The output file, opened for
+            writing, or its writer.
+        size (int): The file size in bytes.
+        part_size (int, optional): The size of each part. Defaults to PART_SIZE.
+        concurrency (int, optional): The number of parts requested at the same
+            time. Defaults to 4.
+        completed (Container[int], optional): The offsets of the parts that
+            are already in the file, they are not requested again.
+        on_part (Optional[Callable[[int], None]], optional): Called with the
+            offset of each part after it is written.
+
+    Raises:
+        IOError: If the server returns a part shorter than expected.
+
+    Returns:
+        int: The number of written bytes.
+    """
+    check_part_size(part_size)
+    if not isinstance(file, FileWriter):
+        preallocate(file, size)
+
+    offsets = asyncio.Queue()
+    for offset in range(0, size, part_size):
+        if offset not in completed:
+            offsets.put_nowait(offset)
+    logger.debug('downloading %d parts of %d bytes', offsets.qsize(), part_size)
+
+    written = 0
+
+    async def worker():
+        nonlocal written
+        while not offsets.empty():
+            offset = offsets.get_nowait()
+            expected = min(part_size, size - offset)
+            data = await fetch_part(offset, part_size)
+            if len(data) < expected:
+                raise IOError(f'Got {len(data)} of {expected} bytes at offset {offset}')
+            if isinstance(file, FileWriter):
+                await file.write(offset, data[:expected])
+            else:
+                write_at(file, offset, data[:expected])
+                if on_part is not None:
+                    on_part(offset)
+            written += expected
+
+    workers = [
+        asyncio.ensure_future(worker())
+        for _ in range(min(concurrency, offsets.qsize()))
+    ]
+    try:
+        await asyncio.gather(*workers)
+    except BaseException:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        raise
+    return written
@@ -0,0 +1,530 @@
+#!/usr/bin/env python
+
+# MIT License
+#
+# Copyright (c) 2025 David256
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Pipeline that fetches the messages of the targets and downloads their media
+"""
+# `rcdtool.rcdtool` imports Telethon, so it is imported only when the pipeline
+# runs, and the CLI can import this module at startup.
+# pylint: disable=import-outside-toplevel
+import time
+import asyncio
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, AsyncIterable, AsyncIterator, Callable, Optional, Union
+
+from rcdtool.metrics import DownloadStats
+from rcdtool.scheduler import ByteBudget, Scheduler
+from rcdtool.planner import OutputPlanner, PlanReport, to_template
+from rcdtool.filters import MediaFilter
+from rcdtool.log import Progress, logger
+
+if TYPE_CHECKING:
+    from rcdtool.rcdtool import RCD, Target
+
+
+# The channel ID and the targets of a batch
+Batch = tuple[Union[int, str], list['Target']]
+
+# Function that returns the output filename of a channel, message ID,
+# extension and the output given for the target, if any
+FilenameGenerator = Callable[
+    [Union[int, str], int, str, Optional[str], Optional[tuple[str, int]], Optional[int]],
+    str,
+]
+
+
+@dataclass
+class PipelineOptions:
+    """Options of `download_batches`.
+
+    The message requests and the downloads run `concurrency` jobs each,
+    unless `metadata_concurrency` or `transfer_concurrency` are given.
+    `progress_interval` is None to not log the progress.
+    """
+    concurrency: int = 4
+    metadata_concurrency: Optional[int] = None
+    transfer_concurrency: Optional[int] = None
+    infer_extension: Optional[bool] = None
+    albums: bool = False
+    media_filter: Optional[MediaFilter] = None
+    max_in_flight_bytes: Optional[int] = None
+    max_total_bytes: Optional[int] = None
+    report: Optional[PlanReport] = None
+    progress_interval: Optional[float] = None
+
+
+def filename_generator(planner: OutputPlanner, infer_extension: bool = False) -> FilenameGenerator:
+    """Create a function that returns a unique output filename for each target.
+
+    Args:
+        planner (OutputPlanner): The planner of the output filenames.
+        infer_extension (bool): Add the extension to the plain filenames of
+            the targets.
+
+    Returns:
+        FilenameGenerator: The function that takes the channel ID, the
+        message ID, the extension and the output of the target, and returns
+        the output filename. For an item of an album, it also takes the
+        output filename of the album, without extension, and the position of
+        the item. The media id, if it is known, gets back the files of a
+        previous run (see `OutputPlanner.claim`).
+    """
+    def generate(channel_id: Union[int, str],
+                 message_id: int,
+                 ext: str = '',
+                 output: Optional[str] = None,
+                 item: Optional[tuple[str, int]] = None,
+                 media_id: Optional[int] = None,
+                 ) -> str:
+        if item is not None:
+            return planner.plan_item(*item, ext, media_id)
+        template = to_template(output, infer_extension=infer_extension) if output else None
+        return planner.plan(channel_id, message_id, ext, template, media_id)
+
+    return generate
+
+
+async def group_targets(targets: AsyncIterable['Target']) -> AsyncIterator[Batch]:
+    """Group a stream of targets by channel into batches, on the fly.
+
+    The targets of a channel are yielded as a batch when there are enough of
+    them for a request. When the input has no more targets ready, all the
+    groups are yielded, so a slow input does not hold the targets back. When
+    too many targets are pending, the biggest group is yielded even if it is
+    not full.
+
+    Args:
+        targets (AsyncIterable[Target]): The targets.
+
+    Yields:
+        Batch: The next batch of targets.
+    """
+    from rcdtool.rcdtool import MESSAGES_BATCH_SIZE
+
+    max_pending = MESSAGES_BATCH_SIZE * 10
+    # the targets read ahead; the end is marked with None, or the error
+    queue: asyncio.Queue[Union['Target', Exception, None]] = asyncio.Queue(maxsize=MESSAGES_BATCH_SIZE)
+
+    async def read():
+        try:
+            async for target in targets:
+                await queue.put(target)
+        except Exception as err:  # pylint: disable=broad-except
+            await queue.put(err)
+        else:
+            await queue.put(None)
+
+    groups: dict[Union[int, str], list['Target']] = {}
+    pending = 0
+    reader = asyncio.ensure_future(read())
+    try:
+        while True:
+            item = await queue.get()
+            while True:
+                if item is None:
+                    for batch in groups.items():
+                        yield batch
+                    return
+                if isinstance(item, Exception):
+                    raise item
+
+                group = groups.setdefault(item.channel_id, [])
+                group.append(item)
+                pending += 1
+                if len(group) >= MESSAGES_BATCH_SIZE:
+                    pending -= len(group)
+                    yield item.channel_id, groups.pop(item.channel_id)
+                elif pending >= max_pending:
+                    biggest = max(groups, key=lambda key: len(groups[key]))
+                    pending -= len(groups[biggest])
+                    yield biggest, groups.pop(biggest)
+
+                # let the reader put the targets that are ready
+                if queue.empty():
+                    await asyncio.sleep(0)
+                if queue.empty():
+                    break
+                item = queue.get_nowait()
+
+            for channel_id in list(groups):
+                pending -= len(groups[channel_id])
+                yield channel_id, groups.pop(channel_id)
+    finally:
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
+
+
+async def download_batches(
+        rcd_tool: 'RCD',
+        batches: AsyncIterable[Batch],
+        generate_filename: FilenameGenerator,
+        options: PipelineOptions,
+        ordered: bool = True,
+        ) -> AsyncIterator[tuple['Target', Optional[str]]]:
+    """Fetch the messages of the targets by channel, then download their media.
+
+    The messages are requested in batches (see `RCD.get_messages`), so there is
+    only one request per chunk of messages of a channel instead of one request
+    per target. The targets that already have their message are not requested.
+    The message requests and the downloads run in two `Scheduler` pools,
+    taking the channels in turns.
+
+    The batches are taken from the iterable only when there is room for them,
+    so the targets are never expanded all at once, and the results are yielded
+    as soon as their batch is done.
+
+    The output filenames are planned when the messages are known, so they can
+    have the extension of the media. A single task plans the fetched batches
+    in order, so the names do not depend on which request finished first.
+
+    With `albums`, the other messages of the album of a target become targets
+    too, named after it, and each album is downloaded once.
+
+    The medias that do not match the filter are skipped before planning their
+    filenames, without any transfer.
+
+    The sizes of the medias are known from the messages, so the biggest
+    downloads of each channel start first, and nothing is left running alone
+    at the end. The downloads running at the same time are limited to
+    `max_in_flight_bytes`, and the planned bytes to `max_total_bytes`.
+
+    Args:
+        rcd_tool (RCD): The RCD object.
+        batches (AsyncIterable[Batch]): The batches of targets.
+        generate_filename (FilenameGenerator): The function that returns the
+            output filename of each target without one.
+        options (PipelineOptions): The options.
+        ordered (bool, optional): Yield the targets in order, or as soon as
+            they are done. Defaults to True.
+
+    Yields:
+        tuple[Target, Optional[str]]: Each target and its downloaded filename,
+        None if nothing was downloaded. The status and the reason are in the
+        stats of the target.
+    """
+    from rcdtool.rcdtool import (
+        Target,
+        get_media_extension,
+        get_media_info,
+        get_media_mime_type,
+        get_media_size,
+        get_paid_media_items,
+    )
+
+    # the message requests and the downloads run in their own pools, so a
+    # download never waits for a free request worker, nor the other way
+    fetcher = Scheduler(options.metadata_concurrency or options.concurrency)
+    downloader = Scheduler(options.transfer_concurrency or options.concurrency)
+    media_filter = options.media_filter
+    report = options.report
+
+    def is_filtered(message) -> bool:
+        if media_filter is None or not media_filter.active or message is None or message.media is None:
+            return False
+        return not media_filter.matches(
+            get_media_mime_type(message.media),
+            get_media_size(message.media),
+            message.date,
+        )
+
+    budget = ByteBudget(options.max_in_flight_bytes) if options.max_in_flight_bytes else None
+    # the bytes of the planned downloads
+    planned_bytes = 0
+
+    def download_job(target: 'Target', size: int):
+        async def download():
+            return await rcd_tool.download_media(
+                channel_id=target.channel_id,
+                message_id=target.message_id,
+                output_filename=target.output_filename,
+                infer_extension=options.infer_extension,
+                message=target.message,
+                stats=target.stats,
+                account=target.account,
+                item_filenames=target.item_filenames,
+            )
+
+        async def job():
+            if budget is None or rcd_tool.dry_mode:
+                return await download()
+            async with budget.reserve(size):
+                return await download()
+        return job
+
+    # the albums that already have their targets, by channel and grouped id
+    planned_albums: set[tuple[Union[int, str], int]] = set()
+
+    def get_ext(message) -> str:
+        if message.media is not None:
+            return get_media_extension(message.media) or ''
+        return ''
+
+    def plan_filenames(batch: list['Target'], albums: dict[int, list]) -> list['Target']:
+        targets: list['Target'] = []
+        for target in batch:
+            message = target.message
+            album = albums.get(message.grouped_id) if message is not None and message.grouped_id else None
+            if album is not None:
+                key = (target.channel_id, message.grouped_id)
+                if key in planned_albums:
+                    logger.debug('message %s is downloaded with its album', target.message_id)
+                    continue
+                planned_albums.add(key)
+
+            targets.append(target)
+            if target.output_filename is not None or message is None or is_filtered(message):
+                continue
+            ext = get_ext(message)
+            items = get_paid_media_items(message.media)
+            # a single item is downloaded to the filename of the message
+            media = items[0] if items is not None and len(items) == 1 else message.media
+            target.output_filename = generate_filename(
+                target.channel_name or target.channel_id,
+                target.message_id,
+                ext,
+                target.output,
+                None,
+                get_media_info(media)[1],
+            )
+            if items is not None and len(items) > 1:
+                target.item_filenames = rcd_tool.plan_item_filenames(
+                    items,
+                    target.output_filename,
+                    options.infer_extension,
+                )
+            if album is None:
+                continue
+
+            root = target.output_filename
+            if ext and root.endswith(f'.{ext}'):
+                root = root[:-len(ext) - 1]
+            for index, member in enumerate(album, start=1):
+                if member.id == target.message_id:
+                    continue
+                # the items have an extension only if the album has one
+                member_ext = get_ext(member) if root != target.output_filename else ''
+                targets.append(Target(
+                    target.channel_id,
+                    member.id,
+                    output_filename=generate_filename(
+                        target.channel_name or target.channel_id,
+                        member.id,
+                        member_ext,
+                        None,
+                        (root, index),
+                        get_media_info(member.media)[1],
+                    ),
+                    message=member,
+                    channel_name=target.channel_name,
+                    account=target.account,
+                ))
+        return targets
+
+    def fetch_job(channel_id: Union[int, str], batch: list['Target']):
+        async def job():
+            missing_ids = [target.message_id for target in batch if target.message is None]
+            resolve = metadata = 0.0
+            # why the messages that were not fetched are missing
+            reason = 'message not found'
+            albums: dict[int, list] = {}
+            try:
+                if missing_ids:
+                    start = time.monotonic()
+                    account = await rcd_tool.find_account(channel_id)
+                    resolve = time.monotonic() - start
+                    messages = {}
+                    if account is None:
+                        reason = 'channel not found'
+                    else:
+                        messages = await rcd_tool.get_messages(channel_id, missing_ids, account)
+                    metadata = time.monotonic() - start - resolve
+                    for target in batch:
+                        if target.message is None:
+                            target.message = messages.get(target.message_id)
+                            target.account = account
+
+                if options.albums:
+                    known = {target.message_id: target.message for target in batch if target.message is not None}
+                    account = next((target.account for target in batch if target.account is not None), None)
+                    if account is not None and any(message.grouped_id for message in known.values()):
+                        albums = await rcd_tool.get_albums(channel_id, known, account)
+            except Exception as err:  # pylint: disable=broad-except
+                logger.error('Cannot get the messages of %s: %s', channel_id, err)
+                reason = str(err) or type(err).__name__
+            return channel_id, batch, albums, resolve, metadata, reason
+        return job
+
+    def plan_batch(channel_id: Union[int, str],
+                   batch: list['Target'],
+                   albums: dict[int, list],
+                   resolve: float,
+                   metadata: float,
+                   reason: str,
+                   ) -> list[tuple['Target', asyncio.Future]]:
+        nonlocal planned_bytes
+        loop = asyncio.get_running_loop()
+        futures: list[tuple['Target', asyncio.Future]] = []
+        for target in plan_filenames(batch, albums):
+            if target.stats is None:
+                target.stats = DownloadStats(
+                    target.channel_id,
+                    target.message_id,
+                    resolve=resolve,
+                    metadata=metadata,
+                )
+            # the targets without download are done with no file
+            nothing = loop.create_future()
+            nothing.set_result(None)
+            if target.message is None:
+                if reason == 'message not found':
+                    logger.warning('Cannot find the message %s in %s', target.message_id, channel_id)
+                target.stats.reason = reason
+                rcd_tool.metrics.record(target.stats)
+                if report is not None:
+                    report.add(target.channel_id, target.message_id, None, reason=target.stats.reason)
+                futures.append((target, nothing))
+                continue
+
+            media = target.message.media
+            size = get_media_size(media) if media is not None else None
+            mime_type = get_media_mime_type(media) if media is not None else None
+            skip_reason = None
+            if media is None:
+                skip_reason = 'no media'
+            elif is_filtered(target.message):
+                skip_reason = 'filtered'
+            elif options.max_total_bytes is not None and size and planned_bytes + size > options.max_total_bytes:
+                skip_reason = 'over the total bytes'
+            if report is not None:
+                report.add(target.channel_id, target.message_id, target.output_filename, size, mime_type, skip_reason)
+            if skip_reason is not None:
+                logger.debug('skipping the message %s: %s', target.message_id, skip_reason)
+                target.stats.status = 'skipped'
+                target.stats.reason = skip_reason
+                rcd_tool.metrics.record(target.stats)
+                futures.append((target, nothing))
+                continue
+
+            planned_bytes += size or 0
+            # the accounts take turns, so all of them download at the same time
+            key = (channel_id, target.account)
+            futures.append((target, downloader.submit(key, download_job(target, size or 0), priority=size or 0)))
+        return futures
+
+    def failed(err: BaseException) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        future.set_exception(err)
+        return future
+
+    # the batches being fetched, in order; None marks the end
+    window: asyncio.Queue[Optional[asyncio.Future]] = asyncio.Queue(maxsize=fetcher.concurrency)
+    # the downloads of the planned batches, in order; None marks the end
+    planned: asyncio.Queue[Optional[asyncio.Future]] = asyncio.Queue(maxsize=downloader.concurrency)
+
+    async def submit_batches():
+        try:
+            async for channel_id, batch in batches:
+                await window.put(fetcher.submit(channel_id, fetch_job(channel_id, batch)))
+        except Exception as err:
+            await window.put(failed(err))
+        await window.put(None)
+
+    async def plan_batches():
+        # a single task plans the fetched batches in order, so the names do
+        # not depend on which request finished first, and no worker waits
+        while True:
+            fetched = await window.get()
+            if fetched is None:
+                break
+            try:
+                future = asyncio.get_running_loop().create_future()
+                future.set_result(plan_batch(*await fetched))
+            except Exception as err:
+                future = failed(err)
+            await planned.put(future)
+        await planned.put(None)
+
+    progress = Progress(options.progress_interval) if options.progress_interval is not None else None
+
+    def report_progress(force: bool = False):
+        if progress is None:
+            return
+        metrics = rcd_tool.metrics
+        progress.update('%d done, %s, %.1f MB',
+                        sum(metrics.downloads.values()),
+                        metrics.downloads,
+                        metrics.bytes / 1e6,
+                        force=force)
+
+    async def iter_in_order() -> AsyncIterator[tuple['Target', Optional[str]]]:
+        while True:
+            batch_future = await planned.get()
+            if batch_future is None:
+                return
+            for target, future in await batch_future:
+                yield target, await future
+
+    async def iter_as_done() -> AsyncIterator[tuple['Target', Optional[str]]]:
+        running: dict[asyncio.Future, 'Target'] = {}
+        getting: Optional[asyncio.Future] = None
+        exhausted = False
+        try:
+            while True:
+                # the next batch is taken when the downloads are about to need it
+                if getting is None and not exhausted and len(running) < downloader.concurrency:
+                    getting = asyncio.ensure_future(planned.get())
+                if getting is None and not running:
+                    return
+
+                waiting = set(running) if getting is None else {*running, getting}
+                done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                if getting in done:
+                    batch_future = getting.result()
+                    getting = None
+                    if batch_future is None:
+                        exhausted = True
+                    else:
+                        for target, future in await batch_future:
+                            running[future] = target
+                for future in done:
+                    if future in running:
+                        yield running.pop(future), future.result()
+        finally:
+            if getting is not None:
+                getting.cancel()
+
+    results = iter_in_order() if ordered else iter_as_done()
+    tasks = [asyncio.ensure_future(submit_batches()), asyncio.ensure_future(plan_batches())]
+    try:
+        async for result in results:
+            yield result
+            report_progress()
+        report_progress(force=True)
+    finally:
+        await results.aclose()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await fetcher.close()
+        await downloader.close()
@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+
+# MIT License
+#
+# Copyright (c) 2025 David256
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Planner of the output filenames
+"""
+import os
+import re
+import json
+import string
+from typing import Optional, Union
+
+from rcdtool.log import logger
+from rcdtool.resume import MANIFEST_EXTENSION, find_downloads
+
+
+# The fields that can be used in the output templates
+TEMPLATE_FIELDS = ('channel', 'message_id', 'ext', 'shard')
+
+
+def is_template(path: str) -> bool:
+    """Check if an output path has template fields.
+
+    Args:
+        path (str): The output path.
+
+    Returns:
+        bool: True if there is some field like `{message_id}`.
+    """
+    try:
+        return any(field_name for _, field_name, _, _ in string.Formatter().parse(path))
+    except ValueError:
+        # unbalanced braces
+        return False
+
+
+def check_template(template: str):
+    """Check that a template only uses the known fields.
+
+    Args:
+        template (str): The output template.
+
+    Raises:
+        ValueError: If the template is not valid.
+    """
+    try:
+        template.format(channel=0, message_id=0, ext='', shard=0)
+    except (KeyError, IndexError, ValueError) as err:
+        raise ValueError(
+            f'Invalid output template {template!r}, the fields are {", ".join(TEMPLATE_FIELDS)}'
+        ) from err
+
+
+def to_template(output_filename: str, is_detailed: bool = False, infer_extension: bool = False) -> str:
+    """Turn an output filename into a template.
+
+    A plain filename gets its braces escaped, the channel and message IDs if
+    the name is detailed, and the extension if it is inferred. A template is
+    returned as is.
+
+    Args:
+        output_filename (str): The output filename or template.
+        is_detailed (bool, optional): Add the channel and message IDs.
+        infer_extension (bool, optional): Add the extension.
+
+    Returns:
+        str: The template.
+    """
+    if is_template(output_filename):
+        return output_filename
+    template = output_filename.replace('{', '{{').replace('}', '}}')
+    if is_detailed:
+        root, ext = os.path.splitext(template)
+        template = f'{root}--{{channel}}-{{message_id}}{ext}'
+    if infer_extension:
+        template += '.{ext}'
+    return template
+
+
+class OutputPlanner:
+    """Give a unique output filename to each message.
+
+    The filenames come from a template like `{channel}/{message_id}.{ext}`.
+    Each directory is listed only once, and the planned names are reserved in
+    memory, so a name is found without touching the disk again. If a name is
+    taken, a counter is added: `name-1.ext`, `name-2.ext`...
+
+    The names are planned again when a download is run again, so the counters
+    could point to other files. With the media id, a media gets back the file
+    or the `.part` file that a previous run left for it under a name of the
+    same counter (see `resume.find_downloads`), and the names with the
+    progress of another media are taken. The files that were already
+    downloaded are in `downloaded`.
+
+    With a shard size, the files are split in subdirectories by message ID
+    (`{shard}` is the first message ID of the shard). If the template has no
+    `{shard}`, the shard subdirectory is added before the filename.
+    """
+
+    def __init__(self, template: str, shard_size: Optional[int] = None):
+        if shard_size is not None and shard_size < 1:
+            raise ValueError(f'The shard size must be positive: {shard_size}')
+        self.template = template
+        self.shard_size = shard_size
+        if shard_size and '{shard}' not in template:
+            directory, filename = os.path.split(template)
+            self.template = os.path.join(directory, '{shard}', filename)
+        self.names: dict[str, set[str]] = {}
+        self.counters: dict[tuple[str, str], int] = {}
+        # what the previous runs left in each directory, by media id
+        self.downloads: dict[str, dict[int, list[str]]] = {}
+        # the reclaimed paths that are downloaded, with their media id
+        self.downloaded: dict[str, int] = {}
+        check_template(self.template)
+
+    def render(self,
+               channel_id: Union[int, str],
+               message_id: int,
+               ext: str = '',
+               template: Optional[str] = None,
+               ) -> str:
+        """Fill the template.
+
+        Args:
+            channel_id (Union[int, str]): The channel ID.
+            message_id (int): The message ID.
+            ext (str, optional): The file extension, without dot. If it is
+                empty, the dot before `{ext}` is removed too.
+            template (Optional[str], optional): Another template for this
+                message, without sharding.
+
+        Returns:
+            str: The output path.
+        """
+        template = template or self.template
+        if not ext:
+            template = template.replace('.{ext}', '{ext}')
+        shard = message_id // self.shard_size * self.shard_size if self.shard_size else 0
+        return template.format(channel=channel_id, message_id=message_id, ext=ext, shard=shard)
+
+    def listdir(self, directory: str) -> set[str]:
+        """Get the names of a directory, listing it only the first time.
+
+        Args:
+            directory (str): The directory.
+
+        Returns:
+            set[str]: The names in the directory, and the reserved ones.
+        """
+        names = self.names.get(directory)
+        if names is None:
+            try:
+                with os.scandir(directory or '.') as entries:
+                    names = {entry.name for entry in entries}
+            except (FileNotFoundError, NotADirectoryError):
+                names = set()
+            logger.debug('found %d names in %s', len(names), directory or '.')
+            self.names[directory] = names
+            self.downloads[directory] = find_downloads(directory, names)
+        return names
+
+    def reserve(self, path: str) -> bool:
+        """Reserve a path, so it will not be planned again.
+
+        Args:
+            path (str): The path.
+
+        Returns:
+            bool: True if it was free.
+        """
+        directory, filename = os.path.split(path)
+        names = self.listdir(directory)
+        if filename in names:
+            return False
+        names.add(filename)
+        return True
+
+    def plan(self,
+             channel_id: Union[int, str],
+             message_id: int,
+             ext: str = '',
+             template: Optional[str] = None,
+             media_id: Optional[int] = None,
+             ) -> str:
+        """Get a free output path for a message and reserve it.
+
+        Args:
+            channel_id (Union[int, str]): The channel ID.
+            message_id (int): The message ID.
+            ext (str, optional): The file extension, without dot.
+            template (Optional[str], optional): Another template for this
+                message, for example from a line of a targets file.
+            media_id (Optional[int], optional): The media id, to get back the
+                files of a previous run.
+
+        Returns:
+            str: The output path.
+        """
+        return self.claim(self.render(channel_id, message_id, ext, template), media_id)
+
+    def plan_item(self, root: str, index: int, ext: str = '', media_id: Optional[int] = None) -> str:
+        """Get a free output path for an item of a message and reserve it.
+
+        The item is named after the path of the message, without extension:
+        `download/photo` gives `download/photo-2.jpg` for the second item.
+
+        Args:
+            root (str): The output path of the message, without extension.
+            index (int): The position of the item, from 1.
+            ext (str, optional): The file extension of the item, without dot.
+            media_id (Optional[int], optional): The media id of the item.
+
+        Returns:
+            str: The output path.
+        """
+        return self.claim(f'{root}-{index}.{ext}' if ext else f'{root}-{index}', media_id)
+
+    def reclaim(self, path: str, media_id: int) -> Optional[str]:
+        """Get back the file of a media left by a previous run.
+
+        It is the downloaded file or the `.part` file of the media under the
+        path, or under the path with a counter.
+
+        Args:
+            path (str): The wanted path.
+            media_id (int): The media id.
+
+        Returns:
+            Optional[str]: The path of the file, or None if there is none.
+        """
+        directory, filename = os.path.split(path)
+        name, extension = os.path.splitext(filename)
+        names = self.listdir(directory)
+        found = self.downloads[directory].get(media_id)
+        if not found:
+            return None
+        pattern = re.compile(f'{re.escape(name)}(-[0-9]+)?{re.escape(extension)}')
+        for candidate in found:
+            if pattern.fullmatch(candidate):
+                found.remove(candidate)
+                path = os.path.join(directory, candidate)
+                if candidate in names:
+                    self.downloaded[path] = media_id
+                names.add(candidate)
+                logger.debug('media %s was left in %s by a previous run', media_id, path)
+                return path
+        return None
+
+    def claim(self, path: str, media_id: Optional[int] = None) -> str:
+        """Reserve a path, or the next free name with a counter.
+
+        Args:
+            path (str): The wanted path.
+            media_id (Optional[int], optional): The media id. If it is given,
+                the files of a previous run are got back (see `reclaim`), and
+                the names with the progress of another media are taken.
+
+        Returns:
+            str: The reserved path.
+        """
+        if media_id is not None:
+            reclaimed = self.reclaim(path, media_id)
+            if reclaimed is not None:
+                return reclaimed
+
+        directory, filename = os.path.split(path)
+        name, extension = os.path.splitext(filename)
+        names = self.listdir(directory)
+
+        def is_taken(candidate: str) -> bool:
+            return candidate in names or (media_id is not None and candidate + MANIFEST_EXTENSION in names)
+
+        if not is_taken(filename) and self.reserve(path):
+            return path
+
+        # continue from the last counter of this name, not from 1
+        key = (directory, filename)
+        counter = self.counters.get(key, 1)
+        while is_taken(f'{name}-{counter}{extension}'):
+            counter += 1
+        self.counters[key] = counter + 1
+        filename = f'{name}-{counter}{extension}'
+        names.add(filename)
+        return os.path.join(directory, filename)
+
+
+class PlanReport:
+    """The planned downloads, with their metadata, to review them before
+    running (see `--dry-run`).
+
+    The entries keep the order of the targets. The skipped ones have the
+    reason.
+    """
+
+    def __init__(self):
+        self.entries: list[dict] = []
+        self.planned = 0
+        self.bytes = 0
+        self.unknown_sizes = 0
+
+    def add(self,
+            channel_id: Union[int, str],
+            message_id: int,
+            output_filename: Optional[str],
+            size: Optional[int] = None,
+            mime_type: Optional[str] = None,
+            reason: Optional[str] = None,
+            ):
+        """Add a target to the report.
+
+        Args:
+            channel_id (Union[int, str]): The channel ID.
+            message_id (int): The message ID.
+            output_filename (Optional[str]): The planned output filename.
+            size (Optional[int], optional): The media size in bytes.
+            mime_type (Optional[str], optional): The media MIME type.
+            reason (Optional[str], optional): Why the target is skipped, None
+                if it is planned.
+        """
+        self.entries.append({
+            'channel_id': channel_id,
+            'message_id': message_id,
+            'output_filename': output_filename,
+            'size': size,
+            'mime_type': mime_type,
+            'status': 'skipped' if reason else 'planned',
+            'reason': reason,
+        })
+        if reason:
+            return
+        self.planned += 1
+        if size is None:
+            self.unknown_sizes += 1
+        else:
+            self.bytes += size
+
+    def to_dict(self) -> dict:
+        """Get the report as a JSON serializable dict.
+
+        Returns:
+            dict: The totals and the entries.
+        """
+        return {
+            'planned': self.planned,
+            'skipped': len(self.entries) - self.planned,
+            'bytes': self.bytes,
+            'unknown_sizes': self.unknown_sizes,
+            'entries': self.entries,
+        }
+
+    def save(self, filename: str):
+        """Save the report atomically.
+
+        Args:
+            filename (str): The JSON filename.
+        """
+        temp_filename = f'{filename}.tmp'
+        with open(temp_filename, 'w', encoding='utf-8') as file:
+            json.dump(self.to_dict(), file, indent=2)
+        os.replace(temp_filename, filename)
+        logger.info('saved the plan of %d downloads to %s', self.planned, filename)
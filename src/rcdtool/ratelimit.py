@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+# MIT License
+#
+# Copyright (c) 2025 David256
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Adaptive control of the request rate
+"""
+import time
+import asyncio
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from telethon import errors
+
+from rcdtool.log import logger
+from rcdtool.metrics import current_stats
+
+
+T = TypeVar('T')
+
+# The errors that ask to wait some seconds before the next request
+FLOOD_WAIT_ERRORS = (errors.FloodWaitError, errors.FloodPremiumWaitError)
+
+
+class RateController:
+    """Limit the requests running at the same time, adapting to FloodWait.
+
+    The limit grows additively after each successful request and shrinks
+    multiplicatively after each FloodWait (AIMD), so it stays near the highest
+    rate the account tolerates. A FloodWait also pauses all the requests for
+    the given seconds, and the request is retried.
+    """
+
+    def __init__(self,
+                 limit: int = 16,
+                 min_limit: int = 1,
+                 increase: float = 1.0,
+                 decrease: float = 0.5,
+                 max_retries: int = 5,
+                 max_wait: Optional[float] = None,
+                 ):
+        self.max_limit = limit
+        self.min_limit = min_limit
+        self.limit = float(limit)
+        self.increase = increase
+        self.decrease = decrease
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.released = asyncio.Event()
+        self.flood_waits = 0
+        self.retries = 0
+
+    async def acquire(self):
+        """Wait for a free slot and take it."""
+        while True:
+            delay = self.paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return
+            self.released.clear()
+            await self.released.wait()
+
+    def release(self):
+        """Free a slot."""
+        self.in_flight -= 1
+        self.released.set()
+
+    def on_success(self):
+        """Grow the limit after a successful request."""
+        self.limit = min(float(self.max_limit), self.limit + self.increase / self.limit)
+
+    def on_flood_wait(self, seconds: float):
+        """Shrink the limit and pause the requests after a FloodWait.
+
+        The limit shrinks only once per pause, because the requests running
+        at the same time usually get the FloodWait together.
+
+        Args:
+            seconds (float): The seconds to wait.
+        """
+        self.flood_waits += 1
+        now = time.monotonic()
+        if now >= self.paused_until:
+            self.limit = max(float(self.min_limit), self.limit * self.decrease)
+            logger.debug('request limit reduced to %d', int(self.limit))
+        self.paused_until = max(self.paused_until, now + seconds)
+
+    async def call(self, func: Callable[..., Awaitable[T]], *args, **kwargs) -> T:
+        """Run a request, retrying it after a FloodWait.
+
+        Args:
+            func (Callable[..., Awaitable[T]]): The function that makes the request.
+            *args: The arguments of the function.
+            **kwargs: The keyword arguments of the function.
+
+        Raises:
+            FloodWaitError: If the request got too many FloodWaits, or a wait
+                longer than `max_wait`.
+
+        Returns:
+            T: The result of the request.
+        """
+        attempt = 0
+        while True:
+            await self.acquire()
+            try:
+                result = await func(*args, **kwargs)
+            except FLOOD_WAIT_ERRORS as err:
+                self.release()
+                attempt += 1
+                seconds = err.seconds
+                if attempt > self.max_retries or (self.max_wait is not None and seconds > self.max_wait):
+                    raise
+                logger.warning('FloodWait of %d seconds, retrying (%d/%d)', seconds, attempt, self.max_retries)
+                self.retries += 1
+                stats = current_stats.get()
+                if stats is not None:
+                    stats.retries += 1
+                    stats.flood_waits += 1
+                self.on_flood_wait(seconds)
+                continue
+            except BaseException:
+                self.release()
+                raise
+            self.release()
+            self.on_success()
+            return result
@@ -24,24 +24,324 @@
 
 
 import os
-from typing import cast, Union, Optional
+import time
+import asyncio
+import mimetypes
+from datetime import datetime, timezone
+from dataclasses import dataclass, field
+from typing import cast, AsyncIterable, AsyncIterator, Iterable, Union, Optional
 
 import configparser
 import filetype
-from telethon import TelegramClient
+from telethon import TelegramClient, errors, events
+from telethon.utils import get_input_location, get_peer_id
 import telethon.functions as functions
 from telethon.functions import channels
 import telethon.types as tg_types
 
 from rcdtool.log import logger
+from rcdtool.cache import EntityCache, get_cache_key
+from rcdtool.parallel import PART_SIZE, check_part_size, download_parts
+from rcdtool.writer import WRITE_BUFFER, FileWriter
+from rcdtool.resume import Checkpoint
+from rcdtool.checksum import Manifest, StreamChecksum, create_hash
+from rcdtool.planner import OutputPlanner
+from rcdtool.pipeline import PipelineOptions, download_batches, filename_generator, group_targets
+from rcdtool.index import MediaIndex
+from rcdtool.ratelimit import RateController
+from rcdtool.accounts import NOT_MEMBER_ERRORS, Account, choose_account
+from rcdtool.metrics import DownloadStats, Metrics, current_stats
+import rcdtool.utils as utils
+
+
+# Max number of message IDs in one GetMessagesRequest
+MESSAGES_BATCH_SIZE = 100
+# Max number of messages in one SearchRequest
+SEARCH_BATCH_SIZE = 100
+# The Telegram search filter of each media kind (see `filters.MEDIA_KINDS`)
+SEARCH_FILTERS = {
+    'photo': tg_types.InputMessagesFilterPhotos,
+    'video': tg_types.InputMessagesFilterVideo,
+    'photo_video': tg_types.InputMessagesFilterPhotoVideo,
+    'document': tg_types.InputMessagesFilterDocument,
+    'music': tg_types.InputMessagesFilterMusic,
+    'voice': tg_types.InputMessagesFilterVoice,
+    'round': tg_types.InputMessagesFilterRoundVideo,
+    'gif': tg_types.InputMessagesFilterGif,
+}
+# Max number of messages in an album
+MAX_ALBUM_SIZE = 10
+# Max number of messages in one GetHistoryRequest
+HISTORY_BATCH_SIZE = 100
+# Bytes read from the start of a file to guess its type
+SNIFF_SIZE = 8192
+
+# The extensions of the MIME types that `mimetypes` does not guess well, or
+# guesses differently on each system
+MIME_EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/webp': 'webp',
+    'audio/mpeg': 'mp3',
+    'audio/ogg': 'ogg',
+    'audio/mp4': 'm4a',
+    'audio/x-m4a': 'm4a',
+    'audio/flac': 'flac',
+    'audio/x-flac': 'flac',
+    'audio/wav': 'wav',
+    'audio/x-wav': 'wav',
+    'audio/x-matroska': 'mka',
+    'video/mp4': 'mp4',
+    'video/quicktime': 'mov',
+    'video/x-matroska': 'mkv',
+    'video/webm': 'webm',
+    'video/x-msvideo': 'avi',
+    'video/mp2t': 'ts',
+    'video/3gpp': '3gp',
+    'application/zip': 'zip',
+    'application/vnd.rar': 'rar',
+    'application/x-rar-compressed': 'rar',
+    'application/x-7z-compressed': '7z',
+    'application/x-tgsticker': 'tgs',
+}
+# The MIME types that say nothing about the content, the extension of these
+# documents is sniffed from their first bytes
+UNKNOWN_MIME_TYPES = ('', 'application/octet-stream')
+
+
+@dataclass
+class Target:
+    """A message to download."""
+    channel_id: Union[int, str]
+    message_id: int
+    output_filename: Optional[str] = None
+    message: Optional[tg_types.Message] = None
+    stats: Optional[DownloadStats] = None
+    # the channel as it was written, for the output filename
+    channel_name: Optional[Union[int, str]] = None
+    # the output filename or template given for this target
+    output: Optional[str] = None
+    # the account that fetched the message
+    account: Optional[Account] = None
+    # the output filenames of the items of a paid media
+    item_filenames: Optional[list[str]] = None
+
+
+@dataclass
+class DownloadResult:
+    """The result of a target of `RCD.download_many`.
+
+    `status` is one of "downloaded", "skipped", "dry-run" or "failed", and
+    `reason` explains the last two and the skipped ones. `files` has the
+    downloaded files, several for a paid media. The times are in seconds.
+    """
+    channel_id: Union[int, str]
+    message_id: int
+    status: str
+    reason: Optional[str] = None
+    output_filename: Optional[str] = None
+    files: list[str] = field(default_factory=list)
+    bytes: int = 0
+    seconds: float = 0.0
+    stats: Optional[DownloadStats] = None
+
+    @property
+    def ok(self) -> bool:
+        """True if the target did not fail."""
+        return self.status != 'failed'
+
+    @classmethod
+    def from_stats(cls, stats: DownloadStats) -> 'DownloadResult':
+        """Create the result of a finished download.
+
+        Args:
+            stats (DownloadStats): The stats of the download.
+
+        Returns:
+            DownloadResult: The result.
+        """
+        files = list(stats.files)
+        if not files and stats.status == 'downloaded' and stats.output_filename:
+            files = [stats.output_filename]
+        return cls(
+            channel_id=stats.channel_id,
+            message_id=stats.message_id,
+            status=stats.status,
+            reason=stats.reason,
+            output_filename=stats.output_filename,
+            files=files,
+            bytes=stats.bytes,
+            seconds=stats.resolve + stats.metadata + time.monotonic() - stats.started_at,
+            stats=stats,
+        )
+
+
+def get_media_info(media) -> tuple[Optional[str], Optional[int], Optional[int]]:
+    """Get the kind, the id and the size of a media.
+
+    Args:
+        media: The media object.
+
+    Returns:
+        tuple[Optional[str], Optional[int], Optional[int]]: The media kind
+        (document or photo), id and size, None if they are unknown.
+    """
+    if isinstance(media, tg_types.MessageMediaDocument) and isinstance(media.document, tg_types.Document):
+        return 'document', media.document.id, media.document.size
+    if isinstance(media, tg_types.MessageMediaPhoto) and isinstance(media.photo, tg_types.Photo):
+        return 'photo', media.photo.id, None
+    return None, None, None
+
+
+def get_paid_media_items(media) -> Optional[list]:
+    """Get the media of the items of a paid media.
+
+    Args:
+        media: The media object.
+
+    Returns:
+        Optional[list]: The media of each item, None if it is not a paid
+        media or some item is not available.
+    """
+    if not isinstance(media, tg_types.MessageMediaPaidMedia) or not media.extended_media:
+        return None
+    if not all(isinstance(item, tg_types.MessageExtendedMedia) for item in media.extended_media):
+        return None
+    return [item.media for item in media.extended_media]
+
+
+def get_media_size(media) -> Optional[int]:
+    """Get the size of a media, the sum of its items for a paid media.
+
+    Args:
+        media: The media object.
+
+    Returns:
+        Optional[int]: The size in bytes, None if it is unknown.
+    """
+    if isinstance(media, tg_types.MessageMediaPaidMedia):
+        sizes = [
+            get_media_info(item.media)[2] if isinstance(item, tg_types.MessageExtendedMedia) else None
+            for item in media.extended_media
+        ]
+        return sum(cast(list[int], sizes)) if sizes and None not in sizes else None
+    return get_media_info(media)[2]
+
+
+def get_media_mime_type(media) -> Optional[str]:
+    """Get the MIME type of a media.
+
+    Args:
+        media: The media object.
+
+    Returns:
+        Optional[str]: The MIME type, None if it is unknown.
+    """
+    if isinstance(media, tg_types.MessageMediaPhoto) and isinstance(media.photo, tg_types.Photo):
+        return 'image/jpeg'
+    if isinstance(media, tg_types.MessageMediaDocument) and isinstance(media.document, tg_types.Document):
+        return media.document.mime_type or None
+    return None
+
+
+def get_media_extension(media) -> Optional[str]:
+    """Get the file extension of a media from its metadata.
+
+    The extension of the original filename is preferred, then the one of the
+    MIME type. A generic MIME type, like `application/octet-stream`, gives
+    no extension, so it can be sniffed from the content.
+
+    Args:
+        media: The media object.
+
+    Returns:
+        Optional[str]: The extension without dot, None if it is unknown.
+    """
+    if isinstance(media, tg_types.MessageMediaPhoto) and isinstance(media.photo, tg_types.Photo):
+        return 'jpg'
+    items = get_paid_media_items(media)
+    if items is not None:
+        # a single item is saved to the output filename of the message
+        return get_media_extension(items[0]) if len(items) == 1 else None
+    if not isinstance(media, tg_types.MessageMediaDocument) or not isinstance(media.document, tg_types.Document):
+        return None
+
+    document = media.document
+    for attribute in document.attributes:
+        if isinstance(attribute, tg_types.DocumentAttributeFilename):
+            ext = os.path.splitext(attribute.file_name)[1][1:].lower()
+            if ext.isalnum() and len(ext) <= 8:
+                return ext
+
+    mime_type = (document.mime_type or '').lower()
+    if mime_type in UNKNOWN_MIME_TYPES:
+        return None
+    if mime_type in MIME_EXTENSIONS:
+        return MIME_EXTENSIONS[mime_type]
+    ext = mimetypes.guess_extension(mime_type)
+    return ext[1:] if ext else None
+
+
+def guess_extension(head: bytes) -> Optional[str]:
+    """Guess the file extension from the first bytes of a file.
+
+    Args:
+        head (bytes): The first bytes of the file.
+
+    Returns:
+        Optional[str]: The extension without dot, None if it is unknown.
+    """
+    result = filetype.guess(head) if head else None
+    return result.extension if result else None
 
 
 class RCD:
-    def __init__(self, config_filename: str, dry_mode: Optional[bool] = None):
+    def __init__(self,
+                 config_filename: str,
+                 dry_mode: Optional[bool] = None,
+                 parts: int = 1,
+                 part_size: int = PART_SIZE,
+                 index_filename: Optional[str] = None,
+                 dedup: str = 'skip',
+                 max_requests: int = 16,
+                 max_flood_wait: Optional[float] = None,
+                 stats_filename: Optional[str] = None,
+                 fsync: str = 'never',
+                 write_buffer: int = WRITE_BUFFER,
+                 checksum: Optional[str] = None,
+                 manifest_filename: Optional[str] = None,
+                 planner: Optional[OutputPlanner] = None,
+                 ):
+        check_part_size(part_size)
+        if checksum is not None:
+            # fail now if the algorithm is not available
+            create_hash(checksum)
         self.config_filename = config_filename
         self.config = self.get_config(self.config_filename)
-        self.client = self.create_client()
         self.dry_mode = dry_mode
+        self.parts = parts
+        self.part_size = part_size
+        self.max_requests = max_requests
+        self.max_flood_wait = max_flood_wait
+        self.accounts = [self.create_account(section) for section in self.get_access_sections()]
+        self.media_index = MediaIndex(index_filename) if index_filename else None
+        self.dedup = dedup
+        self.metrics = Metrics(stats_filename)
+        self.fsync = fsync
+        self.write_buffer = write_buffer
+        self.checksum = checksum
+        self.manifest = Manifest(manifest_filename) if manifest_filename else None
+        # the output filenames that are given after planning are reserved here
+        self.planner = planner or OutputPlanner('{channel}-{message_id}')
+
+    @property
+    def account(self) -> Account:
+        """The first account, used when no other account is chosen."""
+        return self.accounts[0]
+
+    @property
+    def client(self):
+        """The client of the first account."""
+        return self.account.client
 
     def get_config(self, config_filename: str):
         """Create a config object from config file.
@@ -58,144 +358,1033 @@ class RCD:
         config.read(config_filename)
         return config
 
-    def create_client(self):
+    def get_access_sections(self) -> list[str]:
+        """Get the config sections of the accounts.
+
+        The section `Access` is the first account, and each `Access.<name>`
+        section adds another one.
+
+        Returns:
+            list[str]: The section names.
+        """
+        return ['Access'] + [
+            section
+            for section in self.config.sections()
+            if section.startswith('Access.')
+        ]
+
+    def create_account(self, section: str) -> Account:
+        """Create an account from a config section.
+
+        Args:
+            section (str): The section name.
+
+        Returns:
+            Account: The account, not connected yet.
+        """
+        name = section.partition('.')[2] or 'default'
+        return Account(
+            name,
+            self.create_client(section),
+            RateController(self.max_requests, max_wait=self.max_flood_wait),
+            self.create_entity_cache(None if section == 'Access' else name),
+        )
+
+    def create_client(self, section: str = 'Access'):
         """Create a Telegram client object from given config.
 
         Args:
-            config (configparser.ConfigParser): Parsed config object.
+            section (str, optional): The config section of the account.
+                Defaults to 'Access'.
 
         Returns:
             TelegramClient: The Telegram client object.
         """
         client = TelegramClient(
-            session=self.config['Access']['session'],
-            api_id=int(self.config['Access']['id']),
-            api_hash=self.config['Access']['hash'],
+            session=self.config[section]['session'],
+            api_id=int(self.config[section]['id']),
+            api_hash=self.config[section]['hash'],
             timeout=int(self.config['Client']['timeout']),
             device_model=self.config['Client']['device_model'],
             lang_code=self.config['Client']['lang_code'],
         )
-        client.start()
         return client
 
+    def create_entity_cache(self, account_name: Optional[str] = None):
+        """Create the cache of resolved channels from the config.
+
+        The cache is persisted only if the section `Cache` defines `entities`.
+        The other accounts than the first one save their cache next to it,
+        with the account name before the extension.
+
+        Args:
+            account_name (Optional[str]): The account name, None for the
+                first account.
+
+        Returns:
+            EntityCache: The entity cache object.
+        """
+        filename: Optional[str] = None
+        ttl: Optional[float] = None
+        if self.config.has_section('Cache'):
+            filename = self.config['Cache'].get('entities') or None
+            ttl = self.config['Cache'].getfloat('ttl', fallback=None)
+        if filename and account_name:
+            root, ext = os.path.splitext(filename)
+            filename = f'{root}.{account_name}{ext}'
+        return EntityCache(filename, ttl)
+
+    async def find_account(self, channel_id: Union[int, str]) -> Optional[Account]:
+        """Choose an account that can see a channel, and resolve it there.
+
+        The accounts are tried in the order of `choose_account`, and the
+        ones that cannot resolve the channel are not chosen again for it.
+        If none of them can see the channel, the error of the last one is
+        logged, and the channel is skipped by the callers.
+
+        Args:
+            channel_id (Union[int, str]): The channel ID or username.
+
+        Returns:
+            Optional[Account]: The account, or None if no account can see the
+            channel or it is not a channel.
+        """
+        tried: list[Account] = []
+        error: Optional[Exception] = None
+        while True:
+            account = choose_account(self.accounts, channel_id, tried)
+            if account is None:
+                break
+            account.chosen += 1
+            try:
+                input_channel = await self.get_input_channel(channel_id, account)
+            except NOT_MEMBER_ERRORS as err:
+                logger.debug('the account %s cannot see %s: %s', account.name, channel_id, err)
+                error = err
+                input_channel = None
+            account.set_member(channel_id, input_channel is not None)
+            if input_channel is not None:
+                return account
+            tried.append(account)
+        if error is not None:
+            logger.warning('Cannot find the channel %s: %s', channel_id, error)
+        elif tried:
+            logger.warning('Cannot find the channel %s', channel_id)
+        return None
+
+    async def get_input_channel(self, channel_id: Union[int, str], account: Optional[Account] = None):
+        """Resolve a channel id to an input channel.
+
+        The result is cached, so a channel is resolved only once.
+
+        Args:
+            channel_id (Union[int, str]): The channel ID or username.
+            account (Optional[Account]): The account. Defaults to the first one.
+
+        Returns:
+            Optional[InputChannel]: The input channel, or None if it is not a channel.
+        """
+        account = account or self.account
+        await account.connect()
+
+        async def resolve_channel():
+            entity = await account.rate.call(account.client.get_entity, channel_id)
+            if not isinstance(entity, tg_types.Channel):
+                logger.warning('Cannot get a Channel object from that channel id')
+                return None
+            if entity.access_hash is None:
+                logger.warning('Cannot get the access hash for that channel')
+                return None
+            return entity.id, entity.access_hash
+
+        access = await account.entity_cache.resolve(channel_id, resolve_channel)
+        if access is None:
+            return None
+        return tg_types.InputChannel(*access)
+
+    async def get_discussion_group(self,
+                                   channel_id: Union[int, str],
+                                   message_id: int,
+                                   account: Optional[Account] = None,
+                                   ) -> Optional[int]:
+        """Find the discussion group linked to a channel, from one of its posts.
+
+        All the posts of a channel are discussed in the same group, so the
+        group is requested once per channel and kept in the entity cache,
+        with the group itself, so its messages can be requested right away
+        (see `get_messages`).
+
+        Args:
+            channel_id (Union[int, str]): The channel ID or username.
+            message_id (int): The ID of a post with comments.
+            account (Optional[Account]): The account. Defaults to the first one.
+
+        Returns:
+            Optional[int]: The marked ID of the discussion group, or None if
+            it cannot be found.
+        """
+        account = account or self.account
+        input_channel = await self.get_input_channel(channel_id, account)
+        if input_channel is None:
+            return None
+
+        async def resolve_group():
+            request = functions.messages.GetDiscussionMessageRequest(
+                peer=tg_types.InputPeerChannel(input_channel.channel_id, input_channel.access_hash),
+                msg_id=message_id,
+            )
+            try:
+                discussion_message = await account.rate.call(account.client, request)
+            except errors.MsgIdInvalidError:
+                logger.warning('The message %s of %s has no comments', message_id, channel_id)
+                return None
+            if not isinstance(discussion_message, tg_types.messages.DiscussionMessage):
+                logger.warning('Cannot get the discussion message')
+                return None
+            peer = discussion_message.messages[0].peer_id if discussion_message.messages else None
+            if not isinstance(peer, tg_types.PeerChannel):
+                logger.warning('Found a discussion message peer id as none')
+                return None
+            for chat in discussion_message.chats:
+                if isinstance(chat, tg_types.Channel) and chat.id == peer.channel_id and chat.access_hash is not None:
+                    return chat.id, chat.access_hash
+            logger.warning('Cannot get the access hash of the discussion group')
+            return None
+
+        key = f'discussion/{get_cache_key(channel_id)}'
+        access = await account.entity_cache.resolve(key, resolve_group)
+        if access is None:
+            return None
+        group_id = get_peer_id(tg_types.PeerChannel(access[0]))
+        if account.entity_cache.get(group_id) is None:
+            account.entity_cache.put(group_id, access)
+        return group_id
+
+    async def get_messages(self,
+                           channel_id: Union[int, str],
+                           message_ids: list[int],
+                           account: Optional[Account] = None,
+                           ) -> dict[int, tg_types.Message]:
+        """Fetch many messages of a channel using batched requests.
+
+        Each request asks for up to `MESSAGES_BATCH_SIZE` messages.
+
+        Args:
+            channel_id (Union[int, str]): The channel ID or username.
+            message_ids (list[int]): The message IDs.
+            account (Optional[Account]): The account. Defaults to the first one.
+
+        Returns:
+            dict[int, Message]: The found messages by message ID. Missing or
+            empty messages are not included.
+        """
+        account = account or self.account
+        input_channel = await self.get_input_channel(channel_id, account)
+        if input_channel is None:
+            return {}
+
+        messages: dict[int, tg_types.Message] = {}
+        for chunk in utils.chunks(message_ids, MESSAGES_BATCH_SIZE):
+            ids = [tg_types.InputMessageID(message_id) for message_id in chunk]
+            channel_messages = await account.rate.call(account.client, channels.GetMessagesRequest(input_channel, ids))
+            if not isinstance(channel_messages, tg_types.messages.ChannelMessages):
+                logger.warning('Cannot continue because the got type is not a ChannelMessages')
+                continue
+            for message in channel_messages.messages:
+                if isinstance(message, tg_types.Message):
+                    messages[message.id] = message
+        logger.debug('got %d of %d messages from %s', len(messages), len(message_ids), channel_id)
+        return messages
+
+    async def get_albums(self,
+                         channel_id: Union[int, str],
+                         messages: dict[int, tg_types.Message],
+                         account: Optional[Account] = None,
+                         ) -> dict[int, list[tg_types.Message]]:
+        """Find all the messages of the albums of some messages.
+
+        The messages of an album share a `grouped_id` and have consecutive
+        ids, so the ones around each grouped message that are not known yet
+        are requested together (see `get_messages`).
+
+        Args:
+            channel_id (Union[int, str]): The channel ID or username.
+            messages (dict[int, Message]): The known messages by message ID.
+            account (Optional[Account]): The account. Defaults to the first one.
+
+        Returns:
+            dict[int, list[Message]]: The messages of each album by grouped
+            id, sorted by message ID.
+        """
+        grouped_ids = {message.grouped_id for message in messages.values() if message.grouped_id is not None}
+        if not grouped_ids:
+            return {}
+
+        missing_ids = sorted({
+            message_id
+            for message in messages.values()
+            if message.grouped_id is not None
+            for message_id in range(max(1, message.id - MAX_ALBUM_SIZE + 1), message.id + MAX_ALBUM_SIZE)
+            if message_id not in messages
+        })
+        found = dict(messages)
+        if missing_ids:
+            found.update(await self.get_messages(channel_id, missing_ids, account))
+
+        albums: dict[int, list[tg_types.Message]] = {}
+        for message_id in sorted(found):
+            message = found[message_id]
+            if message.grouped_id in grouped_ids:
+                albums.setdefault(message.grouped_id, []).append(message)
+        return albums
+
+    def find_downloaded(self, media, output_filename: str) -> Optional[str]:
+        """Find a media that is already downloaded.
+
+        The output filename may be the file of the media downloaded by a
+        previous run (see `OutputPlanner.reclaim`). Otherwise, the media is
+        looked up in the index of downloaded medias: if `dedup` is "link",
+        the found file is hard-linked to the output filename, else the found
+        file is used as is.
+
+        Args:
+            media: The media object.
+            output_filename (str): The output filename.
+
+        Returns:
+            Optional[str]: The path of the downloaded media, or None if it
+            must be downloaded.
+        """
+        kind, media_id, size = get_media_info(media)
+        if media_id is not None and self.planner.downloaded.get(output_filename) == media_id:
+            logger.info('already downloaded to %s', output_filename)
+            return output_filename
+        if self.media_index is None or kind is None or media_id is None:
+            return None
+        path = self.media_index.lookup(kind, media_id, size)
+        if path is None:
+            return None
+
+        if self.dedup == 'link':
+            try:
+                os.link(path, output_filename)
+                logger.info('linked %s to %s', path, output_filename)
+                return output_filename
+            except OSError as err:
+                logger.warning('Cannot link %s: %s', path, err)
+        logger.info('already downloaded to %s', path)
+        return path
+
+    def index_downloaded(self, media, path: str):
+        """Save a downloaded media in the index.
+
+        Args:
+            media: The media object.
+            path (str): The path of the downloaded file.
+        """
+        if self.media_index is None:
+            return
+        kind, media_id, _ = get_media_info(media)
+        if kind is not None and media_id is not None:
+            self.media_index.add(kind, media_id, path)
+
+    async def download_file(self,
+                            media,
+                            output_filename: str,
+                            sniff_extension: bool = False,
+                            account: Optional[Account] = None,
+                            ) -> str:
+        """Download a media to a file, resuming the progress of previous runs.
+
+        The data goes to a `.part` file that is renamed to the output filename
+        when the download finishes (see `Checkpoint`). If `parts` is greater
+        than 1, the documents bigger than one part are downloaded by parts at
+        the same time (see `download_parallel`). The parts are written by a
+        `FileWriter` thread, so the disk does not block the event loop. With
+        a `checksum` algorithm, the parts are hashed as they are written, and
+        the file is added to the `manifest`, if any.
+
+        Args:
+            media: The media object.
+            output_filename (str): The output filename.
+            sniff_extension (bool, optional): Guess the extension from the
+                first bytes, while they are downloaded, and add it to the
+                output filename.
+            account (Optional[Account]): The account that fetched the media.
+                Defaults to the first one.
+
+        Returns:
+            str: The output filename.
+        """
+        account = account or self.account
+        _, media_id, size = get_media_info(media)
+        checkpoint = Checkpoint(output_filename, media_id, size, self.part_size)
+        resuming = checkpoint.load()
+        checksum = None
+        if self.checksum is not None:
+            checksum = StreamChecksum(self.checksum, self.part_size, set(checkpoint.completed))
+        started_at = time.time()
+
+        account.in_flight_bytes += size or 0
+        try:
+            with open(checkpoint.part_filename, 'r+b' if resuming else 'w+b') as file:
+                writer = FileWriter(
+                    file,
+                    size,
+                    fsync=self.fsync,
+                    max_buffer=self.write_buffer,
+                    on_written=checkpoint.mark,
+                    checksum=checksum,
+                )
+                try:
+                    try:
+                        if self.parts > 1 and size and size > self.part_size:
+                            await self.download_parallel(media, writer, size, checkpoint, account)
+                        else:
+                            end = await self.download_sequential(media, writer, size, checkpoint, account)
+                            if size is None or end < size:
+                                await writer.flush()
+                                file.truncate(end)
+                    except BaseException:
+                        # the error of the download is the one reported
+                        await writer.close(failed=True)
+                        raise
+                    await writer.close()
+                except BaseException:
+                    # save the progress, to resume it in the next run
+                    checkpoint.flush()
+                    raise
+                if sniff_extension and not checkpoint.head:
+                    # the first part was downloaded by a previous run
+                    file.seek(0)
+                    checkpoint.head = file.read(SNIFF_SIZE)
+        finally:
+            account.in_flight_bytes -= size or 0
+
+        start = time.monotonic()
+        ext = guess_extension(checkpoint.head) if sniff_extension else None
+        if ext:
+            # the name with the extension can be taken by another file
+            output_filename = self.planner.claim(f'{output_filename}.{ext}')
+            logger.debug('sniffed the extension of %s', output_filename)
+        checkpoint.finish(output_filename)
+        stats = current_stats.get()
+        if stats is not None:
+            stats.rename += time.monotonic() - start
+
+        if self.manifest is not None:
+            self.manifest.record({
+                'channel_id': stats.channel_id if stats is not None else None,
+                'message_id': stats.message_id if stats is not None else None,
+                'media_id': media_id,
+                'size': os.path.getsize(output_filename),
+                'checksum': self.checksum,
+                'hash': writer.digest,
+                'path': output_filename,
+                'resumed': resuming,
+                'started_at': datetime.fromtimestamp(started_at, timezone.utc).isoformat(),
+                'seconds': time.time() - started_at,
+            })
+        return output_filename
+
+    def plan_item_filenames(self,
+                            items: list,
+                            output_filename: str,
+                            infer_extension: Optional[bool] = None,
+                            ) -> list[str]:
+        """Plan the output filenames of the items of a paid media.
+
+        A single item keeps the output filename of the message. The others
+        are named after it: `name-1.jpg`, `name-2.mp4`... (see
+        `OutputPlanner.plan_item`). The names are reserved, so no other
+        message gets them.
+
+        Args:
+            items (list): The media of each item.
+            output_filename (str): The output filename of the message.
+            infer_extension (Optional[bool]): Add the extension of each item.
+
+        Returns:
+            list[str]: The filename of each item, in order.
+        """
+        if len(items) == 1:
+            return [output_filename]
+        return [
+            self.planner.plan_item(
+                output_filename,
+                index,
+                (get_media_extension(media) or '') if infer_extension else '',
+                get_media_info(media)[1],
+            )
+            for index, media in enumerate(items, start=1)
+        ]
+
+    async def download_paid_media(self,
+                                  items: list,
+                                  output_filename: str,
+                                  infer_extension: Optional[bool],
+                                  account: Account,
+                                  item_filenames: Optional[list[str]] = None,
+                                  ) -> list[str]:
+        """Download the items of a paid media at the same time, each to its own file.
+
+        The items are named by `plan_item_filenames`, if they were not
+        planned with the message. Each item is downloaded like any other
+        media (see `download_file`), so it can be resumed and deduplicated.
+
+        Args:
+            items (list): The media of each item.
+            output_filename (str): The output filename of the message.
+            infer_extension (Optional[bool]): Add the extension of each item.
+            account (Account): The account that fetched the message.
+            item_filenames (Optional[list[str]]): The planned filename of
+                each item.
+
+        Returns:
+            list[str]: The filename of each item, in order.
+        """
+        if item_filenames is None or len(item_filenames) != len(items):
+            item_filenames = self.plan_item_filenames(items, output_filename, infer_extension)
+
+        async def download_item(item_filename: str, media) -> str:
+            ext = get_media_extension(media) if infer_extension else None
+            downloaded_filename = self.find_downloaded(media, item_filename)
+            if downloaded_filename is not None:
+                return downloaded_filename
+            item_filename = await self.download_file(
+                media,
+                item_filename,
+                sniff_extension=bool(infer_extension) and not ext,
+                account=account,
+            )
+            self.index_downloaded(media, item_filename)
+            return item_filename
+
+        tasks = [
+            asyncio.ensure_future(download_item(item_filename, media))
+            for item_filename, media in zip(item_filenames, items)
+        ]
+        try:
+            return list(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def download_sequential(self,
+                                  media,
+                                  writer: FileWriter,
+                                  size: Optional[int],
+                                  checkpoint: Checkpoint,
+                                  account: Account,
+                                  ) -> int:
+        """Download a media part after part.
+
+        Args:
+            media: The media object.
+            writer (FileWriter): The writer of the output file.
+            size (Optional[int]): The media size in bytes, if it is known.
+            checkpoint (Checkpoint): The download progress.
+            account (Account): The account that fetched the media.
+
+        Returns:
+            int: The end of the downloaded data.
+        """
+        stats = current_stats.get()
+
+        async def download_stream():
+            # a retry continues from the last written part
+            await writer.flush()
+            offset = checkpoint.contiguous_offset
+            async for chunk in account.client.iter_download(
+                media,
+                offset=offset,
+                request_size=self.part_size,
+                file_size=size,
+            ):
+                await writer.write(offset, chunk)
+                if offset == 0:
+                    checkpoint.head = chunk[:SNIFF_SIZE]
+                offset += len(chunk)
+                if stats is not None:
+                    stats.add_bytes(len(chunk))
+            return offset
+
+        return await account.rate.call(download_stream)
+
+    async def download_parallel(self,
+                                media,
+                                writer: FileWriter,
+                                size: int,
+                                checkpoint: Checkpoint,
+                                account: Account,
+                                ):
+        """Download a media requesting several parts at the same time.
+
+        Args:
+            media: The media object.
+            writer (FileWriter): The writer of the output file.
+            size (int): The media size in bytes.
+            checkpoint (Checkpoint): The download progress.
+            account (Account): The account that fetched the media.
+
+        Returns:
+            int: The number of written bytes.
+        """
+        # pylint: disable=protected-access
+        stats = current_stats.get()
+        client = account.client
+        dc_id, location = get_input_location(media)
+        sender = None
+        if dc_id and dc_id != client.session.dc_id:
+            sender = await client._borrow_exported_sender(dc_id)
+
+        async def fetch_part(offset: int, limit: int) -> bytes:
+            request = functions.upload.GetFileRequest(location, offset=offset, limit=limit)
+            if sender is None:
+                result = await account.rate.call(client, request)
+            else:
+                result = await account.rate.call(client._call, sender, request)
+            if not isinstance(result, tg_types.upload.File):
+                raise IOError(f'Cannot download the part at offset {offset}: got {type(result).__name__}')
+            if stats is not None:
+                stats.add_bytes(len(result.bytes))
+            if offset == 0:
+                checkpoint.head = result.bytes[:SNIFF_SIZE]
+            return result.bytes
+
+        logger.debug('downloading %d bytes in %d parts at the same time', size, self.parts)
+        try:
+            return await download_parts(
+                fetch_part,
+                writer,
+                size,
+                self.part_size,
+                self.parts,
+                completed=checkpoint.completed,
+            )
+        finally:
+            if sender is not None:
+                await client._return_exported_sender(sender)
+
+    async def iter_history(self,
+                           channel_id: Union[int, str],
+                           min_id: int = 0,
+                           account: Optional[Account] = None,
+                           ) -> AsyncIterator[list[tg_types.Message]]:
+        """Page forward through the messages of a channel newer than an id.
+
+        Each page is one GetHistoryRequest of up to `HISTORY_BATCH_SIZE`
+        messages, so if there are no new messages it costs one request.
+
+        Args:
+            channel_id (Union[int, str]): The channel ID or username.
+            min_id (int, optional): Only the messages with greater id are
+                returned. Defaults to 0.
+            account (Optional[Account]): The account. Defaults to the first one.
+
+        Yields:
+            list[Message]: The next page of messages, sorted by id.
+        """
+        account = account or self.account
+        input_channel = await self.get_input_channel(channel_id, account)
+        if input_channel is None:
+            return
+        peer = tg_types.InputPeerChannel(input_channel.channel_id, input_channel.access_hash)
+
+        while True:
+            request = functions.messages.GetHistoryRequest(
+                peer=peer,
+                offset_id=min_id + 1,
+                offset_date=None,
+                add_offset=-HISTORY_BATCH_SIZE,
+                limit=HISTORY_BATCH_SIZE,
+                max_id=0,
+                min_id=0,
+                hash=0,
+            )
+            history = await account.rate.call(account.client, request)
+            page = [
+                message
+                for message in getattr(history, 'messages', [])
+                if message.id > min_id
+            ]
+            if not page:
+                return
+
+            messages = sorted(
+                (message for message in page if isinstance(message, tg_types.Message)),
+                key=lambda message: message.id,
+            )
+            logger.debug('got %d new messages from %s', len(messages), channel_id)
+            if messages:
+                yield messages
+            if len(page) < HISTORY_BATCH_SIZE:
+                return
+            min_id = max(message.id for message in page)
+
+    async def search_media(self,
+                           channel_id: Union[int, str],
+                           kind: str,
+                           ranges: list[tuple[int, int]],
+                           min_date: Optional[datetime] = None,
+                           max_date: Optional[datetime] = None,
+                           account: Optional[Account] = None,
+                           ) -> AsyncIterator[list[tg_types.Message]]:
+        """Page through the messages of a channel with a kind of media.
+
+        Telegram filters the messages by kind, id and date, so the messages
+        without that media are never requested. Each page is one
+        SearchRequest of up to `SEARCH_BATCH_SIZE` messages.
+
+        Args:
+            channel_id (Union[int, str]): The channel ID or username.
+            kind (str): The media kind, a key of `SEARCH_FILTERS`.
+            ranges (list[tuple[int, int]]): The message ID ranges, both ends
+                included.
+            min_date (Optional[datetime]): Only the messages posted since
+                this date.
+            max_date (Optional[datetime]): Only the messages posted before
+                this date.
+            account (Optional[Account]): The account. Defaults to the first one.
+
+        Yields:
+            list[Message]: The next page of messages, sorted by id.
+        """
+        account = account or self.account
+        input_channel = await self.get_input_channel(channel_id, account)
+        if input_channel is None:
+            return
+        peer = tg_types.InputPeerChannel(input_channel.channel_id, input_channel.access_hash)
+
+        for start, end in ranges:
+            # the results go from the newest message, before offset_id
+            offset_id = end + 1
+            while True:
+                request = functions.messages.SearchRequest(
+                    peer=peer,
+                    q='',
+                    filter=SEARCH_FILTERS[kind](),
+                    min_date=min_date,
+                    max_date=max_date,
+                    offset_id=offset_id,
+                    add_offset=0,
+                    limit=SEARCH_BATCH_SIZE,
+                    max_id=0,
+                    min_id=start - 1,
+                    hash=0,
+                )
+                result = await account.rate.call(account.client, request)
+                page = getattr(result, 'messages', [])
+                messages = sorted(
+                    (
+                        message
+                        for message in page
+                        if isinstance(message, tg_types.Message) and start <= message.id <= end
+                    ),
+                    key=lambda message: message.id,
+                )
+                logger.debug('found %d messages with %s in %s', len(messages), kind, channel_id)
+                if messages:
+                    yield messages
+                if len(page) < SEARCH_BATCH_SIZE:
+                    break
+                offset_id = min(message.id for message in page)
+                if offset_id <= start:
+                    break
+
+    async def iter_new_messages(self,
+                                channel_ids: list[Union[int, str]],
+                                subscribed: Optional[asyncio.Event] = None,
+                                ) -> AsyncIterator[tuple[Union[int, str], tg_types.Message, Account]]:
+        """Yield the new messages of the channels as they are posted.
+
+        Each channel is watched by one account (see `find_account`), the
+        ones that no account can see are skipped. The clients keep connected
+        while the iteration goes on. The messages posted after the
+        subscription wait until they are taken.
+
+        Args:
+            channel_ids (list[Union[int, str]]): The channel IDs or usernames.
+            subscribed (Optional[asyncio.Event]): Set when the new messages
+                are received, so the history can be paged after it without
+                missing a post.
+
+        Raises:
+            ValueError: If no channel can be watched.
+
+        Yields:
+            tuple[Union[int, str], Message, Account]: The channel ID, as it
+            was given, the next new message and the account that got it.
+        """
+        chats: dict[Account, list[tg_types.InputPeerChannel]] = {}
+        given_ids: dict[int, Union[int, str]] = {}
+        for channel_id in channel_ids:
+            account = await self.find_account(channel_id)
+            if account is None:
+                continue
+            input_channel = await self.get_input_channel(channel_id, account)
+            chats.setdefault(account, []).append(
+                tg_types.InputPeerChannel(input_channel.channel_id, input_channel.access_hash),
+            )
+            given_ids[get_peer_id(tg_types.PeerChannel(input_channel.channel_id))] = channel_id
+        if not chats:
+            raise ValueError('There are no channels to watch')
+
+        queue: asyncio.Queue[tuple[tg_types.Message, Account]] = asyncio.Queue()
+        handlers = []
+        for account, account_chats in chats.items():
+            async def on_new_message(event, account=account):
+                queue.put_nowait((event.message, account))
+
+            event_filter = events.NewMessage(chats=account_chats)
+            account.client.add_event_handler(on_new_message, event_filter)
+            handlers.append((account, on_new_message, event_filter))
+        logger.info('watching %d channels', len(given_ids))
+        if subscribed is not None:
+            subscribed.set()
+        try:
+            while True:
+                message, account = await queue.get()
+                peer_id = get_peer_id(message.peer_id)
+                yield given_ids.get(peer_id, peer_id), message, account
+        finally:
+            for account, on_new_message, event_filter in handlers:
+                account.client.remove_event_handler(on_new_message, event_filter)
+
+    async def download_many(self,
+                            targets: Union[Iterable, AsyncIterable],
+                            concurrency: int = 4,
+                            infer_extension: Optional[bool] = None,
+                            ) -> AsyncIterator[DownloadResult]:
+        """Download the media of many messages, yielding the results as they finish.
+
+        The targets are `Target` objects or `(channel_id, message_id,
+        output_filename)` tuples, from an iterable or an async iterable. They
+        are grouped by channel (see `pipeline.group_targets`) and run through
+        the same pipeline as the CLI (see `pipeline.download_batches`): the
+        messages are fetched with batched requests, and up to `concurrency`
+        downloads run at the same time. The targets are taken from the input
+        only when there is room for them, so the input is never loaded at
+        once.
+
+        A target without output filename gets a unique one from the planner,
+        `<channel>-<message>` by default.
+
+        Args:
+            targets (Union[Iterable, AsyncIterable]): The targets.
+            concurrency (int, optional): The message requests, and the
+                downloads, running at the same time. Defaults to 4.
+            infer_extension (Optional[bool]): Add the extension of the media
+                to the output filenames.
+
+        Yields:
+            DownloadResult: The result of each target, in completion order.
+        """
+        async def iterate_targets() -> AsyncIterator[Target]:
+            items = targets if hasattr(targets, '__aiter__') else utils.aiterate(cast(Iterable, targets))
+            async for item in cast(AsyncIterable, items):
+                target = item if isinstance(item, Target) else Target(*item)
+                if target.channel_name is None:
+                    target.channel_name = target.channel_id
+                target.channel_id = utils.parse_channel_id(target.channel_id)
+                if target.output_filename is not None:
+                    # the default names must not take a given one
+                    self.planner.reserve(target.output_filename)
+                yield target
+
+        results = download_batches(
+            self,
+            group_targets(iterate_targets()),
+            filename_generator(self.planner, bool(infer_extension)),
+            PipelineOptions(concurrency=concurrency, infer_extension=infer_extension),
+            ordered=False,
+        )
+        try:
+            async for target, _ in results:
+                yield DownloadResult.from_stats(cast(DownloadStats, target.stats))
+        finally:
+            await results.aclose()
+
     async def download_media(self,
                       channel_id: Union[int, str],
                       message_id: int,
                       output_filename: str,
                       infer_extension: Optional[bool] = None,
                       discussion_message_id: Optional[int] = None,
+                      message: Optional[tg_types.Message] = None,
+                      stats: Optional[DownloadStats] = None,
+                      account: Optional[Account] = None,
+                      item_filenames: Optional[list[str]] = None,
                       ):
         """Read a message in a channel and download the media to output.
 
+        The timings and counters of the download are recorded in `metrics`.
+
         Args:
             client (TelegramClient): The Telegram client object.
             channel_id (int): The channel ID.
             message_id (int): The message ID.
             output_filename (str): The output filename.
+            message (Optional[Message]): The message when it was already
+                fetched (see `get_messages`). If None, it will be requested.
+            stats (Optional[DownloadStats]): The stats of the download, with
+                the timings of the message request when it was already fetched.
+            account (Optional[Account]): The account that fetched the message.
+                If None, it is chosen by `find_account` to fetch it, or the
+                first one is used.
+            item_filenames (Optional[list[str]]): The planned filenames of the
+                items of a paid media (see `plan_item_filenames`).
         """
-        if self.dry_mode:
-            logger.info('dry running')
-
+        if stats is None:
+            stats = DownloadStats(channel_id, message_id)
+        stats.output_filename = output_filename
+        stats.started_at = time.monotonic()
+        token = current_stats.set(stats)
         try:
-            entity = await self.client.get_entity(channel_id)
-            if not isinstance(entity, tg_types.Channel):
-                logger.warning('Cannot get a Channel object from that channel id')
-                return
-            if entity.access_hash is None:
-                logger.warning('Cannot get the access hash for that channel')
-                return
+            output_filename = await self.download_message_media(
+                channel_id,
+                message_id,
+                output_filename,
+                stats,
+                infer_extension,
+                discussion_message_id,
+                message,
+                account,
+                item_filenames,
+            )
+            if output_filename is not None:
+                stats.output_filename = output_filename
+            return output_filename
+        finally:
+            current_stats.reset(token)
+            self.metrics.record(stats)
 
-            input_channel = tg_types.InputChannel(entity.id, entity.access_hash)
+    async def download_message_media(self,
+                                     channel_id: Union[int, str],
+                                     message_id: int,
+                                     output_filename: str,
+                                     stats: DownloadStats,
+                                     infer_extension: Optional[bool] = None,
+                                     discussion_message_id: Optional[int] = None,
+                                     message: Optional[tg_types.Message] = None,
+                                     account: Optional[Account] = None,
+                                     item_filenames: Optional[list[str]] = None,
+                                     ):
+        """Download the media of a message, see `download_media`.
 
-            id = tg_types.InputMessageID(message_id)
+        Args:
+            channel_id (int): The channel ID.
+            message_id (int): The message ID.
+            output_filename (str): The output filename.
+            stats (DownloadStats): The stats of the download, its status is
+                set here.
+            infer_extension (Optional[bool]): Infer the file extension.
+            discussion_message_id (Optional[int]): The message ID in the
+                discussion group.
+            message (Optional[Message]): The message, if it was fetched.
+            account (Optional[Account]): The account that fetched the message.
+            item_filenames (Optional[list[str]]): The planned filenames of the
+                items of a paid media.
 
-            messages_request = channels.GetMessagesRequest(input_channel, [id])
-            channel_messages = await self.client(messages_request)
-            if not isinstance(channel_messages, tg_types.messages.ChannelMessages):
-                logger.warning('Cannot continue because the got type is not a ChannelMessages')
-                return
+        Returns:
+            Optional[str]: The downloaded filename, None if there is nothing
+            downloaded.
+        """
+        if self.dry_mode:
+            logger.info('dry running')
 
-            message = channel_messages.messages[0]
-            if not isinstance(message, tg_types.Message):
-                logger.warning('Cannot continue because the got type is not a Message')
-                return
+        try:
+            if message is None:
+                start = time.monotonic()
+                if account is None:
+                    account = await self.find_account(channel_id)
+                else:
+                    await self.get_input_channel(channel_id, account)
+                stats.resolve = time.monotonic() - start
+                if account is None:
+                    stats.reason = 'channel not found'
+                    return
+                messages = await self.get_messages(channel_id, [message_id], account)
+                stats.metadata = time.monotonic() - start - stats.resolve
+                if message_id not in messages:
+                    logger.warning('Cannot find the message %s in %s', message_id, channel_id)
+                    stats.reason = 'message not found'
+                    return
+                message = messages[message_id]
 
+            account = account or self.account
             logger.info('downloading...')
 
             if discussion_message_id:
                 logger.info('finding message from a discussion group')
-                if message.replies and message.replies.comments:
-                    input_peer = await self.client.get_input_entity(message.peer_id)
-                    request = functions.messages.GetDiscussionMessageRequest(
-                        peer=input_peer,
-                        msg_id=message.id,
-                    )
-                    discussion_message = await self.client(request)
-                    if not isinstance(discussion_message, tg_types.messages.DiscussionMessage):
-                        logger.warning('Cannot get the discussion message')
-                        return
-
-                    comment_message = discussion_message.messages[0]
-                    if comment_message.peer_id is None:
-                        logger.warning('Found a discussion message peer id as none')
-                        return
-
-                    entity = await self.client.get_entity(
-                        comment_message.peer_id,
-                    )
-                    if not isinstance(entity, tg_types.Channel):
-                        logger.warning('Cannot get a Channel object from the discussion message id')
-                        return
-                    if entity.access_hash is None:
-                        logger.warning('Cannot get the access hash for that channel')
-                        return
-                    
-                    input_channel = tg_types.InputChannel(entity.id, entity.access_hash)
-                    id = tg_types.InputMessageID(discussion_message_id)
-                    messages_request = channels.GetMessagesRequest(input_channel, [id])
-                    channel_messages = await self.client(messages_request)
-                    if not isinstance(channel_messages, tg_types.messages.ChannelMessages):
-                        logger.warning('Cannot continue because the got type is not a ChannelMessages from the discussion channel')
-                        return
-                    # overwrite the object message
-                    message = channel_messages.messages[0]
-                    if not isinstance(message, tg_types.Message):
-                        logger.warning('Cannot continue because the got type is not a Message  from the discussion channel')
-                        return
-                else:
-                    logger.error('message with no comments')
+                group_id = await self.get_discussion_group(channel_id, message.id, account)
+                if group_id is None:
+                    stats.reason = 'discussion group not found'
+                    return
+                comments = await self.get_messages(group_id, [discussion_message_id], account)
+                if discussion_message_id not in comments:
+                    logger.warning('Cannot find the comment %s in the discussion group', discussion_message_id)
+                    stats.reason = 'comment not found'
                     return
+                message = comments[discussion_message_id]
 
             if self.dry_mode:
+                stats.status = 'dry-run'
                 return output_filename
-            
+
+            await account.connect()
+
             media = message.media
             if media is None:
                 logger.warning('No media found')
+                stats.status = 'skipped'
+                stats.reason = 'no media'
                 return
 
-            with open(output_filename, 'wb+') as file:
-                if isinstance(media, tg_types.MessageMediaPaidMedia):
-                    logger.debug('paid message found')
-                    for message_extended_media in media.extended_media:
-                        if isinstance(message_extended_media, tg_types.MessageExtendedMedia):
-                            await self.client.download_file(message_extended_media.media, file)
-                        else:
-                            logger.warning('Cannot find a message extended media')
-                            return
-                else:
-                    await self.client.download_file(media, file)
-                logger.info('downloaded to %s', output_filename)
-
-                if infer_extension:
-                    result = filetype.guess(output_filename)
-                    if result:
-                        ext = result.extension
-                        new_output_filename = f'{output_filename}.{ext}'
-                        os.rename(output_filename, new_output_filename)
-                        logger.debug('rename to %s', new_output_filename)
-                        return new_output_filename
-                return output_filename
+            ext = get_media_extension(media) if infer_extension else None
+            if ext and not output_filename.endswith(f'.{ext}'):
+                output_filename = self.planner.claim(f'{output_filename}.{ext}', get_media_info(media)[1])
+
+            directory = os.path.dirname(output_filename)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            start = time.monotonic()
+            if isinstance(media, tg_types.MessageMediaPaidMedia):
+                logger.debug('paid message found')
+                items = get_paid_media_items(media)
+                if items is None:
+                    logger.warning('Cannot find a message extended media')
+                    stats.reason = 'extended media not found'
+                    return
+                stats.files = await self.download_paid_media(
+                    items,
+                    output_filename,
+                    infer_extension,
+                    account,
+                    item_filenames,
+                )
+                output_filename = stats.files[0]
+            else:
+                downloaded_filename = self.find_downloaded(media, output_filename)
+                if downloaded_filename is not None:
+                    stats.status = 'skipped'
+                    stats.reason = 'already downloaded'
+                    return downloaded_filename
+                output_filename = await self.download_file(
+                    media,
+                    output_filename,
+                    sniff_extension=bool(infer_extension) and not ext,
+                    account=account,
+                )
+            stats.transfer = time.monotonic() - start - stats.rename
+            logger.info('downloaded to %s', output_filename)
+
+            self.index_downloaded(media, output_filename)
+            stats.status = 'downloaded'
+            return output_filename
         except Exception as err:
             logger.error('Error: channel_id=%s, message_id=%s, output_filename=%s, infer_extension=%s',
                          channel_id,
@@ -203,3 +1392,4 @@ class RCD:
                          output_filename,
                          infer_extension)
             logger.error(err)
+            stats.reason = str(err) or type(err).__name__
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+# MIT License
+#
+# Copyright (c) 2025 David256
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Checkpoints to resume the interrupted downloads
+"""
+import os
+import json
+import time
+from typing import Optional
+
+from rcdtool.log import logger
+
+
+PART_EXTENSION = '.part'
+MANIFEST_EXTENSION = '.part.json'
+
+# The downloaded files of a directory, with their media ids, so a later run
+# finds them even if their names got a counter (see `find_downloads`)
+DOWNLOADS_FILENAME = '.rcdtool-downloads.jsonl'
+
+# The marked parts are saved after this many parts or seconds, and when the
+# download stops (see `Checkpoint.flush`)
+SAVE_EVERY_PARTS = 64
+SAVE_EVERY_SECONDS = 1.0
+
+
+class Checkpoint:
+    """Progress of a download.
+
+    The data is written to a `.part` file next to the output file, and the
+    downloaded parts are saved in a small manifest. The manifest grows with
+    the file, so it is not saved for every part but every `SAVE_EVERY_PARTS`
+    parts or `SAVE_EVERY_SECONDS` seconds, and by `flush` when the download
+    stops. When the download finishes, the `.part` file is renamed to the
+    output filename.
+    """
+
+    def __init__(self,
+                 output_filename: str,
+                 media_id: Optional[int],
+                 size: Optional[int],
+                 part_size: int,
+                 ):
+        self.output_filename = output_filename
+        self.part_filename = output_filename + PART_EXTENSION
+        self.manifest_filename = output_filename + MANIFEST_EXTENSION
+        self.media_id = media_id
+        self.size = size
+        self.part_size = part_size
+        self.completed: set[int] = set()
+        # the marked parts that are not saved yet
+        self.unsaved = 0
+        self.saved_at = time.monotonic()
+        # the first bytes of the file, kept to sniff its type
+        self.head = b''
+
+    def load(self) -> bool:
+        """Load the progress of a previous run of the same media.
+
+        Returns:
+            bool: True if there is progress to resume.
+        """
+        if not os.path.exists(self.manifest_filename) or not os.path.exists(self.part_filename):
+            return False
+        try:
+            with open(self.manifest_filename, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError) as err:
+            logger.warning('Cannot read the checkpoint %s: %s', self.manifest_filename, err)
+            return False
+
+        if (
+            data.get('media_id') != self.media_id
+            or data.get('size') != self.size
+            or data.get('part_size') != self.part_size
+        ):
+            logger.debug('the checkpoint %s is from another media', self.manifest_filename)
+            return False
+
+        self.completed = set(data.get('completed', []))
+        logger.info('resuming %s from %d bytes', self.output_filename, self.downloaded)
+        return bool(self.completed)
+
+    def save(self):
+        """Save the manifest atomically."""
+        data = {
+            'media_id': self.media_id,
+            'size': self.size,
+            'part_size': self.part_size,
+            'completed': sorted(self.completed),
+        }
+        temp_filename = f'{self.manifest_filename}.tmp'
+        with open(temp_filename, 'w', encoding='utf-8') as file:
+            json.dump(data, file)
+        os.replace(temp_filename, self.manifest_filename)
+        self.unsaved = 0
+        self.saved_at = time.monotonic()
+
+    def mark(self, *offsets: int):
+        """Mark some parts as downloaded, saving them from time to time.
+
+        Args:
+            *offsets (int): The offsets of the parts.
+        """
+        self.completed.update(offsets)
+        self.unsaved += len(offsets)
+        if (
+            self.unsaved >= SAVE_EVERY_PARTS
+            or time.monotonic() - self.saved_at >= SAVE_EVERY_SECONDS
+        ):
+            self.save()
+
+    def flush(self):
+        """Save the marked parts that are not saved yet."""
+        if self.unsaved:
+            self.save()
+
+    @property
+    def downloaded(self) -> int:
+        """The number of downloaded bytes."""
+        total = len(self.completed) * self.part_size
+        if self.size is not None:
+            total = min(total, self.size)
+        return total
+
+    @property
+    def contiguous_offset(self) -> int:
+        """The offset of the first part that is not downloaded."""
+        offset = 0
+        while offset in self.completed:
+            offset += self.part_size
+        return offset
+
+    def finish(self, output_filename: Optional[str] = None):
+        """Rename the `.part` file to the output filename and drop the manifest.
+
+        Args:
+            output_filename (Optional[str]): The final filename, if it is not
+                the planned one (for example, with an inferred extension).
+        """
+        if output_filename is not None:
+            self.output_filename = output_filename
+        os.replace(self.part_filename, self.output_filename)
+        if os.path.exists(self.manifest_filename):
+            os.remove(self.manifest_filename)
+        record_download(self.output_filename, self.media_id)
+
+
+def record_download(output_filename: str, media_id: Optional[int]):
+    """Add a downloaded file to the list of its directory.
+
+    Args:
+        output_filename (str): The downloaded file.
+        media_id (Optional[int]): Its media id. If None, nothing is added.
+    """
+    if media_id is None:
+        return
+    directory, filename = os.path.split(output_filename)
+    try:
+        with open(os.path.join(directory, DOWNLOADS_FILENAME), 'a', encoding='utf-8') as file:
+            file.write(json.dumps({'name': filename, 'media_id': media_id}) + '\n')
+    except OSError as err:
+        logger.warning('Cannot record the download of %s: %s', output_filename, err)
+
+
+def find_downloads(directory: str, names: set[str]) -> dict[int, list[str]]:
+    """Find the files that the previous runs left in a directory, by media id.
+
+    They are the downloaded files of the list of the directory, and the
+    `.part` files with a manifest. The names that are not in the directory
+    are ignored.
+
+    Args:
+        directory (str): The directory.
+        names (set[str]): The names in the directory.
+
+    Returns:
+        dict[int, list[str]]: The names of the files of each media id.
+    """
+    downloads: dict[int, list[str]] = {}
+    if DOWNLOADS_FILENAME in names:
+        try:
+            with open(os.path.join(directory, DOWNLOADS_FILENAME), 'r', encoding='utf-8') as file:
+                for line in file:
+                    entry = json.loads(line)
+                    if entry['name'] in names:
+                        downloads.setdefault(entry['media_id'], []).append(entry['name'])
+        except (OSError, ValueError, KeyError) as err:
+            logger.warning('Cannot read the downloads of %s: %s', directory or '.', err)
+
+    for name in names:
+        filename = name[:-len(MANIFEST_EXTENSION)]
+        if not name.endswith(MANIFEST_EXTENSION) or filename + PART_EXTENSION not in names or filename in names:
+            continue
+        try:
+            with open(os.path.join(directory, name), 'r', encoding='utf-8') as file:
+                media_id = json.load(file).get('media_id')
+        except (OSError, ValueError, AttributeError) as err:
+            logger.debug('cannot read the checkpoint %s: %s', name, err)
+            continue
+        if media_id is not None:
+            downloads.setdefault(media_id, []).append(filename)
+    return downloads
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+# MIT License
+#
+# Copyright (c) 2025 David256
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Worker pool to run the jobs with bounded concurrency
+"""
+import heapq
+import asyncio
+import itertools
+import contextlib
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Hashable, Optional
+
+from rcdtool.log import logger
+
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class Scheduler:
+    """Run jobs in a pool of workers.
+
+    Each job belongs to a key (the channel). The workers take the jobs of the
+    keys in turns, so a key with a lot of jobs cannot starve the others.
+    Within a key, the jobs with higher priority go first, and the ones with
+    the same priority keep their order.
+
+    A job must not wait for another job of the same pool: with all the
+    workers waiting, nothing would run. Use separate pools instead.
+    """
+
+    def __init__(self, concurrency: int = 4):
+        self.concurrency = concurrency
+        self.queues: dict[Hashable, list[tuple[float, int, Job, asyncio.Future]]] = {}
+        self.counter = itertools.count()
+        self.order: deque[Hashable] = deque()
+        self.ready = asyncio.Event()
+        self.workers: list[asyncio.Task] = []
+        # the workers are being cancelled by `close`
+        self.closing = False
+
+    def submit(self, key: Hashable, job: Job, priority: float = 0) -> asyncio.Future:
+        """Add a job to the queue of a key.
+
+        Args:
+            key (Hashable): The key of the job, usually the channel id.
+            job (Job): The function that creates the job coroutine.
+            priority (float, optional): The jobs with higher priority run
+                first. Defaults to 0.
+
+        Returns:
+            asyncio.Future: The future of the job result.
+        """
+        future = asyncio.get_running_loop().create_future()
+        if key not in self.queues:
+            self.queues[key] = []
+            self.order.append(key)
+        heapq.heappush(self.queues[key], (-priority, next(self.counter), job, future))
+        self.ready.set()
+        if not self.workers:
+            self.start()
+        return future
+
+    def next_job(self) -> Optional[tuple[Job, asyncio.Future]]:
+        """Take the next job, in turns by key.
+
+        Returns:
+            Optional[tuple[Job, asyncio.Future]]: The job and its future, or
+            None if there are no queued jobs.
+        """
+        if not self.order:
+            return None
+        key = self.order.popleft()
+        queue = self.queues[key]
+        _, _, job, future = heapq.heappop(queue)
+        if queue:
+            self.order.append(key)
+        else:
+            del self.queues[key]
+        return job, future
+
+    async def worker(self):
+        """Run the queued jobs forever.
+
+        A job cancelled by itself (for example, it awaited a cancelled task)
+        cancels its future, and the worker goes on with the next job. The
+        worker stops only when it is cancelled.
+        """
+        while True:
+            item = self.next_job()
+            if item is None:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+
+            job, future = item
+            if future.cancelled():
+                continue
+            try:
+                result = await job()
+            except asyncio.CancelledError:
+                future.cancel()
+                task = asyncio.current_task()
+                if self.closing or (hasattr(task, 'cancelling') and task.cancelling()):
+                    raise
+                logger.debug('a job was cancelled')
+            except Exception as err:
+                if not future.cancelled():
+                    future.set_exception(err)
+            else:
+                if not future.cancelled():
+                    future.set_result(result)
+
+    def start(self):
+        """Start the workers."""
+        logger.debug('starting %d workers', self.concurrency)
+        self.workers = [
+            asyncio.ensure_future(self.worker())
+            for _ in range(self.concurrency)
+        ]
+
+    async def close(self):
+        """Stop the workers and cancel the queued jobs."""
+        self.closing = True
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        self.closing = False
+        for queue in self.queues.values():
+            for _, _, _, future in queue:
+                future.cancel()
+        self.queues.clear()
+        self.order.clear()
+
+
+class ByteBudget:
+    """Limit the bytes of the transfers running at the same time.
+
+    A transfer bigger than the whole budget runs when no other transfer
+    does, so it is never blocked forever.
+    """
+
+    def __init__(self, limit: int):
+        if limit < 1:
+            raise ValueError(f'The byte budget must be positive: {limit}')
+        self.limit = limit
+        self.in_flight = 0
+        self.changed = asyncio.Condition()
+
+    def fits(self, size: int) -> bool:
+        """Check if a transfer can start now.
+
+        Args:
+            size (int): The bytes of the transfer.
+
+        Returns:
+            bool: True if it fits in the budget.
+        """
+        return self.in_flight == 0 or self.in_flight + size <= self.limit
+
+    @contextlib.asynccontextmanager
+    async def reserve(self, size: int) -> AsyncIterator[None]:
+        """Wait until a transfer fits in the budget, and hold its bytes.
+
+        Args:
+            size (int): The bytes of the transfer.
+        """
+        async with self.changed:
+            await self.changed.wait_for(lambda: self.fits(size))
+            self.in_flight += size
+        try:
+            yield
+        finally:
+            async with self.changed:
+                self.in_flight -= size
+                self.changed.notify_all()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+# MIT License
+#
+# Copyright (c) 2025 David256
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+State of the synchronized channels
+"""
+import os
+import json
+from collections import deque
+from typing import Iterable, Optional, Union
+
+from rcdtool.cache import get_cache_key
+from rcdtool.log import logger
+
+
+class SyncState:
+    """The last processed message id of each channel (high-water mark).
+
+    The marks are saved in a JSON file, so the next sync of a channel only
+    requests the messages newer than its mark.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.marks: dict[str, int] = {}
+        self.load()
+
+    def load(self):
+        """Load the saved marks."""
+        if not os.path.exists(self.filename):
+            return
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as file:
+                self.marks = json.load(file)
+        except (OSError, ValueError) as err:
+            logger.warning('Cannot load the sync state %s: %s', self.filename, err)
+
+    def save(self):
+        """Save the marks atomically."""
+        temp_filename = f'{self.filename}.tmp'
+        with open(temp_filename, 'w', encoding='utf-8') as file:
+            json.dump(self.marks, file)
+        os.replace(temp_filename, self.filename)
+
+    def get(self, channel_id: Union[int, str]) -> int:
+        """Get the mark of a channel.
+
+        Args:
+            channel_id (Union[int, str]): The channel id or username.
+
+        Returns:
+            int: The last processed message id, 0 if the channel was never
+            synchronized.
+        """
+        return self.marks.get(get_cache_key(channel_id), 0)
+
+    def update(self, channel_id: Union[int, str], message_id: Optional[int]):
+        """Move the mark of a channel forward.
+
+        Args:
+            channel_id (Union[int, str]): The channel id or username.
+            message_id (Optional[int]): The last processed message id.
+        """
+        if message_id is None:
+            return
+        key = get_cache_key(channel_id)
+        self.marks[key] = max(self.marks.get(key, 0), message_id)
+
+
+class SyncTracker:
+    """Move the marks of the channels as their messages are processed.
+
+    The messages of a channel are paged in order, and the ones with media
+    are pending until their download is done. The mark of a channel moves up
+    to the last paged message, but stays before the first pending one, and
+    stops for good after a failed download, so the next sync retries it.
+    The messages without media move the mark too, so they are not paged
+    again.
+    """
+
+    def __init__(self, state: SyncState):
+        self.state = state
+        self.paged: dict[str, int] = {}
+        self.pending: dict[str, deque[int]] = {}
+        # the messages done before they were paged, like the items of albums
+        self.done_early: dict[str, set[int]] = {}
+        self.failed: set[str] = set()
+
+    def page(self, channel_id: Union[int, str], last_id: int, message_ids: Iterable[int] = ()):
+        """Record a page of messages of a channel.
+
+        Args:
+            channel_id (Union[int, str]): The channel id or username.
+            last_id (int): The last message id of the page.
+            message_ids (Iterable[int], optional): The ids of the messages
+                to download, in order.
+        """
+        key = get_cache_key(channel_id)
+        done_early = self.done_early.get(key, set())
+        pending = self.pending.setdefault(key, deque())
+        for message_id in message_ids:
+            if message_id in done_early:
+                done_early.discard(message_id)
+            else:
+                pending.append(message_id)
+        self.paged[key] = max(self.paged.get(key, 0), last_id)
+        self.advance(key)
+
+    def last_paged(self, channel_id: Union[int, str]) -> int:
+        """Get the last paged message id of a channel.
+
+        Args:
+            channel_id (Union[int, str]): The channel id or username.
+
+        Returns:
+            int: The message id, 0 if nothing was paged.
+        """
+        return self.paged.get(get_cache_key(channel_id), 0)
+
+    def done(self, channel_id: Union[int, str], message_id: int, ok: bool = True):
+        """Record a processed message.
+
+        Args:
+            channel_id (Union[int, str]): The channel id or username.
+            message_id (int): The message id.
+            ok (bool, optional): False if its download failed. Defaults to
+                True.
+        """
+        key = get_cache_key(channel_id)
+        if not ok:
+            self.failed.add(key)
+        pending = self.pending.get(key)
+        if pending and message_id in pending:
+            pending.remove(message_id)
+        else:
+            self.done_early.setdefault(key, set()).add(message_id)
+        self.advance(key)
+
+    def advance(self, key: str):
+        """Move the mark of a channel as far as its messages are done.
+
+        Args:
+            key (str): The channel key.
+        """
+        if key in self.failed or key not in self.paged:
+            return
+        pending = self.pending.get(key)
+        self.state.update(key, pending[0] - 1 if pending else self.paged[key])
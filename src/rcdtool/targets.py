@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+
+# MIT License
+#
+# Copyright (c) 2025 David256
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Reading of the targets from a file, line by line
+"""
+import os
+import csv
+import json
+from typing import Callable, Iterable, Iterator, Optional
+
+from rcdtool.planner import check_template
+from rcdtool.log import logger
+
+
+# The channel ID, the message IDs (ranges like "1..10,20") and the output
+# filename or template, as they were written in a line
+TargetLine = tuple[str, str, Optional[str]]
+
+TARGET_FORMATS = ('text', 'csv', 'jsonl')
+
+
+def parse_link(link: str) -> tuple[str, str]:
+    """Get the channel ID and the message IDs of a link.
+
+    For example, `https://t.me/c/1234/5..10` gives `('1234', '5..10')`.
+
+    Args:
+        link (str): The message link.
+
+    Raises:
+        ValueError: If it is not a message link.
+
+    Returns:
+        tuple[str, str]: The channel ID and the message IDs.
+    """
+    path = link.strip().split('?')[0].rstrip('/')
+    parts = path.split('/')
+    if len(parts) < 2 or not parts[-2] or not parts[-1]:
+        raise ValueError(f'Not a message link: {link}')
+    return parts[-2], parts[-1]
+
+
+def guess_format(filename: str) -> str:
+    """Guess the format of a targets file by its extension.
+
+    Args:
+        filename (str): The filename, "-" for the standard input.
+
+    Returns:
+        str: The format, "text" if it is unknown.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == '.csv':
+        return 'csv'
+    if ext in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    return 'text'
+
+
+def parse_fields(link: Optional[str],
+                 channel_id: Optional[str],
+                 message_ids: Optional[str],
+                 output: Optional[str],
+                 ) -> TargetLine:
+    """Build a target line from its fields.
+
+    Args:
+        link (Optional[str]): The message link, instead of the channel and
+            message IDs.
+        channel_id (Optional[str]): The channel ID.
+        message_ids (Optional[str]): The message IDs.
+        output (Optional[str]): The output filename or template.
+
+    Raises:
+        ValueError: If the fields are not enough or the output is invalid.
+
+    Returns:
+        TargetLine: The target line.
+    """
+    if link:
+        channel_id, message_ids = parse_link(link)
+    if not channel_id or not message_ids:
+        raise ValueError('A link, or a channel and message IDs, are required')
+    output = output or None
+    if output is not None:
+        check_template(output)
+    return channel_id, message_ids, output
+
+
+def parse_text_line(line: str) -> Optional[TargetLine]:
+    """Parse a line of a text file.
+
+    The line has a link, or a channel ID and the message IDs, separated by
+    spaces, and optionally an output filename. The empty lines and the lines
+    that start with "#" are skipped.
+
+    Args:
+        line (str): The line.
+
+    Returns:
+        Optional[TargetLine]: The target, None for skipped lines.
+    """
+    fields = line.split()
+    if not fields or fields[0].startswith('#'):
+        return None
+    if '/' in fields[0]:
+        return parse_fields(fields[0], None, None, ' '.join(fields[1:]))
+    message_ids = fields[1] if len(fields) > 1 else None
+    return parse_fields(None, fields[0], message_ids, ' '.join(fields[2:]))
+
+
+def parse_jsonl_line(line: str) -> Optional[TargetLine]:
+    """Parse a line of a JSON lines file.
+
+    The line is an object with a `link`, or a `channel` and a `message`
+    (a number or ranges), and optionally an `output`.
+
+    Args:
+        line (str): The line.
+
+    Raises:
+        ValueError: If the line is not a JSON object.
+
+    Returns:
+        Optional[TargetLine]: The target, None for empty lines.
+    """
+    if not line.strip():
+        return None
+    data = json.loads(line)
+    if not isinstance(data, dict):
+        raise ValueError('Each line must be a JSON object')
+    channel_id = data.get('channel')
+    message_ids = data.get('message')
+    return parse_fields(
+        data.get('link'),
+        str(channel_id) if channel_id is not None else None,
+        str(message_ids) if message_ids is not None else None,
+        data.get('output'),
+    )
+
+
+def iter_csv_rows(lines: Iterable[str]) -> Iterator[tuple[int, Callable[[], Optional[TargetLine]]]]:
+    """Parse the rows of a CSV file.
+
+    The columns are `link,output` or `channel,message,output`. If the first
+    row is a header with those names, the columns can be in any order.
+
+    Args:
+        lines (Iterable[str]): The lines.
+
+    Yields:
+        tuple[int, Callable[[], Optional[TargetLine]]]: The row number and
+        the function that parses the row.
+    """
+    header: Optional[list[str]] = None
+    for number, row in enumerate(csv.reader(lines), start=1):
+        row = [cell.strip() for cell in row]
+        if number == 1 and {'link', 'channel'} & {cell.lower() for cell in row}:
+            header = [cell.lower() for cell in row]
+            continue
+
+        def parse(row=row) -> Optional[TargetLine]:
+            if not any(row):
+                return None
+            if header is not None:
+                fields = dict(zip(header, row))
+                return parse_fields(fields.get('link'), fields.get('channel'), fields.get('message'), fields.get('output'))
+            if '/' in row[0]:
+                return parse_fields(row[0], None, None, row[1] if len(row) > 1 else None)
+            return parse_fields(
+                None,
+                row[0],
+                row[1] if len(row) > 1 else None,
+                row[2] if len(row) > 2 else None,
+            )
+
+        yield number, parse
+
+
+def iter_target_lines(file: Iterable[str], target_format: str = 'text') -> Iterator[TargetLine]:
+    """Read the targets of a file lazily, one line at a time.
+
+    The invalid lines are logged and skipped.
+
+    Args:
+        file (Iterable[str]): The opened file, or any iterable of lines.
+        target_format (str, optional): The format: "text", "csv" or "jsonl".
+            Defaults to "text".
+
+    Raises:
+        ValueError: If the format is unknown.
+
+    Yields:
+        TargetLine: The next target.
+    """
+    if target_format == 'csv':
+        rows = iter_csv_rows(file)
+    elif target_format in ('text', 'jsonl'):
+        parse_line = parse_text_line if target_format == 'text' else parse_jsonl_line
+        rows = (
+            (number, lambda line=line: parse_line(line))
+            for number, line in enumerate(file, start=1)
+        )
+    else:
+        raise ValueError(f'Unknown targets format: {target_format}')
+
+    for number, parse in rows:
+        try:
+            target = parse()
+        except ValueError as err:
+            logger.warning('Skipping the line %d of the targets: %s', number, err)
+            continue
+        if target is not None:
+            yield target
@@ -22,9 +22,12 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from typing import Union
+from typing import AsyncIterator, Iterable, Iterator, TypeVar, Union, cast
+import asyncio
 import re
 
+T = TypeVar('T')
+
 def parse_channel_id(channel_id: Union[str, int]):
     """Parse the channel id.
     
@@ -74,4 +77,107 @@ def parse_ranges(input_string: str):
             start = parse_message_id(_match.group(1))
             end = parse_message_id(_match.group(2)) if _match.group(2) else start
             ranges.append((start, end))
-    return ranges
\ No newline at end of file
+    return ranges
+
+def merge_ranges(ranges: Iterable[tuple[int, int]]) -> list[tuple[int, int]]:
+    """Sort the ranges and merge the overlapping or adjacent ones.
+
+    For example, `[(50, 150), (1, 100), (151, 160)]` becomes `[(1, 160)]`.
+
+    Args:
+        ranges (Iterable[tuple[int, int]]): The ranges, both ends included.
+
+    Returns:
+        list[tuple[int, int]]: The merged ranges, sorted.
+    """
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted((min(r), max(r)) for r in ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def iter_ranges(ranges: Iterable[tuple[int, int]]) -> Iterator[int]:
+    """Yield the values of the ranges, without building a list.
+
+    Args:
+        ranges (Iterable[tuple[int, int]]): The ranges, both ends included.
+
+    Yields:
+        int: The next value.
+    """
+    for start, end in ranges:
+        yield from range(start, end + 1)
+
+
+def interleave(*iterables: Iterable[T]) -> Iterator[T]:
+    """Take the items of the iterables in turns, until all are exhausted.
+
+    Args:
+        *iterables (Iterable[T]): The iterables.
+
+    Yields:
+        T: The next item.
+    """
+    iterators = [iter(iterable) for iterable in iterables]
+    while iterators:
+        for iterator in list(iterators):
+            try:
+                yield next(iterator)
+            except StopIteration:
+                iterators.remove(iterator)
+
+
+def chunks(items: Iterable[T], size: int) -> Iterator[list[T]]:
+    """Split an iterable in lists of at most `size` items.
+
+    Args:
+        items (Iterable[T]): The items to split.
+        size (int): The max length of each chunk.
+
+    Yields:
+        list[T]: The next chunk.
+    """
+    chunk: list[T] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def aiterate(items: Iterable[T]) -> AsyncIterator[T]:
+    """Iterate an iterable as an async iterable.
+
+    Args:
+        items (Iterable[T]): The items.
+
+    Yields:
+        T: The next item.
+    """
+    for item in items:
+        yield item
+
+
+async def aiterate_in_thread(items: Iterable[T]) -> AsyncIterator[T]:
+    """Iterate an iterable as an async iterable, taking each item in a thread.
+
+    Useful when getting the items blocks, like reading lines of a pipe.
+
+    Args:
+        items (Iterable[T]): The items.
+
+    Yields:
+        T: The next item.
+    """
+    iterator = iter(items)
+    done = object()
+    while True:
+        item = await asyncio.to_thread(next, iterator, done)
+        if item is done:
+            return
+        yield cast(T, item)
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+
+# MIT License
+#
+# Copyright (c) 2025 David256
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Write-behind writer of the downloaded files
+"""
+import os
+import queue
+import asyncio
+import threading
+from collections import deque
+from typing import BinaryIO, Callable, Optional, Union
+
+from rcdtool.log import logger
+from rcdtool.checksum import StreamChecksum
+
+
+# Max bytes queued for the writer of a file, the downloads wait when it is full
+WRITE_BUFFER = 16 * 1024 * 1024
+# Max bytes of consecutive parts joined in one write
+COALESCE_SIZE = 4 * 1024 * 1024
+
+# When the data is flushed to the disk: never (the OS decides), at the end of
+# each file, or after each write
+FSYNC_POLICIES = ('never', 'end', 'always')
+
+
+def preallocate(file: BinaryIO, size: int):
+    """Reserve the space of the file in disk.
+
+    Args:
+        file (BinaryIO): The opened file.
+        size (int): The final size of the file.
+    """
+    if size <= 0:
+        return
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(file.fileno(), 0, size)
+            return
+        except OSError:
+            # some filesystems do not support it
+            pass
+    file.truncate(size)
+
+
+def write_at(file: BinaryIO, offset: int, data: Union[bytes, memoryview]):
+    """Write data in a position of the file.
+
+    Args:
+        file (BinaryIO): The opened file.
+        offset (int): The position in the file.
+        data (Union[bytes, memoryview]): The data to write.
+    """
+    if hasattr(os, 'pwrite'):
+        os.pwrite(file.fileno(), data, offset)
+    else:
+        file.seek(offset)
+        file.write(data)
+
+
+class FileWriter:
+    """Write the parts of a file from a dedicated thread.
+
+    The downloads queue the parts and go on with the network while the disk
+    catches up. The queued bytes are bounded by `max_buffer`: `write` waits
+    when the queue is full. The consecutive queued parts are joined in writes
+    of up to `coalesce_size` bytes. If the size is known, the file is
+    preallocated first.
+
+    `on_written` is called from the writer thread with the offsets of the
+    parts that are in the file, for example to save a checkpoint. With a
+    `checksum`, the parts are also hashed in the writer thread, and `digest`
+    has the checksum of the file after `close`. A writer closed as `failed`
+    neither finishes the checksum nor syncs the file.
+    """
+
+    def __init__(self,
+                 file: BinaryIO,
+                 size: Optional[int] = None,
+                 fsync: str = 'never',
+                 max_buffer: int = WRITE_BUFFER,
+                 coalesce_size: int = COALESCE_SIZE,
+                 on_written: Optional[Callable[..., None]] = None,
+                 checksum: Optional[StreamChecksum] = None,
+                 ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f'Unknown fsync policy: {fsync}')
+        self.file = file
+        self.size = size
+        self.fsync = fsync
+        self.max_buffer = max_buffer
+        self.coalesce_size = coalesce_size
+        self.on_written = on_written
+        self.checksum = checksum
+        self.digest: Optional[str] = None
+        self.loop = asyncio.get_running_loop()
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.buffered = 0
+        self.room = asyncio.Event()
+        self.room.set()
+        self.error: Optional[BaseException] = None
+        self.writes = 0
+        self.closed = False
+        self.failed = False
+        self.thread = threading.Thread(target=self.run, name='rcdtool-writer', daemon=True)
+        self.thread.start()
+
+    def check(self):
+        """Raise the error of the writer thread, if any."""
+        if self.error is not None:
+            raise self.error
+
+    async def write(self, offset: int, data: bytes):
+        """Queue a part, waiting while the buffer is full.
+
+        Args:
+            offset (int): The position of the part in the file.
+            data (bytes): The part.
+        """
+        self.check()
+        # a part bigger than the buffer goes alone
+        while self.buffered and self.buffered + len(data) > self.max_buffer:
+            self.room.clear()
+            await self.room.wait()
+            self.check()
+        self.buffered += len(data)
+        self.queue.put((offset, data))
+
+    async def flush(self):
+        """Wait until the queued parts are written."""
+        future = self.loop.create_future()
+        self.queue.put(future)
+        await future
+        self.check()
+
+    async def close(self, failed: bool = False):
+        """Write the queued parts, sync them as configured and stop the thread.
+
+        Args:
+            failed (bool, optional): The download failed: the checksum is not
+                finished and the errors of the writer are not raised, so they
+                do not hide the error of the download. Defaults to False.
+        """
+        if not self.closed:
+            self.closed = True
+            self.failed = failed
+            self.queue.put(None)
+            await asyncio.to_thread(self.thread.join)
+        if not failed:
+            self.check()
+
+    def release(self, size: int):
+        """Free the room of written bytes, in the event loop.
+
+        Args:
+            size (int): The written bytes.
+        """
+        self.buffered -= size
+        self.room.set()
+
+    def run(self):
+        """Write the queued parts until the writer is closed."""
+        if self.size:
+            try:
+                preallocate(self.file, self.size)
+            except OSError as err:
+                self.error = err
+
+        pending: deque = deque()
+        while True:
+            item = pending.popleft() if pending else self.queue.get()
+            if item is None:
+                break
+            if isinstance(item, asyncio.Future):
+                self.loop.call_soon_threadsafe(self.resolve, item)
+                continue
+
+            # join the next queued parts that follow this one
+            offset, data = item
+            offsets = [offset]
+            chunks = [data]
+            end = offset + len(data)
+            total = len(data)
+            while total < self.coalesce_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, tuple) and item[0] == end:
+                    offsets.append(item[0])
+                    chunks.append(item[1])
+                    end += len(item[1])
+                    total += len(item[1])
+                else:
+                    pending.append(item)
+                    break
+
+            self.write_chunks(offset, chunks, offsets)
+            self.loop.call_soon_threadsafe(self.release, total)
+
+        if self.failed:
+            return
+
+        if self.error is None and self.checksum is not None:
+            try:
+                self.digest = self.checksum.finish(self.file)
+            except OSError as err:
+                self.error = err
+
+        if self.error is None and self.fsync != 'never':
+            try:
+                os.fsync(self.file.fileno())
+            except OSError as err:
+                self.error = err
+
+    def write_chunks(self, offset: int, chunks: list[bytes], offsets: list[int]):
+        """Write consecutive parts at once, in the writer thread.
+
+        Args:
+            offset (int): The position of the first part.
+            chunks (list[bytes]): The parts.
+            offsets (list[int]): The offset of each part.
+        """
+        if self.error is not None:
+            # the parts are dropped, the download fails with the error
+            return
+        try:
+            write_at(self.file, offset, chunks[0] if len(chunks) == 1 else b''.join(chunks))
+            self.writes += 1
+            if self.fsync == 'always':
+                os.fsync(self.file.fileno())
+            if self.on_written is not None:
+                self.on_written(*offsets)
+            if self.checksum is not None:
+                for part_offset, chunk in zip(offsets, chunks):
+                    self.checksum.add(self.file, part_offset, chunk)
+        except Exception as err:  # pylint: disable=broad-except
+            logger.debug('cannot write %d bytes at %d: %s', sum(map(len, chunks)), offset, err)
+            self.error = err
+
+    @staticmethod
+    def resolve(future: asyncio.Future):
+        """Mark a flush as done, in the event loop.
+
+        Args:
+            future (asyncio.Future): The future of the flush.
+        """
+        if not future.done():
+            future.set_result(None)
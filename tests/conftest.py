@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+
+import os
+import sys
+
+import pytest
+
+from rcdtool import main
+from rcdtool.rcdtool import RCD
+
+# the fake Telegram client lives with the benchmarks, out of the package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+
+@pytest.fixture
+def config_filename(tmp_path):
+    filename = str(tmp_path / 'config.ini')
+    with open(filename, 'w', encoding='utf-8') as file:
+        file.write('[Access]\nsession = test\nid = 1\nhash = test\n')
+    return filename
+
+
+@pytest.fixture
+def use_client(monkeypatch):
+    """Make RCD use a fake client, or a dict of them by config section."""
+    def use(client):
+        if isinstance(client, dict):
+            monkeypatch.setattr(RCD, 'create_client', lambda self, section='Access': client[section])
+        else:
+            monkeypatch.setattr(RCD, 'create_client', lambda self, section='Access': client)
+        return client
+    return use
+
+
+@pytest.fixture
+def run_main(monkeypatch, use_client):
+    """Run the CLI with some arguments against a fake client."""
+    def run(client, *args):
+        use_client(client)
+        monkeypatch.setattr(sys, 'argv', ['rcdtool', *args])
+        main.main()
+    return run
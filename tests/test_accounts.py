@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+import os
+import time
+import asyncio
+
+from rcdtool.accounts import Account, choose_account
+from rcdtool.cache import EntityCache
+from rcdtool.ratelimit import RateController
+from rcdtool import rcdtool
+from rcdtool.rcdtool import RCD
+from simulator import FakeTelegramClient
+
+
+def create_account(name):
+    return Account(name, None, RateController(4), EntityCache())
+
+
+def test_choose_account():
+    first, second, third = accounts = [create_account(name) for name in ('first', 'second', 'third')]
+
+    # the idle accounts take turns
+    first.chosen = 1
+    assert choose_account(accounts, 1234) is second
+
+    # the accounts that cannot see the channel are skipped
+    second.set_member(1234, False)
+    assert choose_account(accounts, 1234) is third
+    assert choose_account(accounts, 1234, exclude=[third]) is first
+
+    # then the ones waiting a FloodWait or with more bytes in flight
+    third.rate.paused_until = time.monotonic() + 60
+    assert choose_account(accounts, 1234) is first
+    first.in_flight_bytes = 1000
+    third.rate.paused_until = 0.0
+    assert choose_account(accounts, 1234) is third
+
+    assert choose_account(accounts, 1234, exclude=[first, third]) is None
+
+
+def test_download_with_several_accounts(tmp_path, capsys, run_main):
+    config_filename = str(tmp_path / 'config.ini')
+    with open(config_filename, 'w', encoding='utf-8') as file:
+        file.write(
+            '[Access]\nsession = first\nid = 1\nhash = first\n'
+            '[Access.second]\nsession = second\nid = 2\nhash = second\n'
+        )
+    # only the second account joined the channel 5678
+    clients = {
+        'Access': FakeTelegramClient(messages=400, media_size=2000, latency=0.001, flood_limit=8, channels=[1234]),
+        'Access.second': FakeTelegramClient(messages=400, media_size=2000, latency=0.001, flood_limit=8),
+    }
+    output = str(tmp_path / 'file')
+
+    run_main(clients, '-c', config_filename, '-O', output, '--detailed-name',
+             '--link', 'https://t.me/c/1234/1..400;https://t.me/c/5678/1..100')
+
+    files = capsys.readouterr().out.split()
+    assert len(files) == 500
+    for channel_id, message_id in ((1234, 1), (1234, 400), (5678, 100)):
+        assert os.path.exists(f'{output}--{channel_id}-{message_id}')
+    first, second = clients.values()
+    assert first.requests['GetFile'] > 0 and second.requests['GetFile'] > 0
+    assert first.requests['GetFile'] + second.requests['GetFile'] == 500
+    assert first.requests['GetMessages'] <= 4
+
+
+def test_find_account(monkeypatch, config_filename, use_client):
+    client = use_client(FakeTelegramClient(channels=[1234]))
+    rcd_tool = RCD(config_filename)
+    warnings = []
+    monkeypatch.setattr(rcdtool.logger, 'warning', lambda message, *args: warnings.append(message % args))
+
+    assert client.loop.run_until_complete(rcd_tool.find_account(1234)) is rcd_tool.account
+    # no account can see the channel
+    assert client.loop.run_until_complete(rcd_tool.find_account(5678)) is None
+    assert len(warnings) == 1 and warnings[0].startswith('Cannot find the channel 5678')
+
+
+def test_flood_waits_of_the_login():
+    thresholds = []
+
+    class Client:
+        flood_sleep_threshold = 60
+
+        async def start(self):
+            thresholds.append(self.flood_sleep_threshold)
+
+    client = Client()
+    account = Account('first', client, RateController(4), EntityCache())
+    asyncio.run(account.connect())
+
+    # the login sleeps through its FloodWaits, the requests after it do not
+    assert thresholds == [60]
+    assert client.flood_sleep_threshold == 0
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+import os
+import json
+import asyncio
+
+import pytest
+
+from rcdtool.parallel import download_parts
+from rcdtool import resume
+from rcdtool.resume import Checkpoint
+from simulator import FakeFileServer, FakeTelegramClient
+
+
+PART_SIZE = 64 * 1024
+
+
+def test_resume_parts(tmp_path):
+    data = os.urandom(6 * PART_SIZE + 100)
+    output_filename = str(tmp_path / 'file')
+
+    class FailingServer(FakeFileServer):
+        async def get_file(self, offset, limit):
+            if offset >= 3 * PART_SIZE:
+                raise ConnectionError('lost connection')
+            return await super().get_file(offset, limit)
+
+    checkpoint = Checkpoint(output_filename, 1, len(data), PART_SIZE)
+    assert not checkpoint.load()
+    with open(checkpoint.part_filename, 'wb') as file:
+        with pytest.raises(ConnectionError):
+            asyncio.run(download_parts(FailingServer(data).get_file, file, len(data), PART_SIZE, 1,
+                                       completed=checkpoint.completed, on_part=checkpoint.mark))
+    checkpoint.flush()
+    assert not os.path.exists(output_filename)
+
+    checkpoint = Checkpoint(output_filename, 1, len(data), PART_SIZE)
+    assert checkpoint.load()
+    assert checkpoint.contiguous_offset == 3 * PART_SIZE
+
+    server = FakeFileServer(data)
+    with open(checkpoint.part_filename, 'r+b') as file:
+        asyncio.run(download_parts(server.get_file, file, len(data), PART_SIZE, 2,
+                                   completed=checkpoint.completed, on_part=checkpoint.mark))
+    checkpoint.finish()
+
+    assert server.requests == 4
+    assert not os.path.exists(checkpoint.part_filename)
+    assert not os.path.exists(checkpoint.manifest_filename)
+    with open(output_filename, 'rb') as file:
+        assert file.read() == data
+
+
+def test_checkpoint_of_other_media(tmp_path):
+    output_filename = str(tmp_path / 'file')
+    checkpoint = Checkpoint(output_filename, 1, 1000, PART_SIZE)
+    with open(checkpoint.part_filename, 'wb') as file:
+        file.write(b'0' * 1000)
+    checkpoint.mark(0)
+    checkpoint.flush()
+
+    assert Checkpoint(output_filename, 1, 1000, PART_SIZE).load()
+    assert not Checkpoint(output_filename, 2, 1000, PART_SIZE).load()
+    assert not Checkpoint(output_filename, 1, 2000, PART_SIZE).load()
+
+
+def test_save_every_parts(monkeypatch, tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / 'file'), 1, 1000 * PART_SIZE, PART_SIZE)
+    saves = []
+    save = checkpoint.save
+    monkeypatch.setattr(checkpoint, 'save', lambda: (saves.append(len(checkpoint.completed)), save()))
+    monkeypatch.setattr(resume, 'SAVE_EVERY_SECONDS', 3600)
+
+    for offset in range(0, 200 * PART_SIZE, PART_SIZE):
+        checkpoint.mark(offset)
+    assert saves == [resume.SAVE_EVERY_PARTS * n for n in range(1, 200 // resume.SAVE_EVERY_PARTS + 1)]
+
+    # the download stops, and the rest of the parts are saved
+    checkpoint.flush()
+    assert saves[-1] == 200
+    checkpoint.flush()
+    assert len(saves) == 200 // resume.SAVE_EVERY_PARTS + 1
+    with open(checkpoint.manifest_filename, 'r', encoding='utf-8') as file:
+        assert len(json.load(file)['completed']) == 200
+
+
+def test_resume_names_with_counters(tmp_path, capsys, config_filename, run_main):
+    media_size = 3 * PART_SIZE + 5
+
+    class FailingClient(FakeTelegramClient):
+        async def get_file_part(self, location, offset, limit):
+            # the download stops after the message 1 and the first part of the others
+            message_id = location.id // 100 % 10 ** 7
+            if message_id > 1 and offset > 0:
+                raise ConnectionError('link down')
+            return await super().get_file_part(location, offset, limit)
+
+    output = str(tmp_path / 'out' / 'file')
+    args = ('-c', config_filename, '-C', '1234', '-M', '1..3', '-O', output,
+            '--parts', '1', '--part-size', str(PART_SIZE))
+
+    run_main(FailingClient(messages=3, media_size=media_size), *args)
+    assert capsys.readouterr().out.split() == [output]
+
+    client = FakeTelegramClient(messages=3, media_size=media_size)
+    run_main(client, *args)
+
+    files = capsys.readouterr().out.split()
+    assert files == [output, f'{output}-1', f'{output}-2']
+    # the message 1 is not downloaded again, the others go on from their first part
+    assert client.requests['GetFile'] == 2 * 3
+    for message_id, filename in enumerate(files, start=1):
+        document = client.get_document(1234, message_id)
+        with open(filename, 'rb') as file:
+            assert file.read() == client.get_file_bytes(document.id, document.size, 0, document.size)
+    assert not [name for name in os.listdir(tmp_path / 'out') if name.endswith('.part')]
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+import os
+import zlib
+import random
+import hashlib
+
+import pytest
+
+from rcdtool.checksum import StreamChecksum, create_hash
+
+
+PART_SIZE = 4096
+
+
+def test_out_of_order_parts(tmp_path):
+    data = os.urandom(10 * PART_SIZE + 123)
+    offsets = list(range(0, len(data), PART_SIZE))
+    random.Random(1).shuffle(offsets)
+
+    filename = str(tmp_path / 'file')
+    with open(filename, 'wb+') as file:
+        file.write(data)
+        checksum = StreamChecksum('sha256', PART_SIZE)
+        for offset in offsets:
+            checksum.add(file, offset, data[offset:offset + PART_SIZE])
+        assert checksum.finish(file) == hashlib.sha256(data).hexdigest()
+    assert checksum.read_bytes == 0
+
+
+def test_resumed_parts(tmp_path):
+    data = os.urandom(6 * PART_SIZE)
+    completed = {0, 2 * PART_SIZE, 3 * PART_SIZE}
+
+    filename = str(tmp_path / 'file')
+    with open(filename, 'wb+') as file:
+        file.write(data)
+        checksum = StreamChecksum('blake2b', PART_SIZE, completed)
+        for offset in range(0, len(data), PART_SIZE):
+            if offset not in completed:
+                checksum.add(file, offset, data[offset:offset + PART_SIZE])
+                assert len(checksum.pending) <= 1
+        assert checksum.finish(file) == hashlib.blake2b(data).hexdigest()
+    assert checksum.read_bytes == 3 * PART_SIZE
+
+
+def test_crc32():
+    checksum = create_hash('crc32')
+    checksum.update(b'hello ')
+    checksum.update(b'world')
+    assert checksum.hexdigest() == f"{zlib.crc32(b'hello world'):08x}"
+
+
+def test_unknown_algorithm():
+    with pytest.raises(ValueError):
+        create_hash('md4x')
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+import os
+import asyncio
+
+from rcdtool.rcdtool import RCD, DownloadResult, Target, MESSAGES_BATCH_SIZE
+from simulator import FakeTelegramClient
+
+
+def test_results_by_status(tmp_path, config_filename, use_client):
+    client = FakeTelegramClient(messages=20, media_every=2, media_size=5000)
+    use_client(client)
+    rcd_tool = RCD(config_filename)
+    output = str(tmp_path / 'file')
+
+    async def collect():
+        targets = [(1234, message_id, f'{output}-{message_id}') for message_id in (1, 2, 3, 4, 50)]
+        return [result async for result in rcd_tool.download_many(targets)]
+
+    results = client.loop.run_until_complete(collect())
+
+    assert all(isinstance(result, DownloadResult) for result in results)
+    by_message = {result.message_id: result for result in results}
+    assert sorted(by_message) == [1, 2, 3, 4, 50]
+    assert [by_message[message_id].status for message_id in (1, 2, 3, 4, 50)] == [
+        'skipped', 'downloaded', 'skipped', 'downloaded', 'failed',
+    ]
+    assert by_message[1].reason == 'no media' and by_message[1].ok
+    assert by_message[50].reason == 'message not found' and not by_message[50].ok
+    assert by_message[2].files == [f'{output}-2'] and by_message[2].bytes == 5000
+    assert os.path.getsize(f'{output}-2') == 5000
+    assert client.requests['GetMessages'] == 1
+
+
+def test_completion_order_and_backpressure(tmp_path, config_filename, use_client):
+    client = FakeTelegramClient(messages=5000, media_size=(1000, 200000), latency=0.001, bandwidth=1e8)
+    use_client(client)
+    rcd_tool = RCD(config_filename)
+    taken = []
+
+    async def iter_targets():
+        for message_id in range(1, 5001):
+            taken.append(message_id)
+            yield Target(1234, message_id, str(tmp_path / f'file-{message_id}'))
+
+    async def collect():
+        results = []
+        async for result in rcd_tool.download_many(iter_targets(), concurrency=4):
+            if not results:
+                # only the batches queued for the requests and the downloads,
+                # and the ones being grouped, were taken
+                assert len(taken) <= (2 * 4 + 5) * MESSAGES_BATCH_SIZE
+            results.append(result)
+            if len(results) == 300:
+                break
+        return results
+
+    results = client.loop.run_until_complete(collect())
+
+    assert len(results) == 300
+    assert all(result.status == 'downloaded' for result in results)
+    assert [result.message_id for result in results] != sorted(result.message_id for result in results)
+    assert len(taken) < 5000
+    # the downloads running when the loop stopped are left to resume
+    assert len([name for name in os.listdir(tmp_path) if name.endswith('.part')]) <= 4
+
+
+def test_channel_not_found(tmp_path, config_filename, use_client):
+    client = FakeTelegramClient(messages=20, media_size=5000, channels=[1234])
+    use_client(client)
+    rcd_tool = RCD(config_filename)
+    output = str(tmp_path / 'file')
+
+    async def collect():
+        targets = [(1234, 2, f'{output}-2'), (5678, 2, f'{output}-5678'), (1234, 50, f'{output}-50')]
+        return [result async for result in rcd_tool.download_many(targets)]
+
+    results = client.loop.run_until_complete(collect())
+
+    by_channel = {(result.channel_id, result.message_id): result for result in results}
+    assert by_channel[-1001234, 2].status == 'downloaded'
+    assert by_channel[-1005678, 2].status == 'failed'
+    assert by_channel[-1005678, 2].reason == 'channel not found'
+    assert by_channel[-1001234, 50].reason == 'message not found'
+
+
+def test_default_names(tmp_path, monkeypatch, config_filename, use_client):
+    client = FakeTelegramClient(messages=20, media_size=5000)
+    use_client(client)
+    monkeypatch.chdir(tmp_path)
+    rcd_tool = RCD(config_filename)
+    with open('1234-6', 'w', encoding='utf-8') as file:
+        file.write('old')
+
+    async def collect():
+        # the same channel, written in different ways
+        targets = [(1234, 2), ('1234', 4, '1234-2'), ('-1001234', 6)]
+        return [result async for result in rcd_tool.download_many(targets)]
+
+    results = client.loop.run_until_complete(collect())
+
+    files = {result.message_id: result.files for result in results}
+    assert files == {2: ['1234-2-1'], 4: ['1234-2'], 6: ['-1001234-6']}
+    assert all(result.channel_id == -1001234 for result in results)
+    assert client.requests['GetMessages'] == 1
+    for message_id, (filename,) in files.items():
+        assert os.path.getsize(filename) == 5000
+
+
+def test_slow_input_is_not_held_back(tmp_path, config_filename, use_client):
+    client = FakeTelegramClient(messages=20, media_size=5000)
+    use_client(client)
+    rcd_tool = RCD(config_filename)
+    first_done = asyncio.Event()
+
+    async def iter_targets():
+        yield (1234, 2, str(tmp_path / 'file-2'))
+        # the next target comes only after the first one is downloaded
+        await first_done.wait()
+        yield (1234, 4, str(tmp_path / 'file-4'))
+
+    async def collect():
+        results = []
+        async for result in rcd_tool.download_many(iter_targets()):
+            results.append(result)
+            first_done.set()
+        return results
+
+    results = client.loop.run_until_complete(asyncio.wait_for(collect(), 5))
+
+    assert [result.message_id for result in results] == [2, 4]
+    assert client.requests['GetMessages'] == 2
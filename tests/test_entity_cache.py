@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+import asyncio
+
+from rcdtool.cache import EntityCache, get_cache_key
+
+
+def test_cache_key_is_normalized():
+    assert get_cache_key('@Qwerty') == get_cache_key('qwerty')
+    assert get_cache_key('400300200100') == get_cache_key(-100400300200100)
+
+
+def test_resolve_only_once():
+    cache = EntityCache()
+    calls = []
+
+    async def resolver():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return (1000, 2000)
+
+    async def run():
+        return await asyncio.gather(*[
+            cache.resolve('@qwerty', resolver)
+            for _ in range(10)
+        ])
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(result == (1000, 2000) for result in results)
+
+    asyncio.run(cache.resolve('Qwerty', resolver))
+    assert len(calls) == 1
+
+
+def test_persisted_cache(tmp_path):
+    filename = str(tmp_path / 'entities.json')
+
+    async def resolver():
+        return (1000, 2000)
+
+    cache = EntityCache(filename, ttl=60)
+    asyncio.run(cache.resolve(1000, resolver))
+
+    cache = EntityCache(filename, ttl=60)
+    assert cache.get(1000) == (1000, 2000)
+
+
+def test_expired_entries(tmp_path):
+    filename = str(tmp_path / 'entities.json')
+    cache = EntityCache(filename, ttl=-1)
+    cache.put(1000, (1000, 2000))
+
+    assert cache.get(1000) is None
+    assert EntityCache(filename, ttl=-1).get(1000) is None
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+from datetime import datetime, timezone
+
+import pytest
+
+from rcdtool.filters import MediaFilter, parse_date, parse_kinds, parse_size
+
+
+def test_parse_size():
+    assert parse_size('1000') == 1000
+    assert parse_size('10K') == 10 * 1024
+    assert parse_size('1.5mb') == 1024 * 1024 * 3 // 2
+    assert parse_size('2G') == 2 * 1024 ** 3
+    with pytest.raises(ValueError):
+        parse_size('ten')
+
+
+def test_parse_date():
+    assert parse_date('2024-05-01') == datetime(2024, 5, 1, tzinfo=timezone.utc)
+    assert parse_date('2024-05-01T12:00+02:00').utcoffset().total_seconds() == 7200
+
+
+def test_parse_kinds():
+    assert parse_kinds('photo, video,photo') == ['photo', 'video']
+    with pytest.raises(ValueError):
+        parse_kinds('sticker')
+
+
+def test_media_filter():
+    media_filter = MediaFilter(min_size=100, max_size=1000, mime_types=('video/*', 'image/jpeg'))
+    assert media_filter.active
+    assert media_filter.matches('video/mp4', 500)
+    assert media_filter.matches('IMAGE/JPEG', 100)
+    assert not media_filter.matches('image/png', 500)
+    assert not media_filter.matches('video/mp4', 99)
+    assert not media_filter.matches('video/mp4', 1001)
+    # the unknown metadata passes
+    assert media_filter.matches(None, None)
+    assert not MediaFilter().active
+
+
+def test_media_filter_dates():
+    media_filter = MediaFilter(min_date=parse_date('2024-01-01'), max_date=parse_date('2024-02-01'))
+    assert media_filter.matches(None, None, parse_date('2024-01-01'))
+    assert not media_filter.matches(None, None, parse_date('2023-12-31T23:59'))
+    assert not media_filter.matches(None, None, parse_date('2024-02-01'))
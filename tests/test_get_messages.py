@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+
+import os
+
+import rcdtool.utils as utils
+from rcdtool.rcdtool import RCD
+from simulator import FakeTelegramClient
+
+
+def test_chunks():
+    assert list(utils.chunks(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(utils.chunks([], 3)) == []
+
+
+def test_messages_in_batches(config_filename, use_client):
+    client = use_client(FakeTelegramClient(messages=250))
+    rcd_tool = RCD(config_filename)
+
+    messages = client.loop.run_until_complete(rcd_tool.get_messages(1234, list(range(1, 301))))
+
+    # one request per 100 ids, and the missing messages are left out
+    assert sorted(messages) == list(range(1, 251))
+    assert client.requests['GetMessages'] == 3
+    assert client.requests['ResolveChannel'] == 1
+
+
+def test_download_fetched_message(tmp_path, config_filename, use_client):
+    client = use_client(FakeTelegramClient(messages=10, media_size=1000))
+    rcd_tool = RCD(config_filename)
+    output = str(tmp_path / 'file')
+
+    async def download():
+        messages = await rcd_tool.get_messages(1234, [3, 4])
+        return [
+            await rcd_tool.download_media(1234, message_id, f'{output}-{message_id}', message=message)
+            for message_id, message in sorted(messages.items())
+        ]
+
+    files = client.loop.run_until_complete(download())
+
+    # the downloads do not request their messages again
+    assert files == [f'{output}-3', f'{output}-4']
+    assert client.requests['GetMessages'] == 1
+    assert os.path.getsize(f'{output}-3') == 1000
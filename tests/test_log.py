@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+
+import json
+import logging
+
+from rcdtool.log import JSONFormatter, Progress, logger
+
+
+def test_json_formatter():
+    record = logging.LogRecord('rcdtool', logging.WARNING, __file__, 1, 'got %d parts', (3,), None)
+    data = json.loads(JSONFormatter().format(record))
+    assert data['level'] == 'warning'
+    assert data['message'] == 'got 3 parts'
+
+
+def test_level_gating():
+    logger.configure('warning')
+    try:
+        assert not logger.isEnabledFor(logging.DEBUG)
+        assert not logger.isEnabledFor(logging.INFO)
+        assert logger.isEnabledFor(logging.WARNING)
+    finally:
+        logger.configure('info')
+
+
+def test_progress_is_rate_limited(monkeypatch):
+    logged = []
+    monkeypatch.setattr(logger, 'log', lambda level, message, *args: logged.append(message % args))
+    progress = Progress(interval=3600)
+
+    for done in range(1000):
+        progress.update('%d done', done)
+    progress.update('%d done', 1000, force=True)
+
+    assert logged == ['1000 done']
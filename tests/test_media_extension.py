@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+import os
+
+import telethon.types as tg_types
+
+import rcdtool.rcdtool as rcdtool
+from rcdtool.rcdtool import RCD, get_media_extension, guess_extension
+from simulator import FakeTelegramClient
+
+
+def document_media(mime_type, attributes=()):
+    document = tg_types.Document(
+        id=1,
+        access_hash=1,
+        file_reference=b'',
+        date=None,
+        mime_type=mime_type,
+        size=10,
+        dc_id=1,
+        attributes=list(attributes),
+    )
+    return tg_types.MessageMediaDocument(document=document)
+
+
+def test_extension_from_attributes_and_mime_type():
+    assert get_media_extension(document_media('video/mp4', [tg_types.DocumentAttributeFilename('Clip.MKV')])) == 'mkv'
+    assert get_media_extension(document_media('video/mp4')) == 'mp4'
+    assert get_media_extension(document_media('image/jpeg')) == 'jpg'
+    assert get_media_extension(document_media('application/x-unknown')) is None
+    assert get_media_extension(document_media('video/x-matroska')) == 'mkv'
+
+
+def test_generic_mime_type_is_sniffed():
+    assert get_media_extension(document_media('application/octet-stream')) is None
+    assert get_media_extension(document_media('')) is None
+    assert get_media_extension(document_media('application/octet-stream', [tg_types.DocumentAttributeFilename('a.zip')])) == 'zip'
+
+
+def test_extension_from_first_bytes():
+    assert guess_extension(b'\x89PNG\r\n\x1a\n' + bytes(100)) == 'png'
+    assert guess_extension(b'plain text') is None
+    assert guess_extension(b'') is None
+
+
+def test_sniffed_name_is_not_overwritten(monkeypatch, tmp_path, config_filename, use_client):
+    client = use_client(FakeTelegramClient(messages=5, media_size=1000))
+    monkeypatch.setattr(rcdtool, 'guess_extension', lambda head: 'png')
+    output = str(tmp_path / 'file')
+    with open(f'{output}.png', 'wb') as file:
+        file.write(b'other file')
+
+    rcd_tool = RCD(config_filename)
+    media = tg_types.MessageMediaDocument(document=client.get_document(1234, 3))
+    filename = client.loop.run_until_complete(rcd_tool.download_file(media, output, sniff_extension=True))
+
+    assert filename == f'{output}-1.png'
+    assert os.path.getsize(filename) == 1000
+    with open(f'{output}.png', 'rb') as file:
+        assert file.read() == b'other file'
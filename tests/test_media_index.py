@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+import os
+
+from rcdtool.index import MediaIndex
+
+
+def test_lookup_downloaded_media(tmp_path):
+    path = str(tmp_path / 'video.mp4')
+    with open(path, 'wb') as file:
+        file.write(b'0' * 100)
+
+    index = MediaIndex(str(tmp_path / 'index.db'))
+    assert index.lookup('document', 1) is None
+
+    index.add('document', 1, path)
+    assert index.lookup('document', 1) == os.path.abspath(path)
+    assert index.lookup('document', 1, 100) == os.path.abspath(path)
+    assert index.lookup('document', 1, 200) is None
+    assert index.lookup('photo', 1) is None
+
+
+def test_index_is_persisted(tmp_path):
+    path = str(tmp_path / 'photo.jpg')
+    with open(path, 'wb') as file:
+        file.write(b'0' * 10)
+
+    index = MediaIndex(str(tmp_path / 'index.db'))
+    index.add('photo', 2, path)
+    index.close()
+
+    assert MediaIndex(str(tmp_path / 'index.db')).lookup('photo', 2) == os.path.abspath(path)
+
+
+def test_stale_entries(tmp_path):
+    path = str(tmp_path / 'video.mp4')
+    with open(path, 'wb') as file:
+        file.write(b'0' * 100)
+
+    index = MediaIndex(str(tmp_path / 'index.db'))
+    index.add('document', 1, path)
+    os.remove(path)
+
+    assert index.lookup('document', 1) is None
+    with open(path, 'wb') as file:
+        file.write(b'0' * 100)
+    assert index.lookup('document', 1) is None
@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+
+import itertools
+
+import rcdtool.utils as utils
+
+
+def test_merge_overlapping_ranges():
+    result = utils.merge_ranges(utils.parse_ranges('1..100,50..150'))
+    assert result == [(1, 150)]
+
+
+def test_merge_adjacent_and_duplicated_ranges():
+    result = utils.merge_ranges(utils.parse_ranges('20..30,1..10,11,5,31..31,40'))
+    assert result == [(1, 11), (20, 31), (40, 40)]
+
+
+def test_iter_huge_range():
+    values = utils.iter_ranges(utils.merge_ranges(utils.parse_ranges('1..10000000')))
+    assert list(itertools.islice(values, 3)) == [1, 2, 3]
+
+
+def test_interleave():
+    result = list(utils.interleave('abcd', 'x', 'yz'))
+    assert result == ['a', 'x', 'y', 'b', 'z', 'c', 'd']
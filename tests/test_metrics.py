@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+import asyncio
+
+from rcdtool.metrics import DownloadStats, Metrics, current_stats
+
+
+def test_record_and_summary():
+    metrics = Metrics()
+    stats = DownloadStats(1234, 1, status='downloaded', transfer=2.0)
+    stats.add_bytes(1000)
+    stats.retries = 2
+    metrics.record(stats)
+    metrics.record(DownloadStats(1234, 2, reason='boom'))
+
+    summary = metrics.summary()
+    assert summary['downloads'] == {'downloaded': 1, 'failed': 1}
+    assert summary['bytes'] == 1000
+    assert summary['retries'] == 2
+    assert stats.throughput == 500
+    assert 'rcdtool_downloads_total{status="failed"} 1' in metrics.to_prometheus()
+
+
+def test_serve():
+    metrics = Metrics()
+    metrics.record(DownloadStats(1234, 1, status='downloaded'))
+
+    async def request():
+        server = await metrics.serve(0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            response = await reader.read()
+            writer.close()
+            return response.decode()
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    response = asyncio.run(request())
+    assert response.startswith('HTTP/1.1 200 OK')
+    assert 'rcdtool_downloads_total{status="downloaded"} 1' in response
+
+
+def test_current_stats_in_tasks():
+    async def download(stats):
+        current_stats.set(stats)
+        await asyncio.sleep(0)
+        current_stats.get().add_bytes(10)
+
+    async def run():
+        first, second = DownloadStats(1, 1), DownloadStats(1, 2)
+        await asyncio.gather(download(first), download(second))
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first.bytes == second.bytes == 10
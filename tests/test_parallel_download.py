@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+import os
+import time
+import asyncio
+
+import pytest
+
+from rcdtool.parallel import check_part_size, download_parts
+from simulator import FakeFileServer
+
+
+PART_SIZE = 64 * 1024
+
+
+def test_download_parts(tmp_path):
+    data = os.urandom(10 * PART_SIZE + 1234)
+    server = FakeFileServer(data, latency=0.01)
+    filename = str(tmp_path / 'file')
+
+    with open(filename, 'wb+') as file:
+        written = asyncio.run(download_parts(server.get_file, file, len(data), PART_SIZE, 4))
+
+    assert written == len(data)
+    assert server.requests == 11
+    assert server.max_running == 4
+    with open(filename, 'rb') as file:
+        assert file.read() == data
+
+
+def test_parts_are_faster(tmp_path):
+    data = os.urandom(16 * PART_SIZE)
+    filename = str(tmp_path / 'file')
+
+    def measure(concurrency):
+        server = FakeFileServer(data, latency=0.02)
+        with open(filename, 'wb+') as file:
+            start = time.monotonic()
+            asyncio.run(download_parts(server.get_file, file, len(data), PART_SIZE, concurrency))
+            return time.monotonic() - start
+
+    assert measure(8) * 3 < measure(1)
+
+
+def test_short_part(tmp_path):
+    data = os.urandom(4 * PART_SIZE)
+    server = FakeFileServer(data[:-1])
+
+    with open(str(tmp_path / 'file'), 'wb+') as file:
+        with pytest.raises(IOError):
+            asyncio.run(download_parts(server.get_file, file, len(data), PART_SIZE, 2))
+
+
+def test_invalid_part_size():
+    with pytest.raises(ValueError):
+        check_part_size(1000)
+    with pytest.raises(ValueError):
+        check_part_size(3 * 4096)
+    check_part_size(PART_SIZE)
@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+
+import os
+import json
+import signal
+import hashlib
+
+from rcdtool.rcdtool import RCD
+from rcdtool.resume import DOWNLOADS_FILENAME
+from simulator import FakeTelegramClient
+
+
+def test_download_range(tmp_path, capsys, config_filename, run_main):
+    client = FakeTelegramClient(messages=300, media_every=3, media_size=(1000, 300000), dcs=2)
+    output = str(tmp_path / 'file')
+
+    run_main(client, '-c', config_filename, '-C', '1234', '-M', '1..250,200..300', '-O', output, '--detailed-name')
+
+    files = capsys.readouterr().out.split()
+    assert len(files) == 100
+    assert client.requests['GetMessages'] == 3
+    assert client.requests['ResolveChannel'] == 1
+    for message_id in (3, 150, 300):
+        document = client.get_document(1234, message_id)
+        with open(f'{output}--1234-{message_id}', 'rb') as file:
+            data = file.read()
+        assert data == client.get_file_bytes(document.id, document.size, 0, document.size)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.part')]
+
+
+def test_download_by_parts_with_flood_waits(tmp_path, capsys, config_filename, run_main):
+    client = FakeTelegramClient(messages=10, media_size=3 * 1024 * 1024 + 5, latency=0.001, flood_limit=4)
+    output = str(tmp_path / 'file')
+
+    run_main(client, '-c', config_filename, '--link', 'https://t.me/c/1234/1..10',
+        '-O', output, '--parts', '4', '--concurrency', '4')
+
+    files = capsys.readouterr().out.split()
+    assert len(files) == 10
+    assert client.flood_waits > 0
+    for file in files:
+        assert os.path.getsize(file) == 3 * 1024 * 1024 + 5
+
+
+def test_download_stats(tmp_path, capsys, config_filename, run_main):
+    client = FakeTelegramClient(messages=12, media_every=3, media_size=5000)
+    output = str(tmp_path / 'file')
+    stats_filename = str(tmp_path / 'stats.jsonl')
+
+    run_main(client, '-c', config_filename, '-C', '1234', '-M', '1..12,50', '-O', output,
+        '--stats', stats_filename)
+
+    with open(stats_filename, 'r', encoding='utf-8') as file:
+        lines = [json.loads(line) for line in file]
+    summary = lines.pop()['summary']
+    assert len(lines) == 13
+    assert summary['downloads'] == {'downloaded': 4, 'skipped': 8, 'failed': 1}
+    assert summary['bytes'] == 4 * 5000
+    downloaded = [line for line in lines if line['status'] == 'downloaded']
+    assert all(line['bytes'] == 5000 and line['first_byte'] is not None for line in downloaded)
+    assert [line['reason'] for line in lines if line['status'] == 'failed'] == ['message not found']
+
+
+def test_infer_extension_from_metadata(monkeypatch, tmp_path, capsys, config_filename, run_main):
+    client = FakeTelegramClient(messages=5, media_size=5000)
+    template = str(tmp_path / '{channel}' / '{message_id}')
+
+    guessed = []
+    monkeypatch.setattr('filetype.guess', lambda *args: guessed.append(args))
+    run_main(client, '-c', config_filename, '-C', '1234', '-M', '1..5', '-O', template, '--infer-extension')
+
+    files = capsys.readouterr().out.split()
+    assert files == [str(tmp_path / '1234' / f'{message_id}.mp4') for message_id in range(1, 6)]
+    assert not guessed
+
+
+def test_download_targets_file(tmp_path, capsys, config_filename, run_main):
+    client = FakeTelegramClient(messages=10, media_size=5000)
+    targets_filename = str(tmp_path / 'targets.jsonl')
+    with open(targets_filename, 'w', encoding='utf-8') as file:
+        file.write(json.dumps({'link': 'https://t.me/c/1234/1..3'}) + '\n')
+        file.write(json.dumps({'channel': 5678, 'message': 4, 'output': str(tmp_path / 'other' / '{message_id}')}) + '\n')
+        file.write('broken\n')
+        file.write(json.dumps({'channel': 1234, 'message': '9'}) + '\n')
+
+    run_main(client, '-c', config_filename, '--targets', targets_filename, '-O', str(tmp_path / 'file'),
+        '--detailed-name')
+
+    files = capsys.readouterr().out.split()
+    assert sorted(files) == sorted([
+        *(str(tmp_path / f'file--1234-{message_id}') for message_id in (1, 2, 3, 9)),
+        str(tmp_path / 'other' / '4'),
+    ])
+    assert client.requests['GetMessages'] == 2
+
+
+def test_download_multi_batch_channels_with_one_worker(tmp_path, capsys, config_filename, run_main):
+    client = FakeTelegramClient(messages=300, media_every=299, media_size=1000, latency=0.001)
+    targets_filename = str(tmp_path / 'targets.txt')
+    with open(targets_filename, 'w', encoding='utf-8') as file:
+        file.write('1234 1..300\n5678 1..10\n4321 1..250\n')
+
+    def timeout(*_):
+        raise TimeoutError('the downloads are blocked')
+
+    # a job waiting for another one in the same pool blocks it forever
+    handler = signal.signal(signal.SIGALRM, timeout)
+    signal.alarm(10)
+    try:
+        run_main(client, '-c', config_filename, '--targets', targets_filename, '-O', str(tmp_path / 'file'),
+            '--detailed-name', '--concurrency', '1')
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, handler)
+
+    files = capsys.readouterr().out.split()
+    assert files == [str(tmp_path / 'file--1234-299')]
+
+
+def test_download_paid_media_items(tmp_path, capsys, config_filename, run_main):
+    client = FakeTelegramClient(messages=2, media_size=(1000, 5000), paid_items=3, latency=0.001)
+    output = str(tmp_path / 'file')
+
+    run_main(client, '-c', config_filename, '-C', '1234', '-M', '1..2', '-O', output,
+        '--detailed-name', '--infer-extension')
+
+    files = capsys.readouterr().out.split()
+    assert files == [
+        str(tmp_path / f'file--1234-{message_id}-{item}.mp4')
+        for message_id in (1, 2)
+        for item in (1, 2, 3)
+    ]
+    for message_id in (1, 2):
+        for item in (1, 2, 3):
+            document = client.get_document(1234, message_id, item)
+            with open(str(tmp_path / f'file--1234-{message_id}-{item}.mp4'), 'rb') as file:
+                assert file.read() == client.get_file_bytes(document.id, document.size, 0, document.size)
+    # the items of a message are downloaded at the same time
+    assert client.max_running >= 3
+
+
+def test_paid_media_items_are_not_overwritten(tmp_path, capsys, config_filename, run_main):
+    client = FakeTelegramClient(messages=3, media_size=(1000, 5000), paid_items=3)
+    os.mkdir(tmp_path / 'media')
+    output = str(tmp_path / 'media' / 'file')
+
+    run_main(client, '-c', config_filename, '-C', '1234', '-M', '1..3', '-O', output)
+
+    files = capsys.readouterr().out.split()
+    assert len(files) == len(set(files)) == 9
+    names = [name for name in os.listdir(tmp_path / 'media') if name != DOWNLOADS_FILENAME]
+    assert sorted(names) == sorted(os.path.basename(filename) for filename in files)
+    for message_id in (1, 2, 3):
+        for item in (1, 2, 3):
+            document = client.get_document(1234, message_id, item)
+            filename = files[(message_id - 1) * 3 + item - 1]
+            with open(filename, 'rb') as file:
+                assert file.read() == client.get_file_bytes(document.id, document.size, 0, document.size)
+
+
+def test_download_albums(tmp_path, capsys, config_filename, run_main):
+    client = FakeTelegramClient(messages=20, media_size=1000, album_size=4)
+    template = str(tmp_path / '{message_id}.{ext}')
+
+    run_main(client, '-c', config_filename, '-C', '1234', '-M', '2,3,10', '-O', template, '--albums')
+
+    files = capsys.readouterr().out.split()
+    assert sorted(files) == sorted(str(tmp_path / name) for name in (
+        '2.mp4', '2-1.mp4', '2-3.mp4', '2-4.mp4',
+        '10.mp4', '10-1.mp4', '10-3.mp4', '10-4.mp4',
+    ))
+    assert client.requests['GetMessages'] == 2
+
+
+def test_download_comments(tmp_path, capsys, config_filename, run_main):
+    client = FakeTelegramClient(messages=300, media_every=2, media_size=1000)
+    output = str(tmp_path / 'file')
+
+    run_main(client, '-c', config_filename, '-C', '1234', '-M', '5', '-DM', '1..250', '-O', output,
+        '--detailed-name')
+
+    files = capsys.readouterr().out.split()
+    assert len(files) == 125
+    assert files[0] == f'{output}--{-1001000001234}-2'
+    assert client.requests == {'ResolveChannel': 1, 'GetDiscussionMessage': 1, 'GetMessages': 3, 'GetFile': 125}
+
+
+def test_download_comments_skips_unreachable_channels(tmp_path, capsys, config_filename, run_main):
+    client = FakeTelegramClient(messages=20, media_every=2, media_size=1000, channels=[1234])
+    output = str(tmp_path / 'file')
+
+    run_main(client, '-c', config_filename, '--link', 'https://t.me/c/999/5;https://t.me/c/1234/5',
+        '-DM', '1..20', '-O', output, '--detailed-name')
+
+    files = capsys.readouterr().out.split()
+    assert len(files) == 10
+    assert files[0] == f'{output}--{-1001000001234}-2'
+
+
+def test_search_media(tmp_path, capsys, config_filename, run_main):
+    client = FakeTelegramClient(messages=2000, media_every=20, media_size=(1000, 10000))
+    output = str(tmp_path / 'file')
+
+    # the message N is posted N hours after 2024-01-01
+    run_main(client, '-c', config_filename, '-C', '1234', '-M', '1..1000,1500..3000', '-O', output,
+        '--detailed-name', '--filter', 'video,document', '--max-date', '2024-03-01', '--min-size', '5K')
+
+    files = capsys.readouterr().out.split()
+    expected = [
+        message_id
+        for message_id in range(1, 1001)
+        if message_id % 20 == 0 and client.get_document(1234, message_id).size >= 5 * 1024
+    ]
+    assert sorted(files) == sorted(f'{output}--1234-{message_id}' for message_id in expected)
+    assert 'GetMessages' not in client.requests
+    # one request by kind and range, the kinds do not repeat messages
+    assert client.requests['Search'] == 4
+    assert client.requests['GetFile'] == len(expected)
+
+
+def test_search_media_skips_unreachable_channels(tmp_path, capsys, config_filename, run_main):
+    client = FakeTelegramClient(messages=100, media_every=20, media_size=1000, channels=[1234])
+    output = str(tmp_path / 'file')
+
+    run_main(client, '-c', config_filename, '--link', 'https://t.me/c/999/1..100;https://t.me/c/1234/1..100',
+        '-O', output, '--detailed-name', '--filter', 'video,document')
+
+    files = capsys.readouterr().out.split()
+    assert sorted(files) == sorted(f'{output}--1234-{message_id}' for message_id in range(20, 101, 20))
+
+
+def test_plan_report(tmp_path, capsys, config_filename, run_main):
+    client = FakeTelegramClient(messages=10, media_every=2, media_size=(1000, 10000))
+    output = str(tmp_path / 'file')
+    plan_filename = str(tmp_path / 'plan.json')
+    sizes = {message_id: client.get_document(1234, message_id).size for message_id in range(2, 11, 2)}
+    # the cap lets the first media in, and skips the next ones that do not fit
+    cap = sizes[2] + sizes[4]
+
+    run_main(client, '-c', config_filename, '-C', '1234', '-M', '1..10', '-O', output, '--detailed-name',
+        '--dry-run', '--plan', plan_filename, '--max-total-bytes', str(cap))
+
+    with open(plan_filename, 'r', encoding='utf-8') as file:
+        plan = json.load(file)
+    planned = [entry for entry in plan['entries'] if entry['status'] == 'planned']
+    assert [entry['message_id'] for entry in planned][:2] == [2, 4]
+    assert plan['bytes'] == sum(entry['size'] or 0 for entry in planned) <= cap
+    assert planned[0] == {
+        'channel_id': -1001234,
+        'message_id': 2,
+        'output_filename': f'{output}--1234-2',
+        'size': sizes[2],
+        'mime_type': 'video/mp4',
+        'status': 'planned',
+        'reason': None,
+    }
+    assert {entry['reason'] for entry in plan['entries'] if entry['status'] == 'skipped'} == {'no media', 'over the total bytes'}
+    assert 'GetFile' not in client.requests
+
+
+def test_largest_first(monkeypatch, tmp_path, capsys, config_filename, run_main):
+    client = FakeTelegramClient(messages=8, media_size=(1000, 400000), latency=0.001)
+    output = str(tmp_path / 'file')
+    started = []
+    download_file = RCD.download_file
+
+    async def record_download_file(self, media, *args, **kwargs):
+        started.append(media.document.size)
+        return await download_file(self, media, *args, **kwargs)
+
+    monkeypatch.setattr(RCD, 'download_file', record_download_file)
+    run_main(client, '-c', config_filename, '-C', '1234', '-M', '1..8', '-O', output,
+        '--concurrency', '1', '--max-in-flight-bytes', '1M')
+
+    assert started == sorted(started, reverse=True)
+    assert len(capsys.readouterr().out.split()) == 8
+
+
+def test_largest_first_by_channel(monkeypatch, tmp_path, capsys, config_filename, run_main):
+    client = FakeTelegramClient(messages=8, media_size=(1000, 400000), latency=0.001)
+    output = str(tmp_path / 'file')
+    started = []
+    download_file = RCD.download_file
+
+    async def record_download_file(self, media, *args, **kwargs):
+        started.append((media.document.id // 100 // 10 ** 7, media.document.size))
+        return await download_file(self, media, *args, **kwargs)
+
+    monkeypatch.setattr(RCD, 'download_file', record_download_file)
+    run_main(client, '-c', config_filename, '--link', 'https://t.me/c/1234/1..8;https://t.me/c/5678/1..8',
+        '-O', output, '--detailed-name', '--concurrency', '1')
+
+    # the sizes are in order within each channel, and the channels take turns
+    for channel_id in (1234, 5678):
+        sizes = [size for started_channel_id, size in started if started_channel_id == channel_id]
+        assert len(sizes) == 8 and sizes == sorted(sizes, reverse=True)
+    assert {channel_id for channel_id, _ in started[:4]} == {1234, 5678}
+    assert len(capsys.readouterr().out.split()) == 16
+
+
+def test_checksum_manifest(tmp_path, capsys, config_filename, run_main):
+    client = FakeTelegramClient(messages=6, media_size=(1000, 2 * 1024 * 1024 + 7))
+    output = str(tmp_path / 'file')
+    manifest_filename = str(tmp_path / 'manifest.jsonl')
+
+    run_main(client, '-c', config_filename, '-C', '1234', '-M', '1..6', '-O', output,
+        '--parts', '4', '--checksum', 'sha256', '--manifest', manifest_filename)
+
+    files = capsys.readouterr().out.split()
+    with open(manifest_filename, 'r', encoding='utf-8') as file:
+        entries = [json.loads(line) for line in file]
+    assert sorted(entry['path'] for entry in entries) == sorted(files)
+    for entry in entries:
+        with open(entry['path'], 'rb') as file:
+            data = file.read()
+        assert entry['hash'] == hashlib.sha256(data).hexdigest()
+        assert entry['size'] == len(data)
+        assert entry['channel_id'] == -1001234 and entry['checksum'] == 'sha256'
+        assert entry['media_id'] == client.get_document(1234, entry['message_id']).id
+
+
+def test_failed_download_with_checksum(tmp_path, config_filename, run_main):
+    class FailingClient(FakeTelegramClient):
+        async def get_file_part(self, location, offset, limit):
+            if offset >= limit:
+                raise ConnectionError('link down')
+            return await super().get_file_part(location, offset, limit)
+
+    client = FailingClient(messages=2, media_every=1, media_size=3 * 1024 * 1024)
+    output = str(tmp_path / 'file')
+    stats_filename = str(tmp_path / 'stats.jsonl')
+
+    run_main(client, '-c', config_filename, '-C', '1234', '-M', '1..2', '-O', output, '--detailed-name',
+        '--parts', '1', '--checksum', 'sha256', '--stats', stats_filename)
+    run_main(client, '-c', config_filename, '-C', '1234', '-M', '1..2', '-O', output, '--detailed-name',
+        '--parts', '4', '--checksum', 'sha256', '--stats', stats_filename)
+
+    with open(stats_filename, 'r', encoding='utf-8') as file:
+        lines = [json.loads(line) for line in file if '"summary"' not in line]
+    assert len(lines) == 4
+    assert {(line['status'], line['reason']) for line in lines} == {('failed', 'link down')}
+    assert os.path.exists(f'{output}--1234-1.part')
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+import os
+import json
+
+import pytest
+
+from rcdtool.planner import OutputPlanner, is_template
+from rcdtool.resume import record_download
+
+
+def test_template(tmp_path):
+    planner = OutputPlanner(str(tmp_path / '{channel}' / '{message_id}.{ext}'))
+
+    assert planner.plan(1234, 5, 'mp4') == str(tmp_path / '1234' / '5.mp4')
+    assert planner.plan(1234, 6) == str(tmp_path / '1234' / '6')
+
+
+def test_unique_names(tmp_path, monkeypatch):
+    (tmp_path / 'file').write_bytes(b'')
+    (tmp_path / 'file-1').write_bytes(b'')
+    planner = OutputPlanner(str(tmp_path / 'file'))
+
+    scans = []
+    scandir = os.scandir
+    monkeypatch.setattr(os, 'scandir', lambda path: scans.append(path) or scandir(path))
+
+    names = [planner.plan(1234, message_id) for message_id in range(1000)]
+    assert len(set(names)) == 1000
+    assert names[:2] == [str(tmp_path / 'file-2'), str(tmp_path / 'file-3')]
+    assert scans == [str(tmp_path)]
+
+
+def test_files_of_a_previous_run(tmp_path):
+    (tmp_path / 'file').write_bytes(b'done')
+    record_download(str(tmp_path / 'file'), 10)
+    for name, media_id in (('file-1', 30), ('file-2', 20)):
+        (tmp_path / f'{name}.part').write_bytes(b'')
+        (tmp_path / f'{name}.part.json').write_text(json.dumps({'media_id': media_id}))
+    planner = OutputPlanner(str(tmp_path / 'file'))
+
+    assert planner.plan(1234, 1, media_id=10) == str(tmp_path / 'file')
+    assert planner.plan(1234, 2, media_id=20) == str(tmp_path / 'file-2')
+    # the progress of the media 30 is not taken by another one
+    assert planner.plan(1234, 3, media_id=40) == str(tmp_path / 'file-3')
+    assert planner.plan(1234, 4, media_id=30) == str(tmp_path / 'file-1')
+    assert planner.downloaded == {str(tmp_path / 'file'): 10}
+
+
+def test_shards(tmp_path):
+    planner = OutputPlanner(str(tmp_path / '{message_id}.{ext}'), shard_size=1000)
+
+    assert planner.plan(1234, 999, 'jpg') == str(tmp_path / '0' / '999.jpg')
+    assert planner.plan(1234, 1000, 'jpg') == str(tmp_path / '1000' / '1000.jpg')
+    assert planner.plan(1234, 2500, 'jpg') == str(tmp_path / '2000' / '2500.jpg')
+
+
+def test_invalid_template():
+    assert is_template('{channel}/{message_id}')
+    assert not is_template('download/file.mp4')
+    with pytest.raises(ValueError):
+        OutputPlanner('{date}/{message_id}')
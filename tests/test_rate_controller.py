@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+import os
+import asyncio
+
+import pytest
+from telethon import errors
+
+from rcdtool.parallel import download_parts
+from rcdtool.ratelimit import RateController
+from simulator import FakeFileServer, flood_wait_error
+
+
+PART_SIZE = 4 * 1024
+
+
+def test_retry_after_flood_wait():
+    calls = []
+
+    async def request():
+        calls.append(1)
+        if len(calls) < 3:
+            raise flood_wait_error(0)
+        return 'done'
+
+    controller = RateController(limit=4)
+    assert asyncio.run(controller.call(request)) == 'done'
+    assert len(calls) == 3
+    assert controller.retries == 2
+
+
+def test_give_up_long_flood_wait():
+    async def request():
+        raise flood_wait_error(100)
+
+    controller = RateController(limit=4, max_wait=10)
+    with pytest.raises(errors.FloodWaitError):
+        asyncio.run(controller.call(request))
+
+
+def test_adapt_to_the_server_rate(tmp_path):
+    data = os.urandom(200 * PART_SIZE)
+    server = FakeFileServer(data, latency=0.002, flood_limit=3)
+    controller = RateController(limit=16, max_retries=100)
+
+    async def fetch_part(offset, limit):
+        return await controller.call(server.get_file, offset, limit)
+
+    with open(str(tmp_path / 'file'), 'wb+') as file:
+        asyncio.run(download_parts(fetch_part, file, len(data), PART_SIZE, 16))
+
+    with open(str(tmp_path / 'file'), 'rb') as file:
+        assert file.read() == data
+    assert server.flood_waits > 0
+    # most of the requests run without FloodWait once the limit is adapted
+    assert server.flood_waits < server.requests / 4
+    assert controller.limit < 8
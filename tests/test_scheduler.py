@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+import asyncio
+
+import pytest
+
+from rcdtool.scheduler import ByteBudget, Scheduler
+
+
+def test_bounded_concurrency():
+    running = []
+    max_running = []
+
+    async def job():
+        running.append(1)
+        max_running.append(len(running))
+        await asyncio.sleep(0.001)
+        running.pop()
+
+    async def run():
+        scheduler = Scheduler(concurrency=3)
+        futures = [scheduler.submit('a', job) for _ in range(20)]
+        await asyncio.gather(*futures)
+        await scheduler.close()
+
+    asyncio.run(run())
+    assert len(max_running) == 20
+    assert max(max_running) == 3
+
+
+def test_channels_in_turns():
+    done = []
+
+    def job(key, index):
+        async def run_job():
+            await asyncio.sleep(0)
+            done.append((key, index))
+        return run_job
+
+    async def run():
+        scheduler = Scheduler(concurrency=1)
+        futures = [scheduler.submit('huge', job('huge', i)) for i in range(50)]
+        futures += [scheduler.submit('short', job('short', i)) for i in range(2)]
+        await asyncio.gather(*futures)
+        await scheduler.close()
+
+    asyncio.run(run())
+    short_positions = [i for i, (key, _) in enumerate(done) if key == 'short']
+    assert short_positions == [1, 3]
+
+
+def test_job_error():
+    async def job():
+        raise ValueError('bad job')
+
+    async def run():
+        scheduler = Scheduler(concurrency=1)
+        future = scheduler.submit('a', job)
+        try:
+            await future
+        finally:
+            await scheduler.close()
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
+
+
+def test_cancelled_job():
+    done = []
+
+    async def cancelled_job():
+        task = asyncio.ensure_future(asyncio.sleep(1))
+        task.cancel()
+        await task
+
+    async def job():
+        done.append(1)
+
+    async def run():
+        scheduler = Scheduler(concurrency=1)
+        cancelled = scheduler.submit('a', cancelled_job)
+        futures = [scheduler.submit('a', job) for _ in range(3)]
+        # the worker goes on with the next jobs
+        await asyncio.wait_for(asyncio.gather(*futures), 1)
+        await scheduler.close()
+        return cancelled
+
+    assert asyncio.run(run()).cancelled()
+    assert done == [1, 1, 1]
+
+
+def test_close_with_running_jobs():
+    async def job():
+        await asyncio.sleep(10)
+
+    async def run():
+        scheduler = Scheduler(concurrency=2)
+        futures = [scheduler.submit('a', job) for _ in range(4)]
+        await asyncio.sleep(0.01)
+        await asyncio.wait_for(scheduler.close(), 1)
+        return futures
+
+    assert all(future.cancelled() for future in asyncio.run(run()))
+
+
+def test_priority():
+    done = []
+
+    def job(name):
+        async def run_job():
+            await asyncio.sleep(0)
+            done.append(name)
+        return run_job
+
+    async def run():
+        scheduler = Scheduler(concurrency=1)
+        futures = [
+            scheduler.submit('a', job('small'), priority=10),
+            scheduler.submit('a', job('first'), priority=10),
+            scheduler.submit('a', job('big'), priority=1000),
+            scheduler.submit('a', job('empty')),
+        ]
+        await asyncio.gather(*futures)
+        await scheduler.close()
+
+    asyncio.run(run())
+    assert done == ['big', 'small', 'first', 'empty']
+
+
+def test_byte_budget():
+    running = []
+    max_running = []
+
+    async def transfer(budget, size):
+        async with budget.reserve(size):
+            running.append(size)
+            max_running.append(sum(running))
+            await asyncio.sleep(0.001)
+            running.remove(size)
+
+    async def run():
+        budget = ByteBudget(100)
+        await asyncio.gather(*(transfer(budget, size) for size in (60, 50, 40, 30, 250, 10)))
+        assert budget.in_flight == 0
+
+    asyncio.run(run())
+    # the transfer bigger than the budget runs alone
+    assert 250 in max_running
+    assert max(value for value in max_running if value != 250) <= 100
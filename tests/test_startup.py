@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+
+import sys
+import asyncio
+import subprocess
+
+from rcdtool.rcdtool import RCD
+from simulator import FakeTelegramClient
+
+
+def test_import_without_telethon():
+    code = 'import sys, rcdtool.main; print("telethon" in sys.modules, "readline" in sys.modules)'
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.split() == ['False', 'False']
+
+
+def test_connect_on_first_request(config_filename, use_client):
+    client = use_client(FakeTelegramClient(messages=10))
+
+    rcd_tool = RCD(config_filename)
+    assert client.starts == 0
+
+    async def request():
+        return await asyncio.gather(
+            rcd_tool.get_messages(1234, [1, 2]),
+            rcd_tool.get_messages(1234, [3]),
+        )
+
+    first, second = client.loop.run_until_complete(request())
+    assert sorted(first) == [1, 2] and list(second) == [3]
+    assert client.starts == 1
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+import os
+import time
+import asyncio
+import json
+
+import pytest
+
+from rcdtool.rcdtool import RCD
+from simulator import FakeTelegramClient
+
+
+def test_sync_moves_past_messages_without_media(tmp_path, capsys, config_filename, run_main):
+    state_filename = str(tmp_path / 'sync.json')
+    output = str(tmp_path / 'file')
+    args = ('-c', config_filename, '-C', '1234', '--sync', '--sync-state', state_filename, '-O', output,
+        '--detailed-name')
+    # only the message 250 has media, the next ones are text
+    client = FakeTelegramClient(messages=499, media_every=250, media_size=1000)
+
+    run_main(client, *args)
+
+    assert capsys.readouterr().out.split() == [f'{output}--1234-250']
+    with open(state_filename, encoding='utf-8') as file:
+        assert json.load(file) == {'-1001234': 499}
+
+    # nothing new: a single request finds it out
+    client = FakeTelegramClient(messages=499, media_every=250, media_size=1000)
+    run_main(client, *args)
+
+    assert capsys.readouterr().out.split() == []
+    assert client.requests['GetHistory'] == 1
+    assert client.requests['GetFile'] == 0
+
+    client = FakeTelegramClient(messages=520, media_every=250, media_size=1000)
+    run_main(client, *args)
+
+    assert capsys.readouterr().out.split() == [f'{output}--1234-500']
+    assert client.requests['GetHistory'] == 1
+
+
+
+def test_sync_skips_unreachable_channels(tmp_path, capsys, config_filename, run_main):
+    state_filename = str(tmp_path / 'sync.json')
+    output = str(tmp_path / 'file')
+    client = FakeTelegramClient(messages=10, media_every=5, media_size=1000, channels=[1234])
+
+    run_main(client, '-c', config_filename, '-C', '999,1234', '--sync', '--sync-state', state_filename,
+        '-O', output, '--detailed-name')
+
+    assert capsys.readouterr().out.split() == [f'{output}--1234-5', f'{output}--1234-10']
+    with open(state_filename, encoding='utf-8') as file:
+        assert json.load(file) == {'-1001234': 10}
+
+def test_sync_stops_before_a_failed_download(tmp_path, capsys, monkeypatch, config_filename, run_main):
+    state_filename = str(tmp_path / 'sync.json')
+    output = str(tmp_path / 'file')
+    client = FakeTelegramClient(messages=300, media_every=100, media_size=1000)
+    download_message_media = RCD.download_message_media
+
+    async def fail_200(self, channel_id, message_id, output_filename, stats, *args):
+        if message_id == 200:
+            stats.reason = 'broken'
+            return None
+        return await download_message_media(self, channel_id, message_id, output_filename, stats, *args)
+
+    monkeypatch.setattr(RCD, 'download_message_media', fail_200)
+    run_main(client, '-c', config_filename, '-C', '1234', '--sync', '--sync-state', state_filename, '-O', output,
+        '--detailed-name')
+
+    assert capsys.readouterr().out.split() == [f'{output}--1234-100', f'{output}--1234-300']
+    with open(state_filename, encoding='utf-8') as file:
+        assert json.load(file) == {'-1001234': 199}
+    assert os.path.exists(f'{output}--1234-300')
+
+
+def test_iter_new_messages(config_filename, use_client):
+    client = FakeTelegramClient(messages=10, media_size=1000)
+    use_client(client)
+    rcd_tool = RCD(config_filename)
+
+    async def watch():
+        subscribed = asyncio.Event()
+        new_messages = rcd_tool.iter_new_messages([-1001234], subscribed)
+        first = asyncio.ensure_future(new_messages.__anext__())
+        await subscribed.wait()
+        client.post(5678)
+        client.post(1234)
+        channel_id, message, account = await first
+        await new_messages.aclose()
+        return channel_id, message.id, account
+
+    channel_id, message_id, account = client.loop.run_until_complete(watch())
+
+    assert (channel_id, message_id) == (-1001234, 12)
+    assert account.client is client
+    assert client.handlers == []
+
+
+def test_iter_new_messages_without_channels(config_filename, use_client):
+    client = FakeTelegramClient(channels=[1234])
+    use_client(client)
+    rcd_tool = RCD(config_filename)
+
+    async def watch():
+        async for item in rcd_tool.iter_new_messages([-1005678]):
+            return item
+
+    with pytest.raises(ValueError):
+        client.loop.run_until_complete(watch())
+
+
+def is_marked(state_filename, mark):
+    """Check the saved mark of the channel 1234, after its files were printed."""
+    try:
+        with open(state_filename, encoding='utf-8') as file:
+            return json.load(file).get('-1001234') == mark
+    except FileNotFoundError:
+        return False
+
+
+def stop_when(client, condition, timeout: float = 10):
+    """Stop the CLI, like Ctrl+C, when the condition is met."""
+    async def wait():
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            await asyncio.sleep(0.005)
+        raise KeyboardInterrupt
+    return client.loop.create_task(wait())
+
+
+def test_watch_new_posts(tmp_path, capsys, config_filename, run_main):
+    state_filename = str(tmp_path / 'sync.json')
+    output = str(tmp_path / 'file')
+    client = FakeTelegramClient(messages=10, media_every=2, media_size=1000)
+    posted = []
+
+    async def post():
+        while not client.handlers:
+            await asyncio.sleep(0.005)
+        for _ in range(3):
+            posted.append(client.post(1234).id)
+
+    client.loop.create_task(post())
+    stopper = stop_when(client, lambda: is_marked(state_filename, 13))
+    run_main(client, '-c', config_filename, '-C', '1234', '--watch', '--sync-state', state_filename,
+        '-O', output, '--detailed-name')
+
+    assert isinstance(stopper.exception(), KeyboardInterrupt)
+    assert posted == [11, 12, 13]
+    assert capsys.readouterr().out.split() == [f'{output}--1234-12']
+    # the messages were not paged
+    assert client.requests['GetHistory'] == 0
+    assert client.handlers == []
+    with open(state_filename, encoding='utf-8') as file:
+        # the text message 13 moves the mark too
+        assert json.load(file) == {'-1001234': 13}
+
+
+def test_watch_skips_unreachable_channels(tmp_path, capsys, config_filename, run_main):
+    state_filename = str(tmp_path / 'sync.json')
+    output = str(tmp_path / 'file')
+    client = FakeTelegramClient(messages=10, media_every=2, media_size=1000, channels=[1234])
+
+    async def post():
+        while not client.handlers:
+            await asyncio.sleep(0.005)
+        client.post(1234)
+        client.post(1234)
+
+    client.loop.create_task(post())
+    stopper = stop_when(client, lambda: is_marked(state_filename, 12))
+    run_main(client, '-c', config_filename, '-C', '999,1234', '--watch', '--sync-state', state_filename,
+        '-O', output, '--detailed-name')
+
+    assert isinstance(stopper.exception(), KeyboardInterrupt)
+    assert capsys.readouterr().out.split() == [f'{output}--1234-12']
+
+
+def test_post_during_the_catch_up(tmp_path, capsys, config_filename, run_main):
+    state_filename = str(tmp_path / 'sync.json')
+    output = str(tmp_path / 'file')
+    client = FakeTelegramClient(messages=450, media_size=1000, latency=0.002)
+    posted = []
+
+    async def post():
+        # the last page was taken, and the catch-up is still downloading
+        while client.requests['GetHistory'] < 5:
+            await asyncio.sleep(0.001)
+        await asyncio.sleep(0.05)
+        posted.append(client.post(1234).id)
+
+    client.loop.create_task(post())
+    stopper = stop_when(client, lambda: is_marked(state_filename, 451))
+    run_main(client, '-c', config_filename, '-C', '1234', '--sync', '--watch', '--sync-state', state_filename,
+        '-O', output, '--detailed-name', '--concurrency', '1')
+
+    assert isinstance(stopper.exception(), KeyboardInterrupt)
+    assert posted == [451]
+    files = capsys.readouterr().out.split()
+    assert files == [f'{output}--1234-{message_id}' for message_id in range(1, 452)]
+    assert client.requests['GetHistory'] == 5
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+
+from rcdtool.sync import SyncState, SyncTracker
+
+
+def test_marks_move_forward(tmp_path):
+    state = SyncState(str(tmp_path / 'sync.json'))
+    assert state.get('@qwerty') == 0
+
+    state.update('@qwerty', 30)
+    state.update('Qwerty', 20)
+    state.update('@qwerty', None)
+    assert state.get('qwerty') == 30
+
+
+def test_saved_marks(tmp_path):
+    filename = str(tmp_path / 'sync.json')
+    state = SyncState(filename)
+    state.update(400300200100, 1500)
+    state.save()
+
+    assert SyncState(filename).get('400300200100') == 1500
+    assert SyncState(filename).get('@other') == 0
+
+
+def test_tracked_marks(tmp_path):
+    state = SyncState(str(tmp_path / 'sync.json'))
+    tracker = SyncTracker(state)
+
+    tracker.page('@qwerty', 100, [10, 20])
+    assert state.get('@qwerty') == 9
+    tracker.done('@qwerty', 10)
+    # an item of an album, done before its page
+    tracker.done('@qwerty', 120)
+    assert state.get('@qwerty') == 19
+    tracker.done('@qwerty', 20)
+    assert state.get('@qwerty') == 100
+
+    tracker.page('@qwerty', 200, [120, 150, 180])
+    assert state.get('@qwerty') == 149
+    tracker.done('@qwerty', 150, ok=False)
+    tracker.done('@qwerty', 180)
+    tracker.page('@qwerty', 300)
+    assert state.get('@qwerty') == 149
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+import io
+import itertools
+
+import pytest
+
+from rcdtool import main
+from rcdtool.targets import guess_format, iter_target_lines, parse_link
+
+
+def test_parse_link():
+    assert parse_link('https://t.me/c/1234/5..10') == ('1234', '5..10')
+    assert parse_link('https://t.me/channel/7?single') == ('channel', '7')
+    with pytest.raises(ValueError):
+        parse_link('1234')
+
+
+def test_guess_format():
+    assert guess_format('targets.csv') == 'csv'
+    assert guess_format('targets.JSONL') == 'jsonl'
+    assert guess_format('targets.txt') == 'text'
+    assert guess_format('-') == 'text'
+
+
+def test_text_lines():
+    file = io.StringIO(
+        '# comment\n'
+        '\n'
+        'https://t.me/c/1234/1..3 out/{message_id}.{ext}\n'
+        '@channel 5,7\n'
+        'only-a-channel\n'
+        '1234 8 out/{unknown}\n'
+    )
+    assert list(iter_target_lines(file)) == [
+        ('1234', '1..3', 'out/{message_id}.{ext}'),
+        ('@channel', '5,7', None),
+    ]
+
+
+def test_csv_lines():
+    with_header = io.StringIO('output,message,channel\nout/a,1,1234\n,2..3,1234\n')
+    assert list(iter_target_lines(with_header, 'csv')) == [
+        ('1234', '1', 'out/a'),
+        ('1234', '2..3', None),
+    ]
+    positional = io.StringIO('https://t.me/c/1234/4,out/b\n1234,5\n')
+    assert list(iter_target_lines(positional, 'csv')) == [
+        ('1234', '4', 'out/b'),
+        ('1234', '5', None),
+    ]
+
+
+def test_jsonl_lines():
+    file = io.StringIO(
+        '{"link": "https://t.me/c/1234/1", "output": "a"}\n'
+        'not json\n'
+        '[1, 2]\n'
+        '{"channel": 1234, "message": 2}\n'
+    )
+    assert list(iter_target_lines(file, 'jsonl')) == [
+        ('1234', '1', 'a'),
+        ('1234', '2', None),
+    ]
+
+
+def test_target_batches_are_grouped_by_channel():
+    lines = [(str(1 + message_id % 2), str(message_id), None) for message_id in range(250)]
+
+    batches = list(main.iter_target_batches(lines))
+
+    assert [(channel_id, len(targets)) for channel_id, targets in batches] == [
+        (-1001, 100), (-1002, 100), (-1001, 25), (-1002, 25),
+    ]
+    assert [target.message_id for target in batches[0][1][:3]] == [0, 2, 4]
+
+
+def test_target_batches_are_bounded():
+    # a different channel in each line never fills a batch
+    lines = ((str(channel_id), '1', f'out/{channel_id}') for channel_id in itertools.count(1))
+
+    channel_id, targets = next(main.iter_target_batches(lines))
+
+    assert channel_id == -1001
+    assert [(target.message_id, target.output) for target in targets] == [(1, 'out/1')]
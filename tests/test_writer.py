@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+import os
+import asyncio
+
+import pytest
+
+from rcdtool.writer import FileWriter
+
+
+PART_SIZE = 64 * 1024
+
+
+def test_coalesced_writes(tmp_path):
+    data = os.urandom(20 * PART_SIZE + 100)
+    written = []
+
+    async def run(file):
+        writer = FileWriter(file, len(data), coalesce_size=8 * PART_SIZE, on_written=lambda *offsets: written.extend(offsets))
+        for offset in range(0, len(data), PART_SIZE):
+            await writer.write(offset, data[offset:offset + PART_SIZE])
+        await writer.close()
+        return writer
+
+    filename = str(tmp_path / 'file')
+    with open(filename, 'wb') as file:
+        writer = asyncio.run(run(file))
+
+    with open(filename, 'rb') as file:
+        assert file.read() == data
+    assert sorted(written) == list(range(0, len(data), PART_SIZE))
+    assert 3 <= writer.writes < 21
+
+
+def test_bounded_buffer(tmp_path):
+    buffered = []
+
+    async def run(file):
+        writer = FileWriter(file, max_buffer=3 * PART_SIZE)
+        for offset in range(0, 50 * PART_SIZE, PART_SIZE):
+            await writer.write(offset, b'x' * PART_SIZE)
+            buffered.append(writer.buffered)
+        await writer.flush()
+        assert writer.buffered == 0
+        await writer.close()
+
+    with open(str(tmp_path / 'file'), 'wb') as file:
+        asyncio.run(run(file))
+    assert max(buffered) <= 3 * PART_SIZE
+    assert os.path.getsize(str(tmp_path / 'file')) == 50 * PART_SIZE
+
+
+def test_write_error(tmp_path):
+    async def run(file):
+        writer = FileWriter(file, fsync='end')
+        await writer.write(0, b'data')
+        await writer.close()
+
+    # a file opened for reading cannot be written
+    filename = str(tmp_path / 'file')
+    with open(filename, 'wb'):
+        pass
+    with open(filename, 'rb') as file:
+        with pytest.raises(OSError):
+            asyncio.run(run(file))
+
+
+def test_failed_close(tmp_path):
+    async def run(file):
+        writer = FileWriter(file, fsync='end')
+        await writer.write(0, b'data')
+        await writer.close(failed=True)
+        return writer
+
+    # the error of the writer does not hide the one of the download
+    filename = str(tmp_path / 'file')
+    with open(filename, 'wb'):
+        pass
+    with open(filename, 'rb') as file:
+        writer = asyncio.run(run(file))
+    assert isinstance(writer.error, OSError)
+
+
+def test_invalid_fsync(tmp_path):
+    async def run(file):
+        FileWriter(file, fsync='sometimes')
+
+    with open(str(tmp_path / 'file'), 'wb') as file:
+        with pytest.raises(ValueError):
+            asyncio.run(run(file))